@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Order, OrderItem,Address,PromoCode,Wishlist
+from .models import Order, OrderItem,Address,PromoCode,PromoRedemption,Wishlist
 
 class OrderItemInline(admin.TabularInline):  
     model = OrderItem
@@ -18,6 +18,11 @@ admin.site.register(Order, OrderAdmin)
 admin.site.register(Address)
 admin.site.register(PromoCode)
 
+@admin.register(PromoRedemption)
+class PromoRedemptionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'promo_code', 'order', 'user', 'redeemed_at')
+    list_filter = ('promo_code',)
+
 @admin.register(Wishlist)
 class WishlistAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'product', 'variant', 'added_at')
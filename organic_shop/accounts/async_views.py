@@ -0,0 +1,58 @@
+"""
+Async version of the wishlist toggle the product cards call over XHR.
+Routed instead of `accounts.views.add_to_wishlist` when settings.ASYNC_VIEWS
+is on; see `shop.async_views`.
+"""
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.shortcuts import aget_object_or_404, redirect
+
+from shop.models import Product, ProductVariant
+from .models import Wishlist
+
+
+@login_required
+async def add_to_wishlist(request, product_id):
+    user = await request.auser()
+    product = await aget_object_or_404(Product, id=product_id)
+    variant_id = request.POST.get('variant_id')
+    variant = None
+
+    if variant_id:
+        try:
+            variant = await aget_object_or_404(ProductVariant, id=variant_id, product=product)
+        except (ValueError, TypeError):
+            variant = None
+
+    wishlist_item = await Wishlist.objects.filter(
+        user=user,
+        product=product,
+        variant=variant
+    ).afirst()
+
+    if wishlist_item:
+        await wishlist_item.adelete()
+        added = False
+        message = "Removed from your wishlist."
+    else:
+        await Wishlist.objects.acreate(
+            user=user,
+            product=product,
+            variant=variant
+        )
+        added = True
+        message = "Added to your wishlist."
+
+    wishlist_count = await Wishlist.objects.filter(user=user).acount()
+
+    if request.headers.get("x-requested-with") == "XMLHttpRequest":
+        return JsonResponse({
+            "added": added,
+            "wishlist_count": wishlist_count,
+            "message": message
+        })
+
+    messages.success(request, message)
+    redirect_to = request.POST.get("next") or request.META.get("HTTP_REFERER", "/")
+    return redirect(redirect_to)
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Coalesce
+
+
+def backfill_redemptions(apps, schema_editor):
+    # Until now usage_limit was decremented per order. It is the configured
+    # limit again from here on: past uses are counted from the orders and
+    # added back to it (0 still means no limit).
+    Order = apps.get_model('accounts', 'Order')
+    PromoCode = apps.get_model('accounts', 'PromoCode')
+    PromoRedemption = apps.get_model('accounts', 'PromoRedemption')
+    orders = Order.objects.filter(promo_code__isnull=False)
+    PromoRedemption.objects.bulk_create([
+        PromoRedemption(promo_code_id=promo_code_id, order_id=order_id, user_id=user_id)
+        for order_id, promo_code_id, user_id in orders.values_list('id', 'promo_code_id', 'user_id').iterator()
+    ], batch_size=1000)
+    PromoRedemption.objects.update(redeemed_at=models.Subquery(
+        Order.objects.filter(pk=models.OuterRef('order_id')).values('created_at')[:1]
+    ))
+    PromoCode.objects.update(times_used=Coalesce(models.Subquery(
+        orders.filter(promo_code=models.OuterRef('pk')).order_by()
+        .values('promo_code').annotate(n=models.Count('pk')).values('n')[:1]
+    ), 0))
+    PromoCode.objects.exclude(usage_limit=0).update(usage_limit=F('usage_limit') + F('times_used'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_promocode_end_date_promocode_start_date_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promocode',
+            name='times_used',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='PromoRedemption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('redeemed_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='promo_redemption', to='accounts.order')),
+                ('promo_code', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='redemptions', to='accounts.promocode')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(backfill_redemptions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:51
+
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    Order = apps.get_model('accounts', 'Order')
+    OrderItem = apps.get_model('accounts', 'OrderItem')
+    ProductVariant = apps.get_model('shop', 'ProductVariant')
+
+    labels = defaultdict(list)
+    values = ProductVariant.values.through.objects.values_list(
+        'productvariant_id', 'variantvalue__option__name', 'variantvalue__value'
+    ).order_by('productvariant_id', 'variantvalue_id')
+    for variant_id, option, value in values.iterator():
+        labels[variant_id].append(f"{option}: {value}")
+
+    items = OrderItem.objects.select_related('product', 'variant')
+    totals = defaultdict(lambda: [Decimal('0.00'), 0])
+    batch = []
+    for item in items.iterator():
+        item.product_name = item.product.name if item.product else ''
+        if item.variant:
+            item.variant_label = ", ".join(labels[item.variant_id])
+            item.sku = item.variant.sku
+        batch.append(item)
+        totals[item.order_id][0] += item.price * item.quantity - item.discount
+        totals[item.order_id][1] += 1
+    OrderItem.objects.bulk_update(batch, ['product_name', 'variant_label', 'sku'], batch_size=500)
+
+    orders = []
+    for order in Order.objects.select_related('promo_code').iterator():
+        order.subtotal, order.item_count = totals.get(order.id, (Decimal('0.00'), 0))
+        if order.promo_code:
+            order.discount_amount = (
+                order.subtotal * Decimal(order.promo_code.discount_percentage) / 100
+            ).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        orders.append(order)
+    Order.objects.bulk_update(orders, ['subtotal', 'item_count', 'discount_amount'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0016_orderitem_discount'),
+        ('shop', '0030_pricerule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='discount_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='sku',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='variant_label',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User
 from shop.models import Product,ProductVariant
+from shop.pricing import promo_discount_for, unit_price
 from django.utils import timezone
+from django.utils.functional import cached_property
 from decimal import Decimal
 
 class Wishlist(models.Model):
@@ -18,12 +20,10 @@ class Wishlist(models.Model):
             return f"{self.user.username} - {self.variant}"
         return f"{self.user.username} - {self.product}"
 
-    @property
+    @cached_property
     def display_price(self):
         """Returns the correct price depending on variant or product"""
-        if self.variant:
-            return self.variant.discount_price or self.variant.price
-        return self.product.discount_price or self.product.price
+        return unit_price(self.product, self.variant)
 
     @property
     def original_price(self):
@@ -34,16 +34,12 @@ class Wishlist(models.Model):
 
     @property
     def has_discount(self):
-        if self.variant:
-            return bool(self.variant.discount_price)
-        return bool(self.product.discount_price)
+        return self.display_price < self.original_price
 
     @property
     def discount_percentage(self):
-        if self.variant and self.variant.discount_price:
-            return int(100 - (self.variant.discount_price / self.variant.price * 100))
-        elif self.product and self.product.discount_price:
-            return int(100 - (self.product.discount_price / self.product.price * 100))
+        if self.has_discount:
+            return int(100 - (self.display_price / self.original_price * 100))
         return 0
     @property
     def stock(self):
@@ -84,13 +80,15 @@ class PromoCode(models.Model):
     start_date = models.DateTimeField(default=timezone.now)
     end_date = models.DateTimeField(null=True, blank=True)
     usage_limit = models.PositiveIntegerField(default=1) 
+    # Redemptions so far, counted by accounts.promotions.redeem.
+    times_used = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.code
     @property
     def used_count(self):
-        """Counts how many orders have used this promo code."""
-        return self.order_set.count()
+        """How many orders have redeemed this promo code."""
+        return self.times_used
     
     def can_use(self):
         """Return True if promo is active and usage limit not reached"""
@@ -128,23 +126,42 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     is_paid = models.BooleanField(default=False)
+    # Stored when the order is placed (see refresh_totals) so order pages
+    # and invoices never add up the items again.
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # My orders, newest first (see my_orders_view).
+            models.Index(fields=['user', '-created_at', '-id'], name='accounts_order_user_newest'),
+            models.Index(fields=['status', '-created_at'], name='accounts_order_status'),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} - {self.user.username}"
     
     @property
     def get_item_count(self):
-        return self.items.count()
+        return self.item_count
 
     @property
     def get_subtotal(self):
-        return sum(item.total for item in self.items.all())
+        return self.subtotal
    
     @property
     def get_discount_amount(self):
-        if self.promo_code:
-            return (Decimal(self.promo_code.discount_percentage) / Decimal(100)) * self.get_subtotal
-        return Decimal('0.00')
+        return self.discount_amount
+
+    def refresh_totals(self):
+        """Recomputes and saves the stored totals from the items and promo code."""
+        lines = list(self.items.values_list('price', 'quantity', 'discount'))
+        self.subtotal = sum((price * quantity - discount for price, quantity, discount in lines), Decimal('0.00'))
+        self.item_count = len(lines)
+        self.discount_amount = promo_discount_for(self.subtotal, self.promo_code)
+        self.total_price = self.subtotal - self.discount_amount
+        self.save(update_fields=['subtotal', 'item_count', 'discount_amount', 'total_price'])
 
 
 # Order Item
@@ -154,17 +171,40 @@ class OrderItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.PositiveIntegerField(default=1)
+    # Taken off the line by price rules when the order was placed.
+    discount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # What was bought, as it was named at the time; kept if the product
+    # or variant is later renamed or deleted.
+    product_name = models.CharField(max_length=255, blank=True)
+    variant_label = models.CharField(max_length=255, blank=True)
+    sku = models.CharField(max_length=50, blank=True)
 
     def __str__(self):
-        return f"{self.quantity} x {self.product.name if self.product else 'Deleted Product'}"
+        return f"{self.quantity} x {self.product_name or 'Deleted Product'}"
+
+    def take_snapshot(self):
+        """Copies the product name, variant label and SKU onto the line."""
+        if self.product:
+            self.product_name = self.product.name
+        if self.variant:
+            self.variant_label = self.variant.label
+            self.sku = self.variant.sku
 
     @property
     def total(self):
-        return self.price * self.quantity
+        return self.price * self.quantity - self.discount
     
     @property
     def variant_display(self):
-        if self.variant:
-            return ", ".join([f"{v.option.name}: {v.value}" for v in self.variant.values.all()])
-        return ""
+        return self.variant_label
+
 
+class PromoRedemption(models.Model):
+    """One use of a promo code, written when the order using it is placed."""
+    promo_code = models.ForeignKey(PromoCode, on_delete=models.CASCADE, related_name='redemptions')
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='promo_redemption')
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    redeemed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.promo_code} on order #{self.order_id}"
@@ -0,0 +1,66 @@
+"""
+Promo code lookups and redemption.
+
+Checkout validates codes against `active_promo_codes()`, a {code: PromoCode}
+map loaded with one query and cached (see `shop.caching`) until a code is
+saved or deleted (see `shop.signals`) or PROMO_CODE_CACHE_TIMEOUT passes.
+The cached usage counts can lag, so the limit itself is enforced by
+`redeem`: one conditional UPDATE that only counts the use while
+`times_used < usage_limit`, which concurrent checkouts cannot overshoot.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from shop import caching
+
+from .models import PromoCode, PromoRedemption
+
+CACHE_KEY = 'promo-codes:active'
+DEFAULT_TIMEOUT = 5 * 60
+
+
+def _load():
+    now = timezone.now()
+    return {promo.code: promo for promo in PromoCode.objects.filter(active=True).exclude(end_date__lt=now)}
+
+
+def active_promo_codes():
+    return caching.get_or_build('promo-codes', CACHE_KEY, _load, getattr(settings, 'PROMO_CODE_CACHE_TIMEOUT', DEFAULT_TIMEOUT))
+
+
+def invalidate():
+    caching.delete(CACHE_KEY)
+
+
+def find_promo_code(code):
+    """The PromoCode for `code` if it can be used right now, else None."""
+    promo = active_promo_codes().get(code)
+    if promo is None or not promo.can_use():
+        return None
+    return promo
+
+
+def redeem(promo, order):
+    """
+    Counts one use of `promo` for `order` and records it in the ledger.
+    Returns False, counting nothing, if the code was used up, disabled or
+    expired in the meantime. Call inside the order's transaction.
+    """
+    now = timezone.now()
+    counted = (
+        PromoCode.objects.filter(pk=promo.pk, active=True, start_date__lte=now)
+        .filter(Q(end_date__isnull=True) | Q(end_date__gte=now))
+        .filter(Q(usage_limit=0) | Q(times_used__lt=F('usage_limit')))
+        .update(times_used=F('times_used') + 1)
+    )
+    if not counted:
+        # The cached copy is stale; reload it for the next checkout.
+        transaction.on_commit(invalidate)
+        return False
+    PromoRedemption.objects.create(promo_code_id=promo.pk, order=order, user_id=order.user_id)
+    if promo.usage_limit:
+        # This may have been the last use.
+        transaction.on_commit(invalidate)
+    return True
@@ -0,0 +1,35 @@
+"""
+Per-user counts shown on the profile page.
+
+`profile_counts` caches the number of orders, reviews and wishlist entries
+per user; the receivers in `shop.signals` drop the entry whenever one of
+those rows is created or deleted.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from shop.caching import get_or_build
+from shop.models import Review
+
+from .models import Order, Wishlist
+
+DEFAULT_TIMEOUT = 60 * 60
+
+
+def _key(user_id):
+    return f'profile-counts:{user_id}'
+
+
+def profile_counts(user):
+    """{'orders': n, 'reviews': n, 'wishlist': n} for `user`."""
+    # Not kept in the per-process tier: other workers would show old counts
+    # for a few seconds after an order.
+    return get_or_build('profile-counts', _key(user.pk), lambda: {
+        'orders': Order.objects.filter(user=user).count(),
+        'reviews': Review.objects.filter(user=user).count(),
+        'wishlist': Wishlist.objects.filter(user=user).count(),
+    }, getattr(settings, 'PROFILE_COUNTS_TIMEOUT', DEFAULT_TIMEOUT), local=False)
+
+
+def invalidate(user_id):
+    cache.delete(_key(user_id))
@@ -1,3 +1,77 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from .models import Order, PromoCode, PromoRedemption
+from .promotions import redeem
+
+
+class PromoRedemptionBackfillTests(TransactionTestCase):
+    before = [('accounts', '0014_promocode_end_date_promocode_start_date_and_more')]
+    after = [('accounts', '0015_promo_redemptions')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_restores_the_configured_limit(self):
+        apps = self.migrate(self.before)
+        User = apps.get_model('auth', 'User')
+        PromoCode = apps.get_model('accounts', 'PromoCode')
+        Order = apps.get_model('accounts', 'Order')
+        user = User.objects.create(username='shopper')
+        # Configured for 10 uses, 4 used: the old checkout left 6 behind.
+        limited = PromoCode.objects.create(code='TEN', discount_percentage=10, usage_limit=6)
+        unlimited = PromoCode.objects.create(code='ANY', discount_percentage=5, usage_limit=0)
+        for code, uses in ((limited, 4), (unlimited, 2)):
+            for _ in range(uses):
+                Order.objects.create(user=user, total_price=100, promo_code=code)
+
+        apps = self.migrate(self.after)
+        PromoCode = apps.get_model('accounts', 'PromoCode')
+        limited, unlimited = PromoCode.objects.get(code='TEN'), PromoCode.objects.get(code='ANY')
+        self.assertEqual((limited.usage_limit, limited.times_used), (10, 4))
+        self.assertEqual((unlimited.usage_limit, unlimited.times_used), (0, 2))
+        self.assertEqual(apps.get_model('accounts', 'PromoRedemption').objects.count(), 6)
+
+
+class RedeemTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='shopper')
+
+    def order(self, promo):
+        return Order.objects.create(user=self.user, total_price=100, promo_code=promo)
+
+    def test_stops_at_the_limit(self):
+        promo = PromoCode.objects.create(code='TWICE', discount_percentage=10, usage_limit=2)
+        self.assertEqual([redeem(promo, self.order(promo)) for _ in range(3)], [True, True, False])
+        promo.refresh_from_db()
+        self.assertEqual(promo.times_used, 2)
+        self.assertFalse(promo.can_use())
+        self.assertEqual(PromoRedemption.objects.filter(promo_code=promo).count(), 2)
+
+    def test_unlimited_code_keeps_counting(self):
+        promo = PromoCode.objects.create(code='ALWAYS', discount_percentage=5, usage_limit=0)
+        self.assertTrue(all(redeem(promo, self.order(promo)) for _ in range(5)))
+        promo.refresh_from_db()
+        self.assertEqual(promo.times_used, 5)
+        self.assertTrue(promo.can_use())
+
+    def test_expired_or_disabled_code_is_not_counted(self):
+        expired = PromoCode.objects.create(
+            code='OLD', discount_percentage=5, usage_limit=0, end_date=timezone.now() - timedelta(days=1)
+        )
+        disabled = PromoCode.objects.create(code='OFF', discount_percentage=5, usage_limit=0, active=False)
+        self.assertFalse(redeem(expired, self.order(expired)))
+        self.assertFalse(redeem(disabled, self.order(disabled)))
+        self.assertFalse(PromoRedemption.objects.exists())
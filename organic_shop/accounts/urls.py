@@ -1,9 +1,12 @@
 from django.urls import path
-from . import views
+from django.conf import settings
+from . import async_views, views
 from django.contrib.auth.views import LogoutView
 
 app_name = 'accounts'
 
+json_views = async_views if getattr(settings, 'ASYNC_VIEWS', False) else views
+
 urlpatterns = [
     path('register/', views.register_view, name='register'),
     path('login/', views.user_login, name='login'),
@@ -11,7 +14,7 @@ urlpatterns = [
     path('profile/', views.profile_view, name='profile'),
     path('profile/edit/', views.edit_profile_view, name='edit_profile'),
     path('wishlist/', views.wishlist_view, name='wishlist'),
-    path('wishlist/add/<int:product_id>/', views.add_to_wishlist, name='add_to_wishlist'),
+    path('wishlist/add/<int:product_id>/', json_views.add_to_wishlist, name='add_to_wishlist'),
     path('wishlist/remove/<int:item_id>/', views.remove_from_wishlist, name='remove_from_wishlist'),
     path('direct-checkout/<int:pk>/', views.direct_checkout, name='direct_checkout'),
     path('checkout/', views.checkout, name='checkout'),
@@ -21,6 +24,7 @@ urlpatterns = [
     path('place-order/<int:order_id>/', views.place_order, name='place_order'),
     path('orders/', views.my_orders_view, name='my_orders'),
     path('orders/<int:order_id>/', views.order_detail_view, name='order_detail'),
+    path('orders/<int:order_id>/items/', views.order_items, name='order_items'),
     path('orders/<int:order_id>/tracking/', views.order_tracking_view, name='order_tracking'),
     path('address/delete/<int:pk>/', views.delete_address, name='delete_address'),
     path('orders/<int:order_id>/invoice/', views.download_invoice, name='download_invoice'),
@@ -43,9 +43,9 @@ def generate_invoice(order):
             p.setFont("Helvetica", 12)
             y = height - 100
 
-        product_name = item.product.name if item.product else "Deleted Product"
-        if item.variant:
-            product_name += f" ({item.variant_display})"
+        product_name = item.product_name or "Deleted Product"
+        if item.variant_label:
+            product_name += f" ({item.variant_label})"
 
         p.drawString(50, y, product_name[:40])  # truncate if too long
         p.drawString(250, y, str(item.quantity))
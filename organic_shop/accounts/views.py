@@ -1,6 +1,6 @@
 from shop.models import Cart, CartItem, Product,Review,ProductVariant
 from django.shortcuts import render, redirect, get_object_or_404
-from .models import Wishlist, Address, PromoCode, Order, OrderItem
+from .models import Wishlist, Address, Order, OrderItem
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
@@ -9,28 +9,29 @@ from .forms import AddressForm,UserProfileForm
 from django.contrib import messages
 from django.utils import timezone
 from .utils import generate_invoice
+from .promotions import find_promo_code, redeem
+from .stats import profile_counts
+from shop.pricing import Item, price_items
 from django.db import transaction
+from django.db.models import Prefetch
+from django.core.paginator import Paginator
 from django.http import JsonResponse
 from django.urls import reverse
-from decimal import Decimal
 import json
 
 
-def _create_order_with_items(request, address, payment_method, items_data, subtotal, promo_code_obj):
+def _create_order_with_items(request, address, payment_method, items_data, quote, promo_code_obj):
     user = request.user
-    discount = Decimal('0.00')
-    total = subtotal
-
-    if promo_code_obj:
-        discount = (Decimal(promo_code_obj.discount_percentage) / Decimal('100')) * subtotal
-        total = subtotal - discount
 
     try:
         with transaction.atomic():
             order = Order.objects.create(
                 user=user,
                 address=address,
-                total_price=total,
+                total_price=quote.total,
+                subtotal=quote.subtotal,
+                discount_amount=quote.promo_discount,
+                item_count=len(quote.lines),
                 payment_method=payment_method,
                 promo_code=promo_code_obj
             )
@@ -49,13 +50,16 @@ def _create_order_with_items(request, address, payment_method, items_data, subto
                     messages.error(request, f"Sorry, '{item_info['product'].name}' went out of stock while you were checking out.")
                     raise ValueError("Insufficient stock")
 
-                OrderItem.objects.create(
+                order_item = OrderItem(
                     order=order,
                     product=item_info['product'],
                     variant=variant,
                     price=item_info['price'],
-                    quantity=item_info['quantity']
+                    quantity=item_info['quantity'],
+                    discount=item_info['discount']
                 )
+                order_item.take_snapshot()
+                order_item.save()
 
                 if variant:
                     variant_to_check.stock -= item_info['quantity']
@@ -66,11 +70,9 @@ def _create_order_with_items(request, address, payment_method, items_data, subto
                     product_to_check.sold_count += item_info['quantity']
                     product_to_check.save()
 
-            if promo_code_obj:
-                promo_code_obj.usage_limit -= 1
-                if promo_code_obj.usage_limit <= 0:
-                    promo_code_obj.active = False
-                promo_code_obj.save()
+            if promo_code_obj and not redeem(promo_code_obj, order):
+                messages.error(request, f"Sorry, the promo code '{promo_code_obj.code}' is no longer available.")
+                raise ValueError("Promo code used up")
 
         return order
 
@@ -108,28 +110,29 @@ def register_view(request):
         return redirect('accounts:profile')
     return render(request, 'accounts/register.html', {'form': form})
 
+PROFILE_REVIEWS = 5
+PROFILE_WISHLIST = 6
+ORDERS_PER_PAGE = 10
+
+
 @login_required
 def profile_view(request):
     user = request.user
-    cart = Cart.objects.filter(user=user).first()
     addresses = Address.objects.filter(user=user)
-    cart_items = cart.items.select_related('product') if cart else []
-    total_price = sum(item.total_price for item in cart_items)
-    wishlist = Wishlist.objects.filter(user=user).select_related('product', 'variant')    
-    reviews = Review.objects.filter(user=user).select_related('product').order_by('-created_at')
-    orders = Order.objects.filter(user=user).order_by('-created_at')
+    # Only the latest few; the counts come from the cache.
+    wishlist = (
+        Wishlist.objects.filter(user=user).select_related('product', 'variant')
+        .prefetch_related('variant__values__option').order_by('-added_at')[:PROFILE_WISHLIST]
+    )
+    reviews = Review.objects.filter(user=user).select_related('product').order_by('-created_at')[:PROFILE_REVIEWS]
 
-    
     return render(request, 'accounts/profile.html', {
-        'cart_items': cart_items,
-        'total_price': total_price,
         'reviews': reviews, 
         'addresses': addresses,
         'wishlist': wishlist,
-        'orders': orders,
+        'counts': profile_counts(user),
     })
 
-
 @login_required
 def edit_profile_view(request):
     user = request.user
@@ -216,8 +219,6 @@ def checkout(request):
     direct_data = request.session.get('direct_checkout')
     applied_promo_code_str = request.session.get('applied_promo_code')
     addresses = Address.objects.filter(user=user)
-    items_data = []
-    subtotal = Decimal('0.00')
 
     if direct_data:
         # --- Direct Checkout Flow ---
@@ -227,21 +228,7 @@ def checkout(request):
             variant_sku = direct_data.get('variant_id') # Changed from 'sku' to 'id' for reliability
             if variant_sku:
                 variant = get_object_or_404(ProductVariant, sku=variant_sku, product=product)
-
-            price = (variant.discount_price if variant and variant.discount_price else
-                     variant.price if variant else
-                     product.discount_price if product.discount_price else
-                     product.price)
-            
-            quantity = direct_data['quantity']
-            items_data.append({
-                'product': product,
-                'variant': variant,
-                'quantity': quantity,
-                'price': price,
-                'total_price': price * quantity
-            })
-            subtotal = price * quantity
+            items = [Item(product, variant, direct_data['quantity'])]
         except (Product.DoesNotExist, ProductVariant.DoesNotExist):
             messages.error(request, "The product you were trying to buy is no longer available.")
             request.session.pop('direct_checkout', None)
@@ -249,32 +236,30 @@ def checkout(request):
     else:
         # --- Cart Checkout Flow ---
         cart = Cart.objects.filter(user=user).first()
-        if not cart or not cart.items.exists():
+        items = cart.priced_items if cart else []
+        if not items:
             messages.warning(request, "Your cart is empty.")
             return redirect('shop:index')
 
-        for item in cart.items.all():
-            price = item.get_price() 
-            items_data.append({
-                'product': item.product,
-                'variant': item.variant,
-                'quantity': item.quantity,
-                'price': price,
-                'total_price': item.total_price 
-            })
-        subtotal = cart.total_price
-
     # ----- 2. HANDLE PROMO CODES -----
     promo_code_obj = None
     if applied_promo_code_str:
-        try:
-            promo_code_obj = PromoCode.objects.get(code=applied_promo_code_str, active=True)
-        except PromoCode.DoesNotExist:
+        promo_code_obj = find_promo_code(applied_promo_code_str)
+        if promo_code_obj is None:
             messages.error(request, "The applied promo code is not valid.")
             request.session.pop('applied_promo_code', None)
 
-    discount_display = (Decimal(promo_code_obj.discount_percentage) / Decimal('100')) * subtotal if promo_code_obj else Decimal('0.00')
-    total_display = subtotal - discount_display
+    # ----- 3. PRICE EVERYTHING IN ONE PASS -----
+    quote = price_items(items, promo_code_obj)
+    items_data = [{
+        'product': line.product,
+        'variant': line.variant,
+        'quantity': line.quantity,
+        'price': line.unit_price,
+        'discount': line.discount,
+        'total_price': line.total,
+        'rule': line.rule,
+    } for line in quote.lines]
 
     if request.method == 'POST':
         if 'apply_promo' in request.POST:
@@ -298,7 +283,7 @@ def checkout(request):
                 address=address,
                 payment_method=payment_method,
                 items_data=items_data,
-                subtotal=subtotal,
+                quote=quote,
                 promo_code_obj=promo_code_obj
             )
 
@@ -316,10 +301,10 @@ def checkout(request):
     context = {
         'addresses': addresses,
         'products': items_data,
-        'cart_items_count': sum(item['quantity'] for item in items_data),
-        'subtotal': subtotal,
-        'discount': discount_display,
-        'total': total_display,
+        'cart_items_count': quote.item_count,
+        'subtotal': quote.subtotal,
+        'discount': quote.promo_discount,
+        'total': quote.total,
         'is_direct_checkout': bool(direct_data),
         'applied_promo_code': applied_promo_code_str if promo_code_obj else None
     }
@@ -406,8 +391,21 @@ def delete_address(request, pk):
 
 @login_required
 def my_orders_view(request):
-    orders = Order.objects.filter(user=request.user).order_by('-created_at').prefetch_related('items__product')
-    return render(request, 'accounts/my_orders.html', {'orders': orders})
+    # Summary columns only; each order's lines load on demand (order_items).
+    orders = (
+        Order.objects.filter(user=request.user)
+        .only('id', 'created_at', 'status', 'is_paid', 'total_price', 'item_count')
+        .order_by('-created_at', '-id')
+    )
+    paginator = Paginator(orders, ORDERS_PER_PAGE)
+    return render(request, 'accounts/my_orders.html', {'orders': paginator.get_page(request.GET.get('page'))})
+
+
+@login_required
+def order_items(request, order_id):
+    """The lines of one order, as an HTML fragment for My orders."""
+    order = get_object_or_404(Order.objects.only('id', 'user_id'), id=order_id, user=request.user)
+    return render(request, 'accounts/partials/order_items.html', {'items': order.items.all()})
 
 
 
@@ -415,13 +413,13 @@ def my_orders_view(request):
 def order_detail_view(request, order_id):
     order = get_object_or_404(
         Order.objects.select_related('address', 'promo_code')
-                     .prefetch_related('items__product'),
+                     .prefetch_related('items'),
         id=order_id,
         user=request.user
     )
 
-    subtotal = sum(item.price * item.quantity for item in order.items.all())
-    discount = (Decimal(order.promo_code.discount_percentage) / Decimal('100')) * subtotal if order.promo_code else Decimal('0')
+    subtotal = order.get_subtotal
+    discount = order.get_discount_amount
     total = order.total_price
 
     return render(request, 'accounts/order_detail.html', {
@@ -449,18 +447,14 @@ def place_order(request, order_id):
 def order_summary(request, order_id):
     order = get_object_or_404(
         Order.objects.select_related('address', 'promo_code')
-                     .prefetch_related('items__product', 'items__variant'),
+                     .prefetch_related(Prefetch('items', queryset=OrderItem.objects.select_related('product'))),
         id=order_id,
         user=request.user
     )
 
     items = order.items.all()
-    subtotal = sum(item.price * item.quantity for item in items)
-    discount = Decimal('0.00')
-
-    if order.promo_code:
-        discount = (Decimal(order.promo_code.discount_percentage) / Decimal('100')) * subtotal
-
+    subtotal = order.get_subtotal
+    discount = order.get_discount_amount
     total = order.total_price
 
     return render(request, 'accounts/order_summary.html', {
@@ -474,5 +468,5 @@ def order_summary(request, order_id):
 
 @login_required
 def download_invoice(request, order_id):
-    order = get_object_or_404(Order, id=order_id, user=request.user)
+    order = get_object_or_404(Order.objects.select_related('user', 'promo_code').prefetch_related('items'), id=order_id, user=request.user)
     return generate_invoice(order)
@@ -41,5 +41,6 @@ urlpatterns = [
     path("categories/<int:pk>/delete/", views.category_delete, name="category_delete"),
 
     path('customers/', views.customer_list, name="customer_list"),
+    path('cache-metrics/', views.cache_metrics, name="cache_metrics"),
     path("profile/", views.profile_view, name="profile"),
 ]
\ No newline at end of file
@@ -1,3 +1,5 @@
+import os
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
 from django.views.decorators.http import require_POST
@@ -11,6 +13,8 @@ from django.db.models.functions import Coalesce
 from django.db.models import Count, Sum, Value
 from django.db.models.fields import DecimalField
 from django.contrib.auth.decorators import login_required 
+from django.http import JsonResponse
+from shop.caching import metrics
 
 
 @login_required
@@ -122,7 +126,7 @@ def order_list(request):
     return render(request, 'dashboard/orders/order_list.html', {'orders': orders})
 
 def order_detail(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
+    order = get_object_or_404(Order.objects.select_related('user', 'address', 'promo_code').prefetch_related('items'), id=order_id)
 
     return render(request, 'dashboard/orders/order_detail.html', {
         'order': order,
@@ -134,6 +138,8 @@ def order_edit(request, order_id):
         form = OrderForm(request.POST, instance=order)
         if form.is_valid():
             form.save()
+            if 'promo_code' in form.changed_data:
+                order.refresh_totals()
             messages.success(request, "Order updated successfully.")
             return redirect("dashboard:order_list")
     else:
@@ -291,4 +297,9 @@ def product_form(request, pk=None):
         "form": form,
         "formset": formset,
         "title": "Edit Product" if pk else "Add Product",
-    })
\ No newline at end of file
+    })
+
+@staff_member_required
+def cache_metrics(request):
+    """Cache hits and misses per namespace, as counted by the process serving this request."""
+    return JsonResponse({'pid': os.getpid(), 'namespaces': metrics()})
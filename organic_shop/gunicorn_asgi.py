@@ -0,0 +1,27 @@
+"""
+ASGI deployment profile:
+
+    gunicorn -c gunicorn_asgi.py organic_shop.asgi:application
+
+Needs `gunicorn` and `uvicorn` installed. Each worker runs one event loop;
+the async JSON endpoints share it, while the regular page views still run in
+Django's thread pool, so a few workers per host are enough.
+
+With PRELOAD=1 the application is loaded once in the master before the
+workers fork; add WARM_CACHES_ON_STARTUP=1 to warm the caches there too
+(see shop/warmup.py).
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+worker_class = 'uvicorn.workers.UvicornWorker'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+keepalive = 5
+timeout = 30
+graceful_timeout = 30
+max_requests = 2000
+max_requests_jitter = 200
+preload_app = os.environ.get('PRELOAD') == '1'
+
+raw_env = ['ASYNC_VIEWS=1']
@@ -2,6 +2,8 @@
 ASGI config for organic_shop project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Served this way, the JSON endpoints use their async views (ASYNC_VIEWS);
+gunicorn_asgi.py is the matching gunicorn + uvicorn worker configuration.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -12,5 +14,10 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'organic_shop.settings')
+os.environ.setdefault('ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
+
+from shop.warmup import warm_on_startup  # noqa: E402
+
+warm_on_startup()
@@ -10,12 +10,30 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
+def env(name, default=None):
+    return os.environ.get(name, default)
+
+
+def env_bool(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
@@ -46,6 +64,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'shop.middleware.StaticAssetMiddleware',
+    'shop.middleware.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -77,14 +97,139 @@ WSGI_APPLICATION = 'organic_shop.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+#
+# SQLite (db.sqlite3) is the default, and `manage.py test` uses it unless told
+# otherwise. Set DB_ENGINE=postgresql to run on PostgreSQL:
+#
+#   DB_NAME / DB_USER / DB_PASSWORD / DB_HOST / DB_PORT   connection details
+#   DB_CONN_MAX_AGE        seconds to keep a connection open (default 60)
+#   DB_CONN_HEALTH_CHECKS  ping reused connections before use (default on)
+#   DB_POOL                use psycopg's connection pool instead (default off)
+#   DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE / DB_POOL_TIMEOUT
+#
+# A throwaway local server for development or tests:
+#
+#   docker run --rm -p 5432:5432 -e POSTGRES_PASSWORD=postgres postgres:16
+#   pip install "psycopg[binary,pool]"
+#   DB_ENGINE=postgresql DB_USER=postgres DB_PASSWORD=postgres python manage.py test
+
+DB_ENGINE = env('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': env('DB_NAME', 'organic_shop'),
+            'USER': env('DB_USER', 'postgres'),
+            'PASSWORD': env('DB_PASSWORD', ''),
+            'HOST': env('DB_HOST', 'localhost'),
+            'PORT': env('DB_PORT', '5432'),
+            'CONN_MAX_AGE': env_int('DB_CONN_MAX_AGE', 60),
+            'CONN_HEALTH_CHECKS': env_bool('DB_CONN_HEALTH_CHECKS', True),
+            'OPTIONS': {
+                'application_name': 'organic_shop',
+            },
+        }
+    }
+    if env_bool('DB_POOL'):
+        # Pooled connections are returned to the pool at the end of each
+        # request, which Django requires to be expressed as CONN_MAX_AGE = 0.
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': env_int('DB_POOL_MIN_SIZE', 2),
+            'max_size': env_int('DB_POOL_MAX_SIZE', 10),
+            'timeout': env_int('DB_POOL_TIMEOUT', 10),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': env('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # Take the write lock when a transaction starts instead of
+                # failing to upgrade a read lock halfway through checkout.
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
 
-DATABASES = {
+# Read replicas for catalog browsing (see shop/routers.py). Each entry in
+# DB_REPLICAS becomes an alias `replica_1`, `replica_2`, ...: a host name
+# for PostgreSQL (same credentials as the primary) or a file path for SQLite.
+# Locally, two SQLite files stand in for primary and replica:
+#
+#   DB_REPLICAS=replica.sqlite3 python manage.py sync_sqlite_replica
+#   DB_REPLICAS=replica.sqlite3 python manage.py runserver
+#
+# In tests every replica mirrors 'default', so no extra database is created.
+REPLICA_DATABASES = []
+for index, replica in enumerate(filter(None, env('DB_REPLICAS', '').split(',')), start=1):
+    alias = f'replica_{index}'
+    DATABASES[alias] = dict(DATABASES['default'], OPTIONS=dict(DATABASES['default'].get('OPTIONS', {})))
+    if DB_ENGINE == 'postgresql':
+        DATABASES[alias]['HOST'] = replica.strip()
+    else:
+        DATABASES[alias]['NAME'] = BASE_DIR / replica.strip()
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['shop.routers.CatalogReplicaRouter']
+
+# After a POST, reads stay on the primary for this many seconds.
+REPLICA_PIN_SECONDS = env_int('REPLICA_PIN_SECONDS', 5)
+
+# Pragmas applied to every SQLite connection (see shop/db.py): WAL so the
+# view counter no longer blocks readers, busy_timeout so writers queue.
+# Entries here override shop.db.DEFAULT_PRAGMAS; SQLITE_TUNING=0 disables it.
+SQLITE_TUNING = env_bool('SQLITE_TUNING', True)
+SQLITE_PRAGMAS = {}
+SQLITE_OPTIMIZE_INTERVAL = env_int('SQLITE_OPTIMIZE_INTERVAL', 60 * 60)
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+#
+# Both caches must be shared by every worker on the host. The file cache does
+# that without extra services; point CACHE_BACKEND/LOCATION and
+# SESSION_CACHE_BACKEND/LOCATION at memcached or redis when running more
+# than one host. The file cache's add() and incr() are not atomic, so
+# shop.caching locks builds with lock files in its directory and
+# shop.invalidation never increments. shop.caching keeps a small
+# per-process LRU in front of 'default' (CACHE_LOCAL_*).
+CACHE_BACKEND = env('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache')
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': env('CACHE_LOCATION', str(BASE_DIR / 'var' / 'cache' / 'default')),
+    },
+    'sessions': {
+        'BACKEND': env('SESSION_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': env('SESSION_CACHE_LOCATION', str(BASE_DIR / 'var' / 'cache' / 'sessions')),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 200000,
+        },
+    },
 }
 
+if CACHE_BACKEND.endswith('FileBasedCache'):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': env_int('CACHE_MAX_ENTRIES', 50000)}
+
+CACHE_LOCAL_TIMEOUT = env_int('CACHE_LOCAL_TIMEOUT', 5)
+CACHE_LOCAL_MAX_ENTRIES = env_int('CACHE_LOCAL_MAX_ENTRIES', 1000)
+
+# Warm the caches when a server process starts (see shop/warmup.py).
+WARM_CACHES_ON_STARTUP = env_bool('WARM_CACHES_ON_STARTUP', False)
+WARM_CACHES_TOP = env_int('WARM_CACHES_TOP', 20)
+
+
+# Sessions
+# Cache-first sessions; only carts and logins are also written to the
+# django_session table (see shop/sessions.py).
+
+SESSION_ENGINE = 'shop.sessions'
+SESSION_CACHE_ALIAS = 'sessions'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -125,6 +270,27 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'shop' / 'static']
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# collectstatic fingerprints every asset and writes .gz/.br siblings;
+# templates resolve the hashed names from the in-memory manifest.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'shop.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Serve STATIC_ROOT from Django (with far-future caching) when no web server
+# is in front of it. runserver keeps serving from the app directories in DEBUG.
+SERVE_STATIC = not DEBUG
+
+# Route the JSON endpoints (search, variant lookup, cart and wishlist XHR) to
+# their native async views. asgi.py turns this on; under WSGI the sync views
+# are cheaper because async views would each need their own event loop.
+ASYNC_VIEWS = env_bool('ASYNC_VIEWS', False)
 LOGIN_URL = 'accounts:login'
 
 
@@ -136,3 +302,18 @@ LOGIN_URL = 'accounts:login'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Tests
+# `manage.py test` creates its own in-memory database; pointing the alias at
+# one too, and the caches at process-local memory, keeps the test run away
+# from db.sqlite3 and var/cache.
+
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+if TESTING:
+    if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+        DATABASES['default']['NAME'] = ':memory:'
+    CACHES = {
+        alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'test-{alias}'}
+        for alias in CACHES
+    }
@@ -0,0 +1,42 @@
+"""
+Production settings: everything in settings.py, with DEBUG off and the
+template loaders fixed for a long-running process.
+
+    DJANGO_SETTINGS_MODULE=organic_shop.settings_production
+
+Templates are found through the cached loader only: each one (including
+the partials a page includes) is read and compiled once per process and
+never checked against the disk again. Restart the workers after deploying
+template changes. `manage.py bench_templates` measures what rendering
+still costs.
+"""
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import TEMPLATES, env, env_bool
+
+# Checked here: an unset key would otherwise only fail on the first
+# request that signs a session or a CSRF token.
+SECRET_KEY = env('SECRET_KEY')
+if not SECRET_KEY:
+    raise ImproperlyConfigured("Set the SECRET_KEY environment variable.")
+DEBUG = False
+ALLOWED_HOSTS = [host.strip() for host in env('ALLOWED_HOSTS', '').split(',') if host.strip()]
+
+SERVE_STATIC = env_bool('SERVE_STATIC', True)
+
+TEMPLATES = [{
+    **TEMPLATES[0],
+    # 'loaders' replaces APP_DIRS; the app directories loader is in it.
+    'APP_DIRS': False,
+    'OPTIONS': {
+        **TEMPLATES[0]['OPTIONS'],
+        'debug': False,
+        'loaders': [
+            ('django.template.loaders.cached.Loader', [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ]),
+        ],
+    },
+}]
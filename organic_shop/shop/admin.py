@@ -7,7 +7,9 @@ from .models import (
     CartItem,
     VariantValue,
     VariantOption,
-    ProductVariant
+    ProductVariant,
+    PriceRule,
+    Job
 )
 
 # Inline for multiple images in Product
@@ -66,4 +68,20 @@ class ProductVariantAdmin(admin.ModelAdmin):
     list_display = ['product', 'sku', 'price', 'stock']
     list_editable = ['price', 'stock']
     filter_horizontal = ['values']
-    readonly_fields = ['sku']
\ No newline at end of file
+    readonly_fields = ['sku']
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'key', 'status', 'attempts', 'run_after', 'updated_at']
+    list_filter = ['status', 'kind']
+    search_fields = ['key']
+    readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(PriceRule)
+class PriceRuleAdmin(admin.ModelAdmin):
+    list_display = ['name', 'kind', 'product', 'category', 'percent_off', 'min_quantity', 'starts_at', 'ends_at', 'active']
+    list_filter = ['kind', 'active']
+    list_editable = ['active']
+    raw_id_fields = ['product']
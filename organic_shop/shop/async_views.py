@@ -0,0 +1,92 @@
+"""
+Async versions of the JSON endpoints the storefront scripts call most
+(live search, variant lookup, cart quantity updates).
+
+They return exactly what the views in `shop.views` return, but use the
+async ORM and cache so an ASGI worker serves many of them concurrently
+instead of holding a thread per request (pricing, which may load the
+rules, runs in a thread). `shop.urls` routes to them when
+settings.ASYNC_VIEWS is on, which the ASGI entry point enables. The live
+stock stream (`product_events`) only exists here.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404
+from django.views.decorators.http import require_POST
+
+from . import events
+from .images import arendition_url
+from .models import CartItem, Product
+from .pricing import Item, price_items, unit_price
+from .routers import read_only_view
+from .views import (
+    NO_IMAGE_URL, matching_variants, product_payload, search_products, search_result, variant_payload,
+)
+
+
+async def ajax_search(request):
+    query = request.GET.get('q', '')
+    results = []
+    if query:
+        products = [product async for product in search_products(query)]
+        quote = await sync_to_async(price_items)([Item(product, None, 1) for product in products])
+        for product, line in zip(products, quote.lines):
+            image_url = await arendition_url(product.image, 'card') if product.image else NO_IMAGE_URL
+            results.append(search_result(product, image_url, line.total))
+    return JsonResponse({'results': results})
+
+
+@read_only_view
+@require_POST
+async def get_matching_variant(request):
+    try:
+        data = json.loads(request.body)
+        selected_values = data.get("selected_values", [])
+        product = await aget_object_or_404(Product, id=data.get("product_id"))
+
+        if not await product.variants.aexists():
+            price = await sync_to_async(unit_price)(product)
+            return JsonResponse(product_payload(product, await arendition_url(product.image, 'detail'), price))
+
+        variant = await matching_variants(product, selected_values).afirst()
+        if not variant:
+            return JsonResponse({"success": False, "message": "This combination is not available."})
+
+        image_url = await arendition_url(variant.image, 'detail') or await arendition_url(product.image, 'detail')
+        price = await sync_to_async(unit_price)(product, variant)
+        return JsonResponse(variant_payload(variant, image_url, price))
+
+    except Exception:
+        return JsonResponse({"success": False, "message": "An unexpected error occurred."})
+
+
+@require_POST
+@login_required
+async def update_cart_item_ajax(request):
+    try:
+        data = json.loads(request.body)
+        quantity = int(data.get("quantity"))
+        user = await request.auser()
+        item = await aget_object_or_404(CartItem, id=data.get("item_id"), cart__user=user)
+
+        if quantity > 0:
+            item.quantity = quantity
+            await item.asave()
+        else:
+            await item.adelete()
+
+        return JsonResponse({"success": True})
+    except Exception as e:
+        return JsonResponse({"success": False, "error": str(e)})
+
+
+async def product_events(request, product_id):
+    """Server-sent stock and price updates for one product page."""
+    response = StreamingHttpResponse(events.stream(product_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stops nginx from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,287 @@
+"""
+Two-tier caching for values that are expensive to build.
+
+`get_or_build` looks in a small per-process LRU first, then in the shared
+cache (CACHES['default'], which every worker sees), and only builds the
+value when both miss. Local entries live for CACHE_LOCAL_TIMEOUT seconds
+at most, so a key that is deleted rather than versioned (see
+`shop.invalidation`) can be served stale by other workers for that long;
+pass `local=False` where that matters.
+
+Stampedes are avoided two ways:
+
+* Single flight: one builder per key. Threads of a process queue on a lock;
+  processes race for a lock (`acquire_lock`), and the losers wait for the
+  winner's value (up to CACHE_LOCK_WAIT seconds) instead of building it
+  too. The lock is an `add()`-ed key in the shared cache, except with the
+  file cache: its add() checks then writes, so two processes could both
+  get the key. There the lock is a file created with O_EXCL in the cache
+  directory instead, which only one process can create.
+* Probabilistic early refresh: each entry records how long it took to
+  build, and a read shortly before it expires may decide to rebuild it
+  while everyone else still gets the current value. The closer the expiry
+  and the slower the build, the likelier (CACHE_EARLY_REFRESH_BETA scales
+  it; 0 turns it off).
+
+Every read is counted per namespace; `metrics()` reports the counts for
+this process.
+"""
+import functools
+import hashlib
+import math
+import os
+import random
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.filebased import FileBasedCache
+
+DEFAULT_LOCAL_TIMEOUT = 5
+DEFAULT_LOCAL_MAX_ENTRIES = 1000
+DEFAULT_LOCK_TIMEOUT = 30
+DEFAULT_LOCK_WAIT = 5
+POLL_INTERVAL = 0.05
+
+EVENTS = ('local_hits', 'hits', 'misses', 'early_refreshes', 'waits')
+
+_counts = {event: Counter() for event in EVENTS}
+_counts_lock = threading.Lock()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _count(event, namespace):
+    with _counts_lock:
+        _counts[event][namespace] += 1
+
+
+class LocalCache:
+    """A bounded LRU of (value, expires_at), shared by the threads of one process."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + timeout)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_local = LocalCache(_setting('CACHE_LOCAL_MAX_ENTRIES', DEFAULT_LOCAL_MAX_ENTRIES))
+
+_key_locks = {}
+_key_locks_guard = threading.Lock()
+
+
+class _KeyLock:
+    """One lock per key while anyone holds or waits for it."""
+
+    def __init__(self, key):
+        self.key = key
+
+    def __enter__(self):
+        with _key_locks_guard:
+            lock, users = _key_locks.get(self.key, (None, 0))
+            if lock is None:
+                lock = threading.Lock()
+            _key_locks[self.key] = (lock, users + 1)
+        lock.acquire()
+        self.lock = lock
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
+        with _key_locks_guard:
+            lock, users = _key_locks[self.key]
+            if users == 1:
+                del _key_locks[self.key]
+            else:
+                _key_locks[self.key] = (lock, users - 1)
+
+
+def _lock_file(lock_key):
+    """The lock file for `lock_key` if the default cache is the file cache, else None."""
+    backend = caches['default']
+    if not isinstance(backend, FileBasedCache):
+        return None
+    return os.path.join(backend._dir, 'locks', hashlib.md5(lock_key.encode()).hexdigest() + '.lock')
+
+
+def acquire_lock(lock_key, timeout):
+    """
+    True if this process got `lock_key`, which no other process can get
+    until `release_lock` or until `timeout` seconds have passed.
+    """
+    path = _lock_file(lock_key)
+    if path is None:
+        return cache.add(lock_key, 1, timeout)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    for _ in range(2):
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) < timeout:
+                    return False
+                # Left behind by a builder that died: take over.
+                os.remove(path)
+            except FileNotFoundError:
+                # Released meanwhile.
+                pass
+    return False
+
+
+def release_lock(lock_key):
+    path = _lock_file(lock_key)
+    if path is None:
+        cache.delete(lock_key)
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _should_refresh_early(expires_at, build_seconds):
+    beta = _setting('CACHE_EARLY_REFRESH_BETA', 1.0)
+    if not beta:
+        return False
+    # 1 - random() is in (0, 1], so the log is finite and never positive.
+    return time.time() - build_seconds * beta * math.log(1 - random.random()) >= expires_at
+
+
+def _build_and_store(key, build, timeout, use_local):
+    started = time.perf_counter()
+    value = build()
+    build_seconds = time.perf_counter() - started
+    cache.set(key, (value, time.time() + timeout, build_seconds), timeout)
+    if use_local:
+        _local.set(key, value, min(timeout, _setting('CACHE_LOCAL_TIMEOUT', DEFAULT_LOCAL_TIMEOUT)))
+    return value
+
+
+def _remember_locally(key, value, expires_at, use_local):
+    if use_local:
+        ttl = min(expires_at - time.time(), _setting('CACHE_LOCAL_TIMEOUT', DEFAULT_LOCAL_TIMEOUT))
+        if ttl > 0:
+            _local.set(key, value, ttl)
+
+
+def get_or_build(namespace, key, build, timeout, local=True):
+    """
+    The value cached under `key`, building it with `build()` and storing
+    it for `timeout` seconds on a miss. `namespace` only groups the counts.
+    """
+    if local:
+        entry = _local.get(key)
+        if entry is not None:
+            _count('local_hits', namespace)
+            return entry[0]
+
+    envelope = cache.get(key)
+    if envelope is not None:
+        value, expires_at, build_seconds = envelope
+        if not _should_refresh_early(expires_at, build_seconds):
+            _count('hits', namespace)
+            _remember_locally(key, value, expires_at, local)
+            return value
+        # Rebuild ahead of expiry, unless someone already is: then the
+        # current value is still good.
+        if not acquire_lock(f'{key}:lock', _setting('CACHE_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT)):
+            _count('hits', namespace)
+            return value
+        _count('early_refreshes', namespace)
+        try:
+            return _build_and_store(key, build, timeout, local)
+        finally:
+            release_lock(f'{key}:lock')
+
+    _count('misses', namespace)
+    with _KeyLock(key):
+        # Another thread of this process may have built it meanwhile.
+        envelope = cache.get(key)
+        if envelope is not None:
+            _remember_locally(key, envelope[0], envelope[1], local)
+            return envelope[0]
+        lock_key = f'{key}:lock'
+        if not acquire_lock(lock_key, _setting('CACHE_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT)):
+            # Another process is building it: wait for its value.
+            _count('waits', namespace)
+            deadline = time.monotonic() + _setting('CACHE_LOCK_WAIT', DEFAULT_LOCK_WAIT)
+            while time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                envelope = cache.get(key)
+                if envelope is not None:
+                    _remember_locally(key, envelope[0], envelope[1], local)
+                    return envelope[0]
+            # The builder is stuck or gone; build it here after all.
+            return _build_and_store(key, build, timeout, local)
+        try:
+            return _build_and_store(key, build, timeout, local)
+        finally:
+            release_lock(lock_key)
+
+
+def delete(key):
+    """Drops `key` from the shared cache and this process's local tier."""
+    _local.delete(key)
+    cache.delete(key)
+
+
+def cached(namespace, timeout, key, local=True):
+    """
+    Decorator for view helpers: caches the helper's return value under
+    `key(*args, **kwargs)`, e.g.
+
+        @cached('home-rails', 300, key=lambda: make_key('home-rails', depends_on=['catalog']))
+        def home_rails(): ...
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return get_or_build(
+                namespace, key(*args, **kwargs), lambda: func(*args, **kwargs), timeout, local=local
+            )
+        return wrapper
+    return decorator
+
+
+def metrics():
+    """{namespace: {event: count, ..., 'hit_rate'}} since this process started."""
+    with _counts_lock:
+        namespaces = sorted(set().union(*_counts.values()))
+        report = {}
+        for namespace in namespaces:
+            counts = {event: _counts[event][namespace] for event in EVENTS}
+            hits = counts['local_hits'] + counts['hits']
+            counts['hit_rate'] = hits / (hits + counts['misses'] + counts['early_refreshes'])
+            report[namespace] = counts
+        return report
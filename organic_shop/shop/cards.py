@@ -0,0 +1,38 @@
+"""
+Product cards.
+
+The card templates used to ask each product for `has_variants`,
+`get_default_variant` and `display_price`, a query or two per card.
+`prepare_cards` works all of that out in one pass instead (variants must be
+prefetched, most stock first) and sets on every product:
+
+* default_variant: the variant the card shows, or None;
+* card_stock: stock of that variant, or of the product;
+* card_price / card_original_price: one unit with price rules applied, and
+  before any discount;
+* card_discount: the saving in percent, 0 if none;
+* card_image: the variant's image, else the product's.
+
+Used for every product card: home page shelves, category listings and the
+related products on a product page.
+"""
+from .pricing import Item, price_items
+
+
+def prepare_cards(products):
+    """Prepares `products` for the card templates and returns them as a list."""
+    products = list(products)
+    for product in products:
+        variants = product.variants.all()
+        product.default_variant = variants[0] if variants else None
+    quote = price_items([Item(product, product.default_variant, 1) for product in products])
+    for product, line in zip(products, quote.lines):
+        variant = product.default_variant
+        product.card_stock = variant.stock if variant is not None else product.stock
+        product.card_image = variant.image if variant is not None and variant.image else product.image
+        product.card_price = line.total
+        product.card_original_price = line.original_price
+        product.card_discount = (
+            int(100 - line.total / line.original_price * 100) if line.total < line.original_price else 0
+        )
+    return products
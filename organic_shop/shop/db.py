@@ -0,0 +1,81 @@
+"""
+SQLite tuning applied to every new connection.
+
+Out of the box SQLite uses a rollback journal, so any writer (even the
+product view counter) blocks every reader, and concurrent writers give up
+with "database is locked". With WAL, readers never wait for the writer, and
+busy_timeout makes writers queue instead of failing. The pragmas come from
+settings.SQLITE_PRAGMAS and are skipped entirely for other backends.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 128 * 1024 * 1024,
+    'cache_size': -20000,  # negative = KiB, so ~20 MB per connection
+    'temp_store': 'MEMORY',
+    'wal_autocheckpoint': 1000,
+}
+
+_optimize_lock = threading.Lock()
+_last_optimize = None
+
+
+def sqlite_pragmas():
+    pragmas = dict(DEFAULT_PRAGMAS)
+    pragmas.update(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    return pragmas
+
+
+def apply_pragmas(cursor, pragmas):
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """connection_created receiver: tunes SQLite connections."""
+    if connection.vendor != 'sqlite' or not getattr(settings, 'SQLITE_TUNING', True):
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, sqlite_pragmas())
+        _maybe_optimize(cursor)
+
+
+def _maybe_optimize(cursor):
+    """
+    Runs `PRAGMA optimize` at most once per SQLITE_OPTIMIZE_INTERVAL seconds
+    per process. Connections are opened per request, so this piggybacks on
+    normal traffic instead of needing a scheduler.
+    """
+    global _last_optimize
+    interval = getattr(settings, 'SQLITE_OPTIMIZE_INTERVAL', 60 * 60)
+    if not interval:
+        return
+    now = time.monotonic()
+    if _last_optimize is not None and now - _last_optimize < interval:
+        return
+    if not _optimize_lock.acquire(blocking=False):
+        return
+    try:
+        # 0x10002: also analyse tables that have never been analysed.
+        cursor.execute('PRAGMA optimize = 0x10002')
+        _last_optimize = now
+    finally:
+        _optimize_lock.release()
+
+
+def run_maintenance(connection):
+    """
+    `PRAGMA optimize` plus a truncating WAL checkpoint, for cron via
+    `manage.py sqlite_maintenance`. Returns the checkpoint result
+    (busy, wal pages, checkpointed pages).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA optimize')
+        cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return cursor.fetchone()
@@ -0,0 +1,187 @@
+"""
+Live stock and price updates for product pages.
+
+Saving a ProductVariant (or a Product without variants) publishes its stock
+and prices, once the transaction commits, to an in-process pub/sub. Each
+open product page holds a server-sent events stream (`product_events` in
+`shop.async_views`) subscribed to its product. A subscriber is just a dict
+of pending updates and an asyncio.Event on the worker's event loop, so idle
+connections cost no thread and almost no memory; several saves of the same
+variant between two sends collapse into the latest one.
+
+Nothing is priced or published while a product has no subscribers in this
+process, so saves under WSGI (or at checkout) cost nothing extra.
+
+Saves made in other processes (other workers, the admin, management
+commands) are not seen by this pub/sub. While a product has subscribers,
+one task re-reads it every EVENTS_RESYNC_SECONDS and publishes what
+changed to all of them, so the database load grows with the number of
+products being watched, not with the number of open pages.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import Product
+from .pricing import Item, price_items, unit_price
+
+HEARTBEAT_SECONDS = 15
+DEFAULT_RESYNC_SECONDS = 30
+
+_subscribers = defaultdict(set)
+# product_id -> the task resyncing it while it has subscribers.
+_resyncs = {}
+_lock = threading.Lock()
+
+
+class Subscription:
+
+    def __init__(self, product_id):
+        self.product_id = product_id
+        self.loop = asyncio.get_running_loop()
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def push(self, payload):
+        # Runs on self.loop; newer updates for a variant replace older ones.
+        self.pending[payload['variant_id']] = payload
+        self.ready.set()
+
+    async def get(self, timeout):
+        """Waits up to `timeout` seconds and returns the pending updates."""
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self.ready.clear()
+        updates, self.pending = list(self.pending.values()), {}
+        return updates
+
+
+def subscribe(product_id):
+    """Subscribes the running event loop to a product's updates."""
+    subscription = Subscription(product_id)
+    resync = getattr(settings, 'EVENTS_RESYNC_SECONDS', DEFAULT_RESYNC_SECONDS)
+    with _lock:
+        _subscribers[product_id].add(subscription)
+        if resync and product_id not in _resyncs:
+            _resyncs[product_id] = subscription.loop.create_task(_resync(product_id, resync))
+    return subscription
+
+
+def unsubscribe(subscription):
+    with _lock:
+        subscribers = _subscribers.get(subscription.product_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del _subscribers[subscription.product_id]
+
+
+def subscriber_count(product_id=None):
+    with _lock:
+        if product_id is not None:
+            return len(_subscribers.get(product_id, ()))
+        return sum(len(subscribers) for subscribers in _subscribers.values())
+
+
+def publish(product_id, payload):
+    """Hands `payload` to every subscriber of `product_id`; safe from any thread."""
+    with _lock:
+        subscribers = list(_subscribers.get(product_id, ()))
+    for subscription in subscribers:
+        try:
+            subscription.loop.call_soon_threadsafe(subscription.push, payload)
+        except RuntimeError:
+            # The loop has shut down; the stream's cleanup will unsubscribe it.
+            pass
+
+
+def publish_stock(product, variant=None):
+    """Publishes the stock and unit price of `variant` (or of `product` without variants), if anyone listens."""
+    if not subscriber_count(product.id):
+        return
+    source = variant or product
+    event = stock_event(variant.id if variant else None, source.stock, source.price, unit_price(product, variant))
+    publish(product.id, event)
+
+
+def stock_event(variant_id, stock, original_price, price):
+    """`price` is one unit as `shop.pricing` charges it, price rules included."""
+    return {
+        'variant_id': variant_id,
+        'stock': stock,
+        'price': f'{original_price:.2f}',
+        'discount_price': f'{price:.2f}' if price < original_price else None,
+    }
+
+
+def _current_state(product_id):
+    product = Product.objects.prefetch_related('variants').filter(pk=product_id).first()
+    if product is None:
+        return {}
+    items = [Item(product, variant, 1) for variant in product.variants.all()] or [Item(product, None, 1)]
+    state = {}
+    for line in price_items(items).lines:
+        source = line.variant or product
+        variant_id = line.variant.id if line.variant else None
+        state[variant_id] = stock_event(variant_id, source.stock, line.original_price, line.total)
+    return state
+
+
+async def current_state(product_id):
+    """{variant_id: event} for a product as stored now (variant_id None without variants)."""
+    # Pricing may load the rules, so it runs in a thread.
+    return await sync_to_async(_current_state)(product_id)
+
+
+async def _resync(product_id, interval):
+    """Publishes what changed in the database, every `interval` seconds until nobody listens."""
+    known = {}
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            with _lock:
+                if not _subscribers.get(product_id):
+                    del _resyncs[product_id]
+                    return
+            fresh = await current_state(product_id)
+            for key, event in fresh.items():
+                if known.get(key) != event:
+                    publish(product_id, event)
+            known = fresh
+    finally:
+        # Cancelled or failed: let the next subscriber start a new one.
+        with _lock:
+            if _resyncs.get(product_id) is asyncio.current_task():
+                del _resyncs[product_id]
+
+
+async def stream(product_id):
+    """Yields the text/event-stream body for one product page."""
+    subscription = subscribe(product_id)
+    try:
+        # Browsers reconnect after this many milliseconds if the stream drops.
+        yield 'retry: 5000\n\n'
+        # Current values first: they may have changed since the page rendered.
+        known = await current_state(product_id)
+        for event in known.values():
+            yield f'event: stock\ndata: {json.dumps(event)}\n\n'
+        while True:
+            updates = await subscription.get(HEARTBEAT_SECONDS)
+            sent = False
+            for event in updates:
+                if known.get(event['variant_id']) == event:
+                    continue
+                known[event['variant_id']] = event
+                yield f'event: stock\ndata: {json.dumps(event)}\n\n'
+                sent = True
+            if not sent:
+                # Keeps proxies from closing an idle connection.
+                yield ': keepalive\n\n'
+    finally:
+        unsubscribe(subscription)
@@ -0,0 +1,367 @@
+"""
+Resized derivatives of uploaded catalog images.
+
+Every source image gets a fixed set of renditions (card, detail, zoom) in
+WebP and JPEG. They live under ``MEDIA_ROOT/derivatives/`` in a directory
+keyed by the source file name, and each file name carries a hash of the
+source content so the URLs can be cached forever. A small ``manifest.json``
+next to them records what was generated; templates only ever read the
+manifest (through the cache), never the image itself.
+
+Uploads themselves are never rewritten. When one needs its EXIF orientation
+applied, its metadata dropped or its size capped, a normalised copy is written
+into the derivative directory and the renditions are rendered from that.
+
+Processing runs in the `run_jobs` worker: saving a model with a new upload
+queues an `images.process` job, and pages keep serving the original file
+until the manifest appears. A source whose job has failed for good is not
+queued again from page views; `backfill_image_derivatives` retries it.
+"""
+import hashlib
+import io
+import json
+import math
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .jobs import enqueue, handler
+from .models import Job
+
+# Target widths in pixels. Sources are never upscaled.
+RENDITIONS = {
+    'card': 320,
+    'detail': 800,
+    'zoom': 1600,
+}
+
+# Matching `sizes` hints for the srcset emitted with each rendition.
+RENDITION_SIZES = {
+    'card': '(max-width: 576px) 50vw, 320px',
+    'detail': '(max-width: 768px) 100vw, 50vw',
+    'zoom': '100vw',
+}
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Uploads larger than this on either side are scaled down before rendering.
+MAX_SOURCE_DIMENSION = 2400
+
+DERIVATIVE_ROOT = 'derivatives'
+MANIFEST_CACHE_TIMEOUT = 60 * 60 * 24
+MISSING_CACHE_TIMEOUT = 60
+ENQUEUE_DEBOUNCE = 5 * 60
+
+_MISSING = 'missing'
+
+
+def _source_key(name):
+    return hashlib.sha1(name.encode('utf-8')).hexdigest()[:20]
+
+
+def derivative_dir(name):
+    key = _source_key(name)
+    return f'{DERIVATIVE_ROOT}/{key[:2]}/{key}'
+
+
+def manifest_name(name):
+    return f'{derivative_dir(name)}/manifest.json'
+
+
+def _manifest_cache_key(name):
+    return f'image-manifest:{_source_key(name)}'
+
+
+def load_manifest(name, storage=default_storage):
+    """Returns the derivative manifest for a source file name, or None."""
+    key = _manifest_cache_key(name)
+    manifest = cache.get(key)
+    if manifest is None:
+        try:
+            with storage.open(manifest_name(name)) as fh:
+                manifest = json.load(fh)
+        except (FileNotFoundError, ValueError):
+            cache.set(key, _MISSING, MISSING_CACHE_TIMEOUT)
+            return None
+        cache.set(key, manifest, MANIFEST_CACHE_TIMEOUT)
+    return None if manifest == _MISSING else manifest
+
+
+def _encode(image, fmt):
+    pil_format, options = FORMATS[fmt]
+    if fmt == 'jpeg' and image.mode != 'RGB':
+        # JPEG has no alpha channel; flatten onto white like a browser would.
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def normalized_name(name, digest, pil_format):
+    extension = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}[pil_format]
+    return f'{derivative_dir(name)}/source-{digest}.{extension}'
+
+
+def normalize_source(name, storage=default_storage):
+    """
+    Applies the EXIF orientation, drops EXIF/GPS metadata and caps the pixel
+    size of an upload, writing the result next to its derivatives. Returns
+    the name to render from: `name` itself if the upload is already clean,
+    otherwise the normalised copy. The upload is left untouched, and a copy
+    that already exists for the same content is reused.
+    """
+    with storage.open(name, 'rb') as fh:
+        data = fh.read()
+    image = Image.open(io.BytesIO(data))
+    image.load()
+
+    pil_format = image.format
+    has_metadata = bool(image.getexif()) or 'exif' in image.info
+    oversized = max(image.size) > MAX_SOURCE_DIMENSION
+    if not (has_metadata or oversized) or pil_format not in ('JPEG', 'PNG', 'WEBP'):
+        return name
+    target = normalized_name(name, hashlib.sha256(data).hexdigest()[:16], pil_format)
+    if storage.exists(target):
+        return target
+
+    image = ImageOps.exif_transpose(image)
+    if oversized:
+        image.thumbnail((MAX_SOURCE_DIMENSION, MAX_SOURCE_DIMENSION), Image.LANCZOS)
+
+    options = {'JPEG': {'quality': 90, 'optimize': True}, 'PNG': {'optimize': True}, 'WEBP': {'quality': 90}}
+    if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options[pil_format])
+
+    storage.save(target, ContentFile(buffer.getvalue()))
+    return target
+
+
+_BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+
+def _base83(value, length):
+    return ''.join(_BASE83[(value // 83 ** (length - i - 1)) % 83] for i in range(length))
+
+
+def _srgb_to_linear(value):
+    v = value / 255
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value):
+    v = max(0.0, min(1.0, value))
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash(image, x_components=4, y_components=3):
+    """
+    Encodes a BlurHash (https://blurha.sh) placeholder for `image`.
+    Computed on a 32px thumbnail, so the cost is independent of the upload.
+    """
+    small = image.convert('RGB')
+    small.thumbnail((32, 32))
+    width, height = small.size
+    pixels = [tuple(_srgb_to_linear(c) for c in px) for px in small.getdata()]
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            normalisation = 1 if i == 0 and j == 0 else 2
+            r = g = b = 0.0
+            for y in range(height):
+                cos_y = math.cos(math.pi * j * y / height)
+                row = y * width
+                for x in range(width):
+                    basis = normalisation * math.cos(math.pi * i * x / width) * cos_y
+                    pr, pg, pb = pixels[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = 1 / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = _base83((x_components - 1) + (y_components - 1) * 9, 1)
+    if ac:
+        quantised_max = max(0, min(82, int(max(abs(c) for f in ac for c in f) * 166 - 0.5)))
+        max_value = (quantised_max + 1) / 166
+        result += _base83(quantised_max, 1)
+    else:
+        max_value = 1
+        result += _base83(0, 1)
+
+    result += _base83((_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4)
+
+    def quantise(value):
+        signed = math.copysign(abs(value / max_value) ** 0.5, value)
+        return max(0, min(18, int(signed * 9 + 9.5)))
+
+    for r, g, b in ac:
+        result += _base83(quantise(r) * 19 * 19 + quantise(g) * 19 + quantise(b), 2)
+    return result
+
+
+def generate_derivatives(name, storage=default_storage, force=False, source_name=None):
+    """
+    Renders every rendition of `name` in every format and writes the manifest.
+    The pixels come from `source_name` (see `normalize_source`) if given.
+    Returns the manifest.
+    """
+    with storage.open(source_name or name, 'rb') as fh:
+        data = fh.read()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+
+    manifest = load_manifest(name, storage)
+    if manifest and manifest['digest'] == digest and not force:
+        return manifest
+
+    source = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    source = source.convert('RGBA' if 'A' in source.getbands() or source.mode == 'P' else 'RGB')
+    directory = derivative_dir(name)
+
+    renditions = {}
+    for rendition, target_width in RENDITIONS.items():
+        width = min(target_width, source.width)
+        height = max(1, round(source.height * width / source.width))
+        resized = source if width == source.width else source.resize((width, height), Image.LANCZOS)
+
+        files = {}
+        for fmt in FORMATS:
+            path = f'{directory}/{rendition}-{digest}.{"jpg" if fmt == "jpeg" else fmt}'
+            if force and storage.exists(path):
+                storage.delete(path)
+            if not storage.exists(path):
+                storage.save(path, ContentFile(_encode(resized, fmt)))
+            files[fmt] = path
+        renditions[rendition] = {'width': width, 'height': height, 'files': files}
+
+    average = source.convert('RGB').resize((1, 1), Image.BOX).getpixel((0, 0))
+    manifest = {
+        'source': name,
+        'digest': digest,
+        'width': source.width,
+        'height': source.height,
+        'renditions': renditions,
+        'blurhash': blurhash(source),
+        'color': '#{:02x}{:02x}{:02x}'.format(*average),
+    }
+    path = manifest_name(name)
+    if storage.exists(path):
+        storage.delete(path)
+    storage.save(path, ContentFile(json.dumps(manifest).encode('utf-8')))
+    cache.set(_manifest_cache_key(name), manifest, MANIFEST_CACHE_TIMEOUT)
+    return manifest
+
+
+@handler('images.process')
+def process_image(name):
+    """Job handler: normalise an upload, then render its derivatives."""
+    return generate_derivatives(name, source_name=normalize_source(name))
+
+
+def queue_processing(fieldfile):
+    """Queues derivative generation for an image field value if it is missing."""
+    if not fieldfile or not fieldfile.name:
+        return
+    if load_manifest(fieldfile.name, fieldfile.storage) is not None:
+        return
+    # Pages call this on every render while the job is pending; the cache
+    # flag keeps that from turning into an INSERT attempt per image per view.
+    if not cache.add(f'image-queued:{_source_key(fieldfile.name)}', 1, ENQUEUE_DEBOUNCE):
+        return
+    # A source that failed every attempt (unreadable, not an image) would
+    # fail again; it stays on the original until a backfill retries it.
+    if Job.objects.filter(kind='images.process', key=fieldfile.name, status='failed').exists():
+        return
+    enqueue('images.process', key=fieldfile.name, name=fieldfile.name)
+
+
+def ensure_derivatives(fieldfile):
+    """Generates derivatives for an image field value unless they exist."""
+    if not fieldfile or not fieldfile.name:
+        return None
+    manifest = load_manifest(fieldfile.name, fieldfile.storage)
+    if manifest is None:
+        try:
+            manifest = generate_derivatives(fieldfile.name, fieldfile.storage)
+        except (OSError, ValueError):
+            # Missing or unreadable source: keep serving whatever is there.
+            return None
+    return manifest
+
+
+def get_manifest(fieldfile):
+    """
+    The manifest for an image field value, or None if it is not ready yet.
+
+    With IMAGE_DERIVATIVES_ASYNC (the default) a missing manifest queues a
+    job and the caller falls back to the original; otherwise the derivatives
+    are rendered inline.
+    """
+    if not fieldfile or not fieldfile.name:
+        return None
+    if not getattr(settings, 'IMAGE_DERIVATIVES_ASYNC', True):
+        return ensure_derivatives(fieldfile)
+    manifest = load_manifest(fieldfile.name, fieldfile.storage)
+    if manifest is None:
+        queue_processing(fieldfile)
+    return manifest
+
+
+def rendition_url(fieldfile, rendition, fmt='jpeg'):
+    """URL of one rendition, falling back to the original upload."""
+    if not fieldfile or not fieldfile.name:
+        return ''
+    manifest = get_manifest(fieldfile)
+    if manifest is None:
+        return fieldfile.url
+    return fieldfile.storage.url(manifest['renditions'][rendition]['files'][fmt])
+
+
+async def arendition_url(fieldfile, rendition, fmt='jpeg'):
+    """
+    `rendition_url` for async views: a cached manifest is read without
+    leaving the event loop, anything else goes through the sync path.
+    """
+    if not fieldfile or not fieldfile.name:
+        return ''
+    manifest = await cache.aget(_manifest_cache_key(fieldfile.name))
+    if manifest is None or manifest == _MISSING:
+        return await sync_to_async(rendition_url)(fieldfile, rendition, fmt)
+    return fieldfile.storage.url(manifest['renditions'][rendition]['files'][fmt])
+
+
+def srcset(manifest, fmt, storage=default_storage):
+    """`srcset` value listing every distinct rendition width of a manifest."""
+    seen = set()
+    entries = []
+    for rendition in sorted(manifest['renditions'].values(), key=lambda r: r['width']):
+        if rendition['width'] in seen:
+            continue
+        seen.add(rendition['width'])
+        entries.append(f"{storage.url(rendition['files'][fmt])} {rendition['width']}w")
+    return ', '.join(entries)
+
+
+def source_image_fields():
+    """(model, field name) pairs whose uploads get derivatives."""
+    from .models import Category, Product, ProductImage, ProductVariant
+    return [
+        (Product, 'image'),
+        (ProductImage, 'image'),
+        (ProductVariant, 'image'),
+        (Category, 'image'),
+    ]
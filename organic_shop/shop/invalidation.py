@@ -0,0 +1,81 @@
+"""
+Versioned cache keys for everything cached from the catalog.
+
+Cached entries are never deleted. Their keys carry the versions of what
+they were built from, and a change moves those versions on, so outdated
+entries are simply never read again and expire:
+
+    key = make_key('product-page', product.id,
+                   depends_on=[('product', product.id), ('category', product.category_id)])
+    page = get_or_build('product-page', key, build, timeout)   # shop.caching
+
+There is a version per product, per category, and one for each named
+scope: 'catalog' for anything listing products from across the store,
+'pricing-rules' for the compiled price rules.
+
+Versions are clock stamps and a bump writes a new one rather than
+incrementing: incr() is not atomic on every backend (the file cache reads
+then writes), and two bumps incrementing at once could both store the
+same number, which an entry built between them was already keyed on.
+
+`shop.signals` reports saves and deletes (including the admin's
+list_editable, which saves row by row) and changes to a variant's option
+values. Writes that send no signals (`QuerySet.update`, `bulk_create`,
+`bulk_update`, raw SQL) must report themselves by calling
+`products_changed` / `categories_changed` with the ids they touched.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _version_key(scope):
+    if isinstance(scope, tuple):
+        return 'version:{}:{}'.format(*scope)
+    return f'version:{scope}'
+
+
+def versions(scopes):
+    """The current version of each scope: a name or a (kind, pk) pair."""
+    keys = [_version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _stamp(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def version(scope):
+    return versions([scope])[0]
+
+
+def _stamp(current=None):
+    # Clock based, so a version lost to eviction never restarts at a number
+    # an old entry was stored under; and always past `current`, even if the
+    # clock went back.
+    stamp = time.time_ns()
+    return stamp if current is None or stamp > current else current + 1
+
+
+def bump(*scopes):
+    keys = [_version_key(scope) for scope in scopes]
+    current = cache.get_many(keys)
+    cache.set_many({key: _stamp(current.get(key)) for key in keys}, None)
+
+
+def make_key(name, *parts, depends_on=()):
+    """A cache key for `name` and `parts` that changes whenever a scope in `depends_on` is bumped."""
+    stamp = '.'.join(str(v) for v in versions(depends_on))
+    return ':'.join([name, *(str(part) for part in parts), stamp])
+
+
+def products_changed(*product_ids):
+    """Call after writing products (or their variants, images, reviews) without signals."""
+    transaction.on_commit(lambda: bump(*(('product', pk) for pk in product_ids), 'catalog'))
+
+
+def categories_changed(*category_ids):
+    transaction.on_commit(lambda: bump(*(('category', pk) for pk in category_ids), 'catalog'))
+
@@ -0,0 +1,140 @@
+"""
+A small database-backed job queue.
+
+Work that should not run inside a request (image processing and the like)
+is registered with `@handler('kind')` and queued with `enqueue()`. The
+`run_jobs` management command claims pending rows one at a time and calls
+the matching handler. Claiming is a conditional UPDATE, so several workers
+can share the table safely on SQLite and PostgreSQL alike.
+"""
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 10  # seconds, doubled after every failed attempt
+STALE_AFTER = timedelta(minutes=15)
+KEEP_FINISHED = timedelta(days=7)
+
+_handlers = {}
+
+
+def handler(kind):
+    """Registers `func(**payload)` as the handler for jobs of `kind`."""
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, key='', delay=0, **payload):
+    """
+    Queues a job to run `delay` seconds from now at the earliest. If a
+    pending job with the same kind and key already exists, nothing is added
+    and None is returned.
+    """
+    try:
+        with transaction.atomic():
+            return Job.objects.create(
+                kind=kind, key=key, payload=payload, run_after=timezone.now() + timedelta(seconds=delay)
+            )
+    except IntegrityError:
+        return None
+
+
+def claim_next():
+    """Marks the oldest runnable job as running and returns it, or None."""
+    while True:
+        candidate = (
+            Job.objects.filter(status='pending', run_after__lte=timezone.now())
+            .order_by('run_after', 'id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if candidate is None:
+            return None
+        claimed = Job.objects.filter(id=candidate, status='pending').update(
+            status='running', updated_at=timezone.now()
+        )
+        if claimed:
+            return Job.objects.get(id=candidate)
+        # Another worker took it between the SELECT and the UPDATE.
+
+
+def run_job(job):
+    func = _handlers.get(job.kind)
+    job.attempts += 1
+    try:
+        if func is None:
+            raise LookupError(f"No handler registered for {job.kind!r}")
+        func(**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        logger.exception("Job %s (%s) failed", job.id, job.kind)
+        if job.attempts < MAX_ATTEMPTS and func is not None:
+            job.status = 'pending'
+            job.run_after = timezone.now() + timedelta(seconds=RETRY_BASE_DELAY * 2 ** (job.attempts - 1))
+        else:
+            job.status = 'failed'
+    else:
+        job.status = 'done'
+        job.last_error = ''
+
+    try:
+        job.save(update_fields=['status', 'attempts', 'last_error', 'run_after', 'updated_at'])
+    except IntegrityError:
+        # A fresh job for the same key was queued while this one ran; it
+        # supersedes the retry.
+        Job.objects.filter(id=job.id).update(status='failed', attempts=job.attempts, last_error=job.last_error)
+    return job
+
+
+def requeue_stale():
+    """Puts back jobs left 'running' by a worker that died mid-job."""
+    stale = Job.objects.filter(status='running', updated_at__lt=timezone.now() - STALE_AFTER)
+    requeued = 0
+    for job in stale:
+        try:
+            with transaction.atomic():
+                requeued += Job.objects.filter(id=job.id, status='running').update(status='pending')
+        except IntegrityError:
+            Job.objects.filter(id=job.id).update(status='failed')
+    return requeued
+
+
+def prune_finished():
+    """Deletes completed jobs older than KEEP_FINISHED so the table stays small."""
+    deleted, _ = Job.objects.filter(status='done', updated_at__lt=timezone.now() - KEEP_FINISHED).delete()
+    return deleted
+
+
+def run_pending(limit=None):
+    """Runs runnable jobs until the queue is empty or `limit` is reached."""
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_next()
+        if job is None:
+            break
+        run_job(job)
+        processed += 1
+    return processed
+
+
+def work(interval=2.0, once=False):
+    """Worker loop used by `manage.py run_jobs`."""
+    requeue_stale()
+    prune_finished()
+    while True:
+        processed = run_pending()
+        if once:
+            return processed
+        if not processed:
+            time.sleep(interval)
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from shop.images import generate_derivatives, load_manifest, normalize_source, source_image_fields
+from shop.jobs import enqueue
+
+
+class Command(BaseCommand):
+    help = "Normalises every existing catalog image and generates its card/detail/zoom derivatives."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Regenerate derivatives that already exist.")
+        parser.add_argument('--queue', action='store_true', help="Queue jobs for the run_jobs worker instead of processing inline.")
+
+    def handle(self, *args, **options):
+        seen = set()
+        processed = failed = 0
+
+        for model, field in source_image_fields():
+            for obj in model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).only('pk', field):
+                fieldfile = getattr(obj, field)
+                if fieldfile.name in seen:
+                    continue
+                seen.add(fieldfile.name)
+                if not options['force'] and load_manifest(fieldfile.name, fieldfile.storage) is not None:
+                    continue
+
+                if options['queue']:
+                    enqueue('images.process', key=fieldfile.name, name=fieldfile.name)
+                    processed += 1
+                    continue
+
+                try:
+                    source_name = normalize_source(fieldfile.name, fieldfile.storage)
+                    generate_derivatives(
+                        fieldfile.name, fieldfile.storage, force=options['force'], source_name=source_name
+                    )
+                    processed += 1
+                except (OSError, ValueError) as exc:
+                    failed += 1
+                    self.stderr.write(f"{fieldfile.name}: {exc}")
+
+        verb = "Queued" if options['queue'] else "Processed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {processed} image(s), {failed} failed."))
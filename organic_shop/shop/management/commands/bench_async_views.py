@@ -0,0 +1,113 @@
+import asyncio
+import importlib
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+from django.urls import clear_url_caches
+
+from shop.models import Product
+
+URLCONF_MODULES = ('shop.urls', 'accounts.urls', 'organic_shop.urls')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares concurrent throughput of the search and variant lookup endpoints "
+        "served by the sync views (WSGI, a fixed pool of worker threads) and the "
+        "async views (ASGI, one event loop)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help="Requests in flight at once.")
+        parser.add_argument('--threads', type=int, default=8,
+                            help="WSGI worker threads, i.e. how many of those requests are actually served.")
+
+    def handle(self, *args, **options):
+        product = Product.objects.filter(available=True, variants__isnull=False).distinct().first()
+        if product is None:
+            self.stderr.write("Needs an available product with variants.")
+            return
+        calls = [
+            ('get', '/ajax/search/', {'q': product.name[:2]}),
+            ('post', '/get-matching-variant/', {'product_id': product.id, 'selected_values': []}),
+        ]
+
+        self.stdout.write(
+            f"{options['requests']} requests per endpoint, {options['concurrency']} in flight, "
+            f"{options['threads']} WSGI threads\n"
+        )
+        self.stdout.write(f"{'endpoint':<24}{'server':<8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+        for method, path, data in calls:
+            for label, runner in (('wsgi', self.run_wsgi), ('asgi', self.run_asgi)):
+                with self.json_views(label == 'asgi'):
+                    elapsed, latencies = runner(method, path, data, options)
+                self.stdout.write(
+                    f"{path:<24}{label:<8}{len(latencies) / elapsed:>10.0f}"
+                    f"{statistics.median(latencies) * 1000:>10.1f}"
+                    f"{statistics.quantiles(latencies, n=100)[98] * 1000:>10.1f}"
+                )
+
+    @contextmanager
+    def json_views(self, use_async):
+        try:
+            with override_settings(ASYNC_VIEWS=use_async, ALLOWED_HOSTS=['*']):
+                self.reload_urls()
+                yield
+        finally:
+            self.reload_urls()
+
+    def reload_urls(self):
+        for name in URLCONF_MODULES:
+            importlib.reload(importlib.import_module(name))
+        clear_url_caches()
+
+    def request_kwargs(self, method, data):
+        if method == 'post':
+            return {'data': json.dumps(data), 'content_type': 'application/json'}
+        return {'data': data}
+
+    def run_wsgi(self, method, path, data, options):
+        kwargs = self.request_kwargs(method, data)
+        # Only `threads` requests are served at a time; the rest wait for a
+        # free worker thread, and that wait counts towards their latency.
+        workers = threading.BoundedSemaphore(options['threads'])
+
+        def one(_):
+            started = time.perf_counter()
+            with workers:
+                response = getattr(Client(), method)(path, **kwargs)
+            assert response.status_code == 200, response.status_code
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            latencies = list(pool.map(one, range(options['requests'])))
+        return time.perf_counter() - started, latencies
+
+    def run_asgi(self, method, path, data, options):
+        kwargs = self.request_kwargs(method, data)
+
+        async def main():
+            semaphore = asyncio.Semaphore(options['concurrency'])
+            client = AsyncClient()
+
+            async def one():
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await getattr(client, method)(path, **kwargs)
+                    assert response.status_code == 200, response.status_code
+                    return time.perf_counter() - started
+
+            started = time.perf_counter()
+            latencies = await asyncio.gather(*(one() for _ in range(options['requests'])))
+            return time.perf_counter() - started, latencies
+
+        return asyncio.run(main())
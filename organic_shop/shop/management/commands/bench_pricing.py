@@ -0,0 +1,109 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop.models import PriceRule, Product
+from shop.pricing import Item, RuleSet, money, price_items
+
+
+class Command(BaseCommand):
+    help = (
+        "Microbenchmark of shop.pricing on large synthetic carts: the compiled "
+        "RuleSet against checking every rule for every line. Uses no database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=500, help="Lines per cart.")
+        parser.add_argument('--rules', type=int, default=200)
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--categories', type=int, default=40)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        now = timezone.now()
+        products = [
+            Product(id=i, category_id=rng.randrange(options['categories']),
+                    price=Decimal(rng.randrange(100, 10000)) / 100)
+            for i in range(options['products'])
+        ]
+        rules = [self.random_rule(i, rng, now, options) for i in range(options['rules'])]
+        items = [
+            Item(rng.choice(products), None, rng.randint(1, 12))
+            for _ in range(options['lines'])
+        ]
+
+        started = time.perf_counter()
+        ruleset = RuleSet(rules, now)
+        compile_ms = (time.perf_counter() - started) * 1000
+
+        compiled = self.measure(lambda: price_items(items, ruleset=ruleset), options['repeat'])
+        naive = self.measure(lambda: self.naive_total(items, rules, now), options['repeat'])
+        assert price_items(items, ruleset=ruleset).subtotal == self.naive_total(items, rules, now)
+
+        self.stdout.write(
+            f"{options['lines']} lines, {options['rules']} rules "
+            f"({len(ruleset.storewide)} storewide), compiled in {compile_ms:.1f} ms\n"
+        )
+        self.stdout.write(f"{'':<12}{'p50 ms':>10}{'p99 ms':>10}{'us/line':>10}")
+        for label, timings in (('compiled', compiled), ('naive', naive)):
+            p50 = statistics.median(timings)
+            p99 = statistics.quantiles(timings, n=100)[98] if len(timings) > 1 else p50
+            self.stdout.write(
+                f"{label:<12}{p50 * 1000:>10.2f}{p99 * 1000:>10.2f}{p50 * 1e6 / options['lines']:>10.1f}"
+            )
+
+    def random_rule(self, pk, rng, now, options):
+        scope = rng.random()
+        rule = PriceRule(
+            id=pk, name=f'rule {pk}',
+            kind=PriceRule.BUY_X_GET_Y if rng.random() < 0.2 else PriceRule.PERCENT_OFF,
+            percent_off=Decimal(rng.randrange(5, 40)),
+            min_quantity=rng.choice([1, 1, 3, 5, 10]),
+            buy_quantity=rng.randint(1, 3), free_quantity=1,
+            starts_at=now - timedelta(days=1),
+            ends_at=now + timedelta(days=rng.randint(1, 30)),
+        )
+        if scope < 0.5:
+            rule.product_id = rng.randrange(options['products'])
+        elif scope < 0.95:
+            rule.category_id = rng.randrange(options['categories'])
+        return rule
+
+    def naive_total(self, items, rules, now):
+        """The straightforward version: every rule re-checked for every line."""
+        total = Decimal('0.00')
+        for item in items:
+            product = item.product
+            unit = product.discount_price or product.price
+            best = Decimal('0.00')
+            for rule in rules:
+                if not rule.active or rule.starts_at > now or (rule.ends_at and rule.ends_at <= now):
+                    continue
+                if rule.product_id and rule.product_id != product.id:
+                    continue
+                if rule.category_id and rule.category_id != product.category_id:
+                    continue
+                if item.quantity < max(rule.min_quantity, 1):
+                    continue
+                if rule.kind == PriceRule.BUY_X_GET_Y:
+                    discount = unit * (item.quantity // (rule.buy_quantity + rule.free_quantity) * rule.free_quantity)
+                else:
+                    discount = money(unit * item.quantity * Decimal(rule.percent_off) / 100)
+                best = max(best, discount)
+            total += unit * item.quantity - best
+        return total
+
+    def measure(self, fn, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - started)
+        return timings
@@ -0,0 +1,67 @@
+import time
+import uuid
+
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares django_session growth for anonymous browsing under the stock database "
+        "engine and shop.sessions. Everything runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--visitors', type=int, default=100)
+
+    def handle(self, *args, **options):
+        visitors = options['visitors']
+        slugs = list(Product.objects.filter(available=True).values_list('slug', flat=True)[:5])
+        if not slugs:
+            raise CommandError("Needs at least one available product.")
+
+        self.stdout.write(f"{visitors} anonymous visitors, each opening {len(slugs)} product pages and the cart\n")
+        self.stdout.write(f"{'engine':<34}{'new rows':>10}{'row writes':>12}{'seconds':>10}")
+        engines = ('django.contrib.sessions.backends.db', 'shop.sessions')
+        for engine in engines:
+            rows, writes, elapsed = self.simulate(engine, visitors, slugs)
+            self.stdout.write(f"{engine:<34}{rows:>10}{writes:>12}{elapsed:>10.2f}")
+
+    def simulate(self, engine, visitors, slugs):
+        cache_settings = {
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'sessions': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': f'bench-{uuid.uuid4()}',
+            },
+        }
+        writes = 0
+
+        def count_writes(execute, sql, params, many, context):
+            nonlocal writes
+            if 'django_session' in sql and not sql.lstrip().upper().startswith('SELECT'):
+                writes += 1
+            return execute(sql, params, many, context)
+
+        with override_settings(SESSION_ENGINE=engine, CACHES=cache_settings, ALLOWED_HOSTS=['*']):
+            caches['sessions'].clear()
+            # Everything is rolled back, so the benchmark leaves no rows behind.
+            with transaction.atomic():
+                before = Session.objects.count()
+                started = time.perf_counter()
+                with connection.execute_wrapper(count_writes):
+                    for _ in range(visitors):
+                        client = Client()
+                        for slug in slugs:
+                            client.get(f'/product/{slug}/')
+                        client.get(f'/product/{slugs[0]}/')
+                        client.get('/cart/')
+                elapsed = time.perf_counter() - started
+                rows = Session.objects.count() - before
+                transaction.set_rollback(True)
+        return rows, writes, elapsed
@@ -0,0 +1,116 @@
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from shop.db import apply_pragmas, sqlite_pragmas
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares SQLite throughput under concurrent reads and view-counter writes, "
+        "with the stock configuration and with the tuned pragmas from shop.db."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--products', type=int, default=500)
+
+    def handle(self, *args, **options):
+        stock = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+        self.stdout.write(
+            f"{options['readers']} readers, {options['writers']} writers, {options['seconds']}s per run\n"
+        )
+        self.stdout.write(f"{'mode':<8}{'reads/s':>12}{'writes/s':>12}{'locked':>10}{'p99 read ms':>14}")
+        for label, pragmas in (('stock', stock), ('tuned', sqlite_pragmas())):
+            result = self.run_case(pragmas, options)
+            self.stdout.write(
+                f"{label:<8}{result['reads'] / options['seconds']:>12.0f}"
+                f"{result['writes'] / options['seconds']:>12.0f}{result['locked']:>10}"
+                f"{result['p99'] * 1000:>14.2f}"
+            )
+
+    def run_case(self, pragmas, options):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'bench.sqlite3'
+            setup = sqlite3.connect(path)
+            apply_pragmas(setup.cursor(), pragmas)
+            setup.execute(
+                'CREATE TABLE product (id INTEGER PRIMARY KEY, name TEXT, price REAL, views INTEGER)'
+            )
+            setup.executemany(
+                'INSERT INTO product (name, price, views) VALUES (?, ?, 0)',
+                [(f'Product {i}', i * 1.5) for i in range(options['products'])],
+            )
+            setup.commit()
+            setup.close()
+
+            stop = threading.Event()
+            lock = threading.Lock()
+            totals = {'reads': 0, 'writes': 0, 'locked': 0}
+            latencies = []
+
+            def connect():
+                # Same as Django: Python's default 5s busy handler, which the
+                # tuned run replaces with its busy_timeout pragma.
+                conn = sqlite3.connect(path, isolation_level=None)
+                apply_pragmas(conn.cursor(), pragmas)
+                return conn
+
+            def reader(seed):
+                conn, count, local = connect(), 0, []
+                i = seed
+                while not stop.is_set():
+                    started = time.perf_counter()
+                    try:
+                        conn.execute(
+                            'SELECT id, name, price, views FROM product ORDER BY views DESC LIMIT 10'
+                        ).fetchall()
+                        conn.execute('SELECT * FROM product WHERE id = ?', (i % options['products'] + 1,)).fetchone()
+                        count += 1
+                    except sqlite3.OperationalError:
+                        with lock:
+                            totals['locked'] += 1
+                    local.append(time.perf_counter() - started)
+                    i += 7
+                conn.close()
+                with lock:
+                    totals['reads'] += count
+                    latencies.extend(local)
+
+            def writer(seed):
+                conn, count = connect(), 0
+                i = seed
+                while not stop.is_set():
+                    try:
+                        conn.execute('BEGIN IMMEDIATE')
+                        conn.execute('UPDATE product SET views = views + 1 WHERE id = ?', (i % options['products'] + 1,))
+                        conn.execute('COMMIT')
+                        count += 1
+                    except sqlite3.OperationalError:
+                        if conn.in_transaction:
+                            conn.execute('ROLLBACK')
+                        with lock:
+                            totals['locked'] += 1
+                    i += 13
+                conn.close()
+                with lock:
+                    totals['writes'] += count
+
+            threads = [threading.Thread(target=reader, args=(n,)) for n in range(options['readers'])]
+            threads += [threading.Thread(target=writer, args=(n,)) for n in range(options['writers'])]
+            for thread in threads:
+                thread.start()
+            time.sleep(options['seconds'])
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+            latencies.sort()
+            totals['p99'] = latencies[int(len(latencies) * 0.99) - 1] if latencies else 0.0
+            return totals
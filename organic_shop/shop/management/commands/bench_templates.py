@@ -0,0 +1,94 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Prefetch
+from django.template import RequestContext
+from django.template.backends.django import DjangoTemplates
+from django.test import RequestFactory
+
+from shop.cards import prepare_cards
+from shop.models import Category, Product, ProductVariant
+from shop.views import home_rails
+
+PLAIN_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+CACHED_LOADERS = [('django.template.loaders.cached.Loader', PLAIN_LOADERS)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Renders index.html and category_detail.html from prepared contexts with and without "
+        "the cached template loader, and reports the cost per product card. Uses the data in "
+        "the database; the contexts are built once, outside the timings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--budget-us', type=float, default=None,
+                            help="Fail if a cached render costs more than this per card (microseconds).")
+
+    def handle(self, *args, **options):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        pages = [
+            ('shop/index.html', self.index_context()),
+            ('shop/category_detail.html', self.category_context()),
+        ]
+
+        self.stdout.write(f"{'template':<28}{'loader':<8}{'cards':>6}{'p50 ms':>10}{'p99 ms':>10}{'us/card':>10}")
+        over_budget = []
+        for name, (context, cards) in pages:
+            for label, loaders in (('plain', PLAIN_LOADERS), ('cached', CACHED_LOADERS)):
+                engine = self.engine(loaders)
+                timings = self.measure(engine, name, request, context, options['repeat'])
+                p50 = statistics.median(timings)
+                p99 = statistics.quantiles(timings, n=100)[98] if len(timings) > 1 else p50
+                per_card = p50 * 1e6 / max(cards, 1)
+                self.stdout.write(
+                    f"{name:<28}{label:<8}{cards:>6}{p50 * 1000:>10.2f}{p99 * 1000:>10.2f}{per_card:>10.1f}"
+                )
+                if label == 'cached' and options['budget_us'] is not None and per_card > options['budget_us']:
+                    over_budget.append(name)
+        if over_budget:
+            raise CommandError(f"Over {options['budget_us']:.0f} us per card: {', '.join(over_budget)}")
+
+    def engine(self, loaders):
+        base = settings.TEMPLATES[0]
+        return DjangoTemplates({
+            'NAME': 'bench',
+            'DIRS': base.get('DIRS', []),
+            'APP_DIRS': False,
+            'OPTIONS': {**base.get('OPTIONS', {}), 'debug': False, 'loaders': loaders},
+        }).engine
+
+    def index_context(self):
+        rails = home_rails()
+        cards = sum(len(rails[name]) for name in ('featured_products', 'best_selling', 'just_arrived', 'most_popular'))
+        return {**rails, 'wishlist_items': []}, cards
+
+    def category_context(self):
+        category = (
+            Category.objects.filter(is_active=True).annotate(n=Count('products')).order_by('-n').first()
+        )
+        if category is None:
+            raise CommandError("Needs at least one active category.")
+        products = prepare_cards(
+            Product.objects.filter(category=category, available=True).prefetch_related(
+                Prefetch('variants', queryset=ProductVariant.objects.order_by('-stock'))
+            )
+        )
+        return {'category': category, 'products': products, 'wishlist_items': []}, len(products)
+
+    def measure(self, engine, name, request, context, repeat):
+        timings = []
+        for _ in range(repeat):
+            # As a request does: find the template, then render it.
+            started = time.perf_counter()
+            engine.get_template(name).render(RequestContext(request, context))
+            timings.append(time.perf_counter() - started)
+        return timings
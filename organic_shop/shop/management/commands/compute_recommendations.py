@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop import recommendations
+from shop.jobs import enqueue
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the similar / frequently bought together tables for every product."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='store_true',
+                            help="Queue a full refresh for the job worker instead of running it here.")
+
+    def handle(self, *args, **options):
+        if options['queue']:
+            enqueue('recommendations.refresh', key='full', full=True)
+            self.stdout.write(self.style.SUCCESS("Queued a full refresh."))
+            return
+
+        started = time.perf_counter()
+        written = recommendations.refresh()
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {written} recommendation(s) in {time.perf_counter() - started:.2f}s."
+        ))
@@ -0,0 +1,100 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+
+from accounts.models import Order, PromoCode, Wishlist
+from shop.models import Cart, Category, Job, Product, ProductRecommendation, ProductVariant, Review
+from shop.views import category_products, search_products
+
+SQLITE_SCAN = re.compile(r'\bSCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?')
+POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+def catalog():
+    """
+    (name, queryset, scans it may do) for each hot lookup, as the views run
+    it. A scan is a table read row by row, or an index walked from one end;
+    each allowance says why it is bounded or unavoidable.
+    """
+    category = Category(pk=1)
+    return [
+        # The home shelves walk their partial index in order and stop at the LIMIT.
+        ('home: featured', Product.objects.filter(available=True, category_active=True, is_featured=True)[:8],
+         ('shop_product_featured',)),
+        ('home: best selling', Product.objects.filter(available=True, category_active=True).order_by('-sold_count')[:10],
+         ('shop_product_best_selling',)),
+        ('home: just arrived', Product.objects.filter(available=True, category_active=True).order_by('-created_at')[:10],
+         ('shop_product_newest',)),
+        ('home: most viewed', Product.objects.filter(available=True, category_active=True).order_by('-views')[:8],
+         ('shop_product_most_viewed',)),
+        # A substring match cannot use a b-tree index; it reads every product.
+        ('search', search_products('apple'), ('shop_product',)),
+        ('category: default', category_products(category), ()),
+        ('category: newest', category_products(category, 'newest'), ()),
+        ('category: price', category_products(category, 'price_asc'), ()),
+        ('category: rating', category_products(category, 'rating'), ()),
+        ('product by slug', Product.objects.filter(slug='x', available=True), ()),
+        ('variants of product', ProductVariant.objects.filter(product_id=1).order_by('-stock'), ()),
+        ('reviews: newest', Review.objects.filter(product_id=1).order_by('-created_at', '-id')[:10], ()),
+        ('reviews: by user', Review.objects.filter(user_id=1).order_by('-created_at')[:5], ()),
+        ('recommendations', ProductRecommendation.objects.filter(product_id=1, rank__lt=4), ()),
+        ('cart of user', Cart.objects.filter(user_id=1), ()),
+        ('cart of session', Cart.objects.filter(session_key='x', user=None), ()),
+        ('wishlist of user', Wishlist.objects.filter(user_id=1), ()),
+        ('my orders', Order.objects.filter(user_id=1).order_by('-created_at', '-id')[:10], ()),
+        ('orders by status', Order.objects.filter(status='pending').order_by('-created_at')[:20], ()),
+        ('promo code', PromoCode.objects.filter(code='X'), ()),
+        ('next job', Job.objects.filter(status='pending', run_after__lte=timezone.now()).order_by('run_after', 'id')[:1], ()),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs EXPLAIN on the storefront's hot queries and fails if any of them "
+        "scans a whole table or index without an allowance. Run it after changing models or views; on SQLite, "
+        "after sqlite_maintenance, so the planner has table statistics."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--plans', action='store_true', help="Print every plan, not only failing ones.")
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f"Don't know how to read {connection.vendor} plans.")
+
+        failures = []
+        for name, queryset, allowed in catalog():
+            plan = self.explain(queryset.using(options['database']), connection)
+            scans = sorted(set(self.full_scans(plan, connection.vendor)) - set(allowed))
+            if scans:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f"FULL SCAN  {name}: {', '.join(scans)}"))
+            else:
+                self.stdout.write(f"ok         {name}")
+            if scans or options['plans']:
+                self.stdout.write('\n'.join(f'    {line}' for line in plan.splitlines()))
+
+        if failures:
+            raise CommandError(f"{len(failures)} quer{'y' if len(failures) == 1 else 'ies'} scan a whole table or index.")
+        self.stdout.write(self.style.SUCCESS("No unexpected full scans."))
+
+    def explain(self, queryset, connection):
+        if connection.vendor == 'postgresql':
+            # On a small database the planner rightly prefers a sequential
+            # scan; discourage it so the plan shows which index would be used.
+            with transaction.atomic(using=queryset.db):
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                return queryset.explain()
+        return queryset.explain()
+
+    def full_scans(self, plan, vendor):
+        if vendor == 'postgresql':
+            return POSTGRES_SCAN.findall(plan)
+        # Only SEARCH seeks. A bare "SCAN t" reads every row of t, and "SCAN t
+        # USING [COVERING] INDEX i" reads i from one end, reported as i.
+        return [index or table for table, index in SQLITE_SCAN.findall(plan)]
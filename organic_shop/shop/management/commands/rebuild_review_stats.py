@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from shop.reviews import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recomputes every product's review count, rating sum and histogram from the review table."
+
+    def handle(self, *args, **options):
+        rebuild()
+        self.stdout.write(self.style.SUCCESS("Review stats rebuilt."))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from shop import jobs
+
+
+class Command(BaseCommand):
+    help = "Runs the background job worker (image processing and other deferred work)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the queue once and exit.")
+        parser.add_argument('--interval', type=float, default=2.0, help="Seconds to sleep when the queue is empty.")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            processed = jobs.work(once=True)
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} job(s)."))
+            return
+
+        self.stdout.write(f"Worker started, polling every {options['interval']}s. Press Ctrl+C to stop.")
+        try:
+            jobs.work(interval=options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write("Worker stopped.")
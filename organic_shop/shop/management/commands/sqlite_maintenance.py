@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from shop.db import run_maintenance
+
+
+class Command(BaseCommand):
+    help = "Runs PRAGMA optimize and a truncating WAL checkpoint on a SQLite database. Schedule it from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError(f"Database '{options['database']}' is not SQLite.")
+        busy, wal_pages, checkpointed = run_maintenance(connection)
+        if busy:
+            self.stdout.write(self.style.WARNING(
+                f"Checkpoint incomplete: {checkpointed}/{wal_pages} WAL pages copied, readers still active."
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Optimised; checkpointed {checkpointed} WAL page(s)."))
@@ -0,0 +1,30 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies the primary SQLite database into every SQLite replica file using the online "
+        "backup API. Lets two local files stand in for a primary/replica pair."
+    )
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES['default']
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("The primary database is not SQLite; use the server's own replication.")
+        if not settings.REPLICA_DATABASES:
+            raise CommandError("No replicas configured. Set DB_REPLICAS to one or more file paths.")
+
+        source = sqlite3.connect(primary['NAME'])
+        try:
+            for alias in settings.REPLICA_DATABASES:
+                target = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(self.style.SUCCESS(f"{alias}: copied from {primary['NAME']}"))
+        finally:
+            source.close()
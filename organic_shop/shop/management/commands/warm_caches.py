@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from shop.warmup import DEFAULT_TOP, warm
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills the caches the first requests after a deploy would otherwise build: templates, "
+        "price rules, promo codes, home page rails and the best sellers' product pages."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=DEFAULT_TOP, help="Product pages to build.")
+
+    def handle(self, *args, **options):
+        report = warm(options['top'])
+        for name, seconds, detail in report:
+            self.stdout.write(f"{name:<16}{seconds * 1000:>9.1f} ms  {detail}")
+        total = sum(seconds for _, seconds, _ in report)
+        self.stdout.write(self.style.SUCCESS(f"Warmed in {total * 1000:.0f} ms."))
@@ -0,0 +1,190 @@
+import mimetypes
+import os
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags
+
+from .routers import end_request, replica_aliases, start_request, unpin
+
+# Hashed names look like `css/style.3f2a9c1b0d4e.css`.
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'public, max-age=60, must-revalidate'
+
+
+def _accepted_encodings(header):
+    """
+    The content codings an Accept-Encoding header allows: those listed with
+    a q-value above 0, and '*' for any coding not listed.
+    """
+    accepted, refused = set(), set()
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        (accepted if quality > 0 else refused).add(coding)
+    return accepted, refused
+
+
+def _accepts(coding, accepted, refused):
+    return coding in accepted or ('*' in accepted and coding not in refused)
+
+
+class HybridMiddleware:
+    """
+    Base for middleware that works under WSGI and ASGI alike, so async views
+    are not pushed back onto a thread by a sync-only middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.call(request)
+
+    # Pass-throughs: subclasses override what they need.
+    def call(self, request):
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+
+class StaticAssetMiddleware(HybridMiddleware):
+    """
+    Serves collected static files straight from STATIC_ROOT when no web
+    server sits in front of the app (SERVE_STATIC = True).
+
+    Fingerprinted files are sent with a one-year immutable Cache-Control,
+    everything else must revalidate. If the client accepts it, the `.br` or
+    `.gz` sibling written by collectstatic is sent instead of the original.
+    """
+    encodings = (('br', '.br'), ('gzip', '.gz'))
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.enabled = getattr(settings, 'SERVE_STATIC', False) and settings.STATIC_ROOT
+        self.prefix = settings.STATIC_URL if settings.STATIC_URL.startswith('/') else '/' + settings.STATIC_URL
+
+    def is_static(self, request):
+        return self.enabled and request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix)
+
+    def call(self, request):
+        if self.is_static(request):
+            return self.serve(request, request.path[len(self.prefix):])
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if self.is_static(request):
+            return self.serve(request, request.path[len(self.prefix):])
+        return await self.get_response(request)
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(str(settings.STATIC_ROOT), name)
+        except ValueError:
+            raise Http404
+        if not os.path.isfile(path):
+            raise Http404
+
+        accepted, refused = _accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        served_path, content_encoding = path, None
+        for encoding, suffix in self.encodings:
+            if _accepts(encoding, accepted, refused) and os.path.isfile(path + suffix):
+                served_path, content_encoding = path + suffix, encoding
+                break
+
+        # Each coding is different content, so it gets its own validator.
+        stat = os.stat(served_path)
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-" + content_encoding if content_encoding else ""}"'
+        immutable = bool(HASHED_NAME_RE.search(name))
+        cache_control = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+
+        known = {tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))}
+        if etag in known or '*' in known:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            response['Vary'] = 'Accept-Encoding'
+            response['Cache-Control'] = cache_control
+            return response
+
+        content_type, _ = mimetypes.guess_type(name)
+        response = FileResponse(open(served_path, 'rb'), content_type=content_type or 'application/octet-stream')
+        if content_encoding:
+            response['Content-Encoding'] = content_encoding
+        response['Vary'] = 'Accept-Encoding'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Cache-Control'] = cache_control
+        return response
+
+
+class ReplicaPinningMiddleware(HybridMiddleware):
+    """
+    Keeps read-your-writes when catalog reads go to replicas.
+
+    Requests with an unsafe method read from the primary throughout, and
+    leave a short-lived cookie behind so the redirect that follows (cart,
+    checkout, review posted) and the next few page loads do too, until the
+    replicas have caught up. Within any request the router itself pins to
+    the primary after the first write.
+    """
+    cookie_name = 'primary_pin'
+    safe_methods = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+    def start(self, request):
+        return start_request(pinned=request.method not in self.safe_methods or self.cookie_name in request.COOKIES)
+
+    def finish(self, request, response):
+        if request.method not in self.safe_methods and not getattr(request, 'replica_read_only', False):
+            response.set_cookie(self.cookie_name, '1', max_age=self.pin_seconds, httponly=True, samesite='Lax')
+        return response
+
+    def call(self, request):
+        if not replica_aliases():
+            return self.get_response(request)
+        token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        if not replica_aliases():
+            return await self.get_response(request)
+        token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(token)
+        return self.finish(request, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(view_func, 'replica_read_only', False) and self.cookie_name not in request.COOKIES:
+            request.replica_read_only = True
+            unpin()
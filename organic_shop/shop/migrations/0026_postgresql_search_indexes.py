@@ -0,0 +1,42 @@
+from django.db import migrations
+
+
+# Storefront search and the dashboard filter use name__icontains, which
+# PostgreSQL compiles to UPPER("name") LIKE UPPER('%q%'). A trigram GIN index
+# on the same expression serves those leading-wildcard patterns; B-tree
+# indexes cannot. SQLite has no equivalent, so these are PostgreSQL-only.
+POSTGRESQL_FORWARDS = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS shop_product_name_trgm '
+    'ON shop_product USING gin (UPPER(name) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS shop_category_name_upper '
+    'ON shop_category (UPPER(name))',
+]
+
+POSTGRESQL_BACKWARDS = [
+    'DROP INDEX IF EXISTS shop_category_name_upper',
+    'DROP INDEX IF EXISTS shop_product_name_trgm',
+]
+
+
+def _run_on_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0025_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run_on_postgresql(POSTGRESQL_FORWARDS),
+            _run_on_postgresql(POSTGRESQL_BACKWARDS),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_stats(apps, schema_editor):
+    Review = apps.get_model('shop', 'Review')
+    ProductReviewStats = apps.get_model('shop', 'ProductReviewStats')
+    counts = {}
+    for product_id, rating in Review.objects.values_list('product_id', 'rating').iterator():
+        counts.setdefault(product_id, [0] * 6)[rating] += 1
+    ProductReviewStats.objects.bulk_create([
+        ProductReviewStats(
+            product_id=product_id,
+            review_count=sum(histogram),
+            rating_sum=sum(stars * n for stars, n in enumerate(histogram)),
+            average_rating=sum(stars * n for stars, n in enumerate(histogram)) / sum(histogram),
+            **{f'rating_{stars}': histogram[stars] for stars in range(1, 6)},
+        )
+        for product_id, histogram in counts.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0027_productrecommendation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductReviewStats',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='review_stats', serialize=False, to='shop.product')),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('rating_1', models.PositiveIntegerField(default=0)),
+                ('rating_2', models.PositiveIntegerField(default=0)),
+                ('rating_3', models.PositiveIntegerField(default=0)),
+                ('rating_4', models.PositiveIntegerField(default=0)),
+                ('rating_5', models.PositiveIntegerField(default=0)),
+                ('average_rating', models.FloatField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-average_rating', '-review_count'], name='shop_reviewstats_rating')],
+            },
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
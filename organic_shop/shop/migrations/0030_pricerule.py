@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:48
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0029_review_helpful_count_and_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('kind', models.CharField(choices=[('percent_off', 'Percent off'), ('buy_x_get_y', 'Buy X, get Y free')], default='percent_off', max_length=20)),
+                ('percent_off', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('min_quantity', models.PositiveIntegerField(default=1)),
+                ('buy_quantity', models.PositiveIntegerField(default=1)),
+                ('free_quantity', models.PositiveIntegerField(default=1)),
+                ('starts_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('active', models.BooleanField(default=True)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='price_rules', to='shop.category')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='price_rules', to='shop.product')),
+            ],
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def merge_duplicate_user_carts(apps, schema_editor):
+    # Before the one-cart-per-user constraint: fold a user's older carts
+    # into their most recently updated one.
+    Cart = apps.get_model('shop', 'Cart')
+    CartItem = apps.get_model('shop', 'CartItem')
+    users = (
+        Cart.objects.filter(user__isnull=False).values('user')
+        .annotate(n=models.Count('pk')).filter(n__gt=1).values_list('user', flat=True)
+    )
+    for user_id in users:
+        keep, *others = Cart.objects.filter(user_id=user_id).order_by('-updated_at', '-id')
+        lines = {(item.product_id, item.variant_id): item for item in CartItem.objects.filter(cart=keep)}
+        for item in CartItem.objects.filter(cart__in=others):
+            line = lines.get((item.product_id, item.variant_id))
+            if line is None:
+                item.cart = keep
+                item.save(update_fields=['cart'])
+                lines[(item.product_id, item.variant_id)] = item
+            else:
+                line.quantity += item.quantity
+                line.save(update_fields=['quantity'])
+        Cart.objects.filter(pk__in=[cart.pk for cart in others]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0030_pricerule'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(condition=models.Q(('user__isnull', True)), fields=['session_key'], name='shop_cart_session'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True), ('is_featured', True)), fields=['category'], name='shop_product_featured'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['-sold_count'], name='shop_product_best_selling'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['-created_at'], name='shop_product_newest'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['-views'], name='shop_product_most_viewed'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['category', '-created_at'], name='shop_product_category'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['user', '-created_at'], name='shop_review_user_newest'),
+        ),
+        migrations.RunPython(merge_duplicate_user_carts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', False)), fields=('user',), name='shop_cart_unique_user'),
+        ),
+    ]
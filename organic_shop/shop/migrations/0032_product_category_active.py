@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:57
+
+from django.db import migrations, models
+
+
+def copy_category_active(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    Product.objects.filter(category__is_active=False).update(category_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0031_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='shop_product_featured',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='shop_product_best_selling',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='shop_product_newest',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='shop_product_most_viewed',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='category_active',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.RunPython(copy_category_active, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True), ('category_active', True), ('is_featured', True)), fields=['category'], name='shop_product_featured'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True), ('category_active', True)), fields=['-sold_count'], name='shop_product_best_selling'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True), ('category_active', True)), fields=['-created_at'], name='shop_product_newest'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True), ('category_active', True)), fields=['-views'], name='shop_product_most_viewed'),
+        ),
+    ]
@@ -1,11 +1,12 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.core.exceptions import ValidationError
-from django.db import transaction
 from django.utils.text import slugify
-import shortuuid
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.db.models import Sum, Min
+from .utils import allocate_identifier, save_with_identifier
 
 
 class Category(models.Model):
@@ -15,17 +16,12 @@ class Category(models.Model):
     is_active = models.BooleanField(default=True)
 
     def save(self, *args, **kwargs):
-       
         if not self.slug:
-            base_slug = slugify(self.name)
-            slug = base_slug
-            counter = 1
-           
-            while Category.objects.filter(slug=slug).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = slug
-        super().save(*args, **kwargs) 
+            return save_with_identifier(
+                self, 'slug', slugify(self.name),
+                lambda: super(Category, self).save(*args, **kwargs)
+            )
+        super().save(*args, **kwargs)
 
     class Meta:
         verbose_name_plural = "Categories"
@@ -47,18 +43,29 @@ class Product(models.Model):
     views = models.PositiveIntegerField(default=1)  
     available = models.BooleanField(default=True)
     stock = models.PositiveIntegerField(default=0)
+    # Copy of category.is_active, so listings need no join. Kept in step by
+    # save() and, for a whole category at once, by shop.signals.
+    category_active = models.BooleanField(default=True, editable=False)
+
+    class Meta:
+        # The storefront only lists available products, so the listing
+        # indexes are partial: one per home page shelf, and one for a
+        # category's newest-first page.
+        indexes = [
+            models.Index(fields=['category'], condition=models.Q(available=True, category_active=True, is_featured=True), name='shop_product_featured'),
+            models.Index(fields=['-sold_count'], condition=models.Q(available=True, category_active=True), name='shop_product_best_selling'),
+            models.Index(fields=['-created_at'], condition=models.Q(available=True, category_active=True), name='shop_product_newest'),
+            models.Index(fields=['-views'], condition=models.Q(available=True, category_active=True), name='shop_product_most_viewed'),
+            models.Index(fields=['category', '-created_at'], condition=models.Q(available=True), name='shop_product_category'),
+        ]
 
     def save(self, *args, **kwargs):
+        self.category_active = self.category.is_active
         if not self.slug:
-            base_slug = slugify(self.name)
-            query = Product.objects.filter(slug=base_slug)
-            if self.pk:
-                query = query.exclude(pk=self.pk)
-            
-            if query.exists():
-                self.slug = f"{base_slug}-{shortuuid.uuid()[:8]}"
-            else:
-                self.slug = base_slug
+            return save_with_identifier(
+                self, 'slug', slugify(self.name),
+                lambda: super(Product, self).save(*args, **kwargs)
+            )
         super().save(*args, **kwargs)
 
 
@@ -103,19 +110,61 @@ class Product(models.Model):
             return self.variants.aggregate(models.Min('discount_price'))['discount_price__min']
         return self.discount_price
     
-    @property
+    @cached_property
     def display_price(self):
         """Returns the effective price to display (uses variant prices if they exist)"""
         if self.has_variants:
             return None  
-        return self.discount_price or self.price
+        from .pricing import unit_price
+        return unit_price(self)
 
     @property
     def display_discount(self):
         """Returns discount percentage if applicable (only for non-variant products)"""
-        if self.has_variants or not self.discount_price:
+        price = self.display_price
+        if price is None or price >= self.price:
             return None
-        return self.get_discount_percentage
+        return int(100 - (price / self.price * 100))
+
+
+class PriceRule(models.Model):
+    """
+    A promotion applied automatically when pricing carts and orders (see
+    `shop.pricing`). Scoped to a product, a category or, with neither set,
+    the whole store; only the best rule for each line applies.
+    """
+    PERCENT_OFF = 'percent_off'
+    BUY_X_GET_Y = 'buy_x_get_y'
+    KIND_CHOICES = [
+        (PERCENT_OFF, 'Percent off'),
+        (BUY_X_GET_Y, 'Buy X, get Y free'),
+    ]
+
+    name = models.CharField(max_length=100)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default=PERCENT_OFF)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True, related_name='price_rules')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='price_rules')
+    percent_off = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    # Tiers are rules with increasing minimum quantities.
+    min_quantity = models.PositiveIntegerField(default=1)
+    buy_quantity = models.PositiveIntegerField(default=1)
+    free_quantity = models.PositiveIntegerField(default=1)
+    starts_at = models.DateTimeField(default=timezone.now)
+    ends_at = models.DateTimeField(null=True, blank=True)
+    active = models.BooleanField(default=True)
+
+    def __str__(self):
+        return self.name
+
+    def clean(self):
+        if self.product_id and self.category_id:
+            raise ValidationError("A price rule applies to a product or a category, not both.")
+        if self.kind == self.PERCENT_OFF and not 0 < self.percent_off <= 100:
+            raise ValidationError("Percent off must be between 0 and 100.")
+        if self.kind == self.BUY_X_GET_Y and (not self.buy_quantity or not self.free_quantity):
+            raise ValidationError("Buy and free quantities must be at least 1.")
+        if self.ends_at and self.ends_at <= self.starts_at:
+            raise ValidationError("The rule must end after it starts.")
 
 
 class ProductImage(models.Model):
@@ -148,28 +197,28 @@ class ProductVariant(models.Model):
     def __str__(self):
         return f"{self.product.name} - {', '.join(v.value for v in self.values.all())}"
 
-    def generate_sku(self):
+    @property
+    def label(self):
+        """e.g. "Size: M, Color: Red"."""
+        return ", ".join(f"{v.option.name}: {v.value}" for v in self.values.all())
+
+    def sku_base(self):
         base = self.product.name[:3].upper()
-        variant_parts = sorted([v.value[:3].upper() for v in self.values.all()])
-        sku_base = f"{base}-{'-'.join(variant_parts)}"
-        
-        counter = 1
-        sku = sku_base
-        while ProductVariant.objects.filter(sku=sku).exclude(id=self.id).exists():
-            sku = f"{sku_base}-{counter}"
-            counter += 1
-        return sku
-
-   
-    def save(self, *args, **kwargs):
-        with transaction.atomic():
-            if self._state.adding:
-                super().save(*args, **kwargs)
+        # Values are an m2m and can only exist once the row does; a variant
+        # being created gets the product-only base, as it always has.
+        variant_parts = sorted(v.value[:3].upper() for v in self.values.all()) if self.pk else []
+        return f"{base}-{'-'.join(variant_parts)}"
 
-            if not self.sku:
-                self.sku = self.generate_sku()
-            
-            super().save(*args, **kwargs)
+    def generate_sku(self):
+        return allocate_identifier(ProductVariant, 'sku', self.sku_base(), exclude_pk=self.pk)
+
+    def save(self, *args, **kwargs):
+        if not self.sku:
+            return save_with_identifier(
+                self, 'sku', self.sku_base(),
+                lambda: super(ProductVariant, self).save(*args, **kwargs)
+            )
+        super().save(*args, **kwargs)
 
     @property
     def get_discount_percentage(self):
@@ -182,13 +231,42 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['session_key'], condition=models.Q(user__isnull=True), name='shop_cart_session'),
+        ]
+        constraints = [
+            # One cart per user, so get_or_create(user=...) cannot race into two.
+            models.UniqueConstraint(fields=['user'], condition=models.Q(user__isnull=False), name='shop_cart_unique_user'),
+        ]
+
+    @cached_property
+    def quote(self):
+        """Prices the cart: one query for the items, one pass over them."""
+        from .pricing import price_items
+
+        items = list(
+            self.items.select_related('product', 'variant__product').prefetch_related('variant__values__option')
+        )
+        quote = price_items(items)
+        for item, line in zip(items, quote.lines):
+            item.line = line
+        self._priced_items = items
+        return quote
+
+    @property
+    def priced_items(self):
+        """The cart items, each with its priced `line`."""
+        self.quote
+        return self._priced_items
+
     @property
     def total_price(self):
-        return sum(item.total_price for item in self.items.all())
+        return self.quote.total
 
     @property
     def total_savings(self):
-        return sum(item.savings for item in self.items.all())
+        return self.quote.savings
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
@@ -210,28 +288,34 @@ class CartItem(models.Model):
         return self.product.stock
 
 
+    @property
+    def priced_line(self):
+        """This item priced by `shop.pricing` (already done for Cart.priced_items)."""
+        line = getattr(self, 'line', None)
+        if line is None or line.quantity != self.quantity:
+            from .pricing import price_items
+
+            line = self.line = price_items([self]).lines[0]
+        return line
+
     @property
     def total_price(self):
-        if self.variant:
-            if self.variant.discount_price:
-                return self.variant.discount_price * self.quantity
-            return self.variant.price * self.quantity
-        elif self.product.discount_price:
-            return self.product.discount_price * self.quantity
-        return self.product.price * self.quantity
+        """Calculates the total price for this cart item, price rules included."""
+        return self.priced_line.total
+
+
+    @property
+    def unit_total(self):
+        """What one unit costs on this line once its price rule applies, for display."""
+        from .pricing import money
 
+        line = self.priced_line
+        return money(line.total / line.quantity) if line.quantity else line.unit_price
 
     @property
     def savings(self):
-        if self.variant:
-            if self.variant.discount_price:
-                return (self.variant.price - self.variant.discount_price) * self.quantity
-            elif self.product.discount_price:
-                return (self.product.price - self.product.discount_price) * self.quantity
-            return 0
-        elif self.product.discount_price:
-            return (self.product.price - self.product.discount_price) * self.quantity
-        return 0
+        line = self.priced_line
+        return (line.original_price - line.unit_price) * line.quantity + line.discount
 
 
     @property
@@ -242,29 +326,9 @@ class CartItem(models.Model):
         name = self.variant if self.variant else self.product
         return f"{name} x {self.quantity}"
     
-    @property
-    def total_price(self):
-        """Calculates the total price for this cart item (price * quantity)."""
-        return self.get_price() * self.quantity
-
     def get_price(self):
-        """
-        Determines the correct price for the item.
-        It prioritizes prices in this order:
-        1. Variant's discount price
-        2. Variant's regular price
-        3. Product's discount price
-        4. Product's regular price
-        """
-        # Use Decimal for accurate currency calculations
-        if self.variant and self.variant.discount_price:
-            return self.variant.discount_price
-        if self.variant:
-            return self.variant.price
-        if self.product.discount_price:
-            return self.product.discount_price
-        # Fallback to the main product's regular price
-        return self.product.price
+        """The unit price before price rules: discount price, else price, of the variant or product."""
+        return self.priced_line.unit_price
 
 class Review(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews')
@@ -272,6 +336,127 @@ class Review(models.Model):
     rating = models.PositiveSmallIntegerField(choices=[(i, i) for i in range(1, 6)])
     comment = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    helpful_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # One per review sort order in `shop.reviews.SORTS`, for keyset paging.
+        indexes = [
+            models.Index(fields=['product', '-created_at', '-id'], name='shop_review_newest'),
+            models.Index(fields=['product', '-helpful_count', '-created_at', '-id'], name='shop_review_helpful'),
+            models.Index(fields=['product', '-rating', '-created_at', '-id'], name='shop_review_rating'),
+            # A user's latest reviews, on their profile.
+            models.Index(fields=['user', '-created_at'], name='shop_review_user_newest'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.rating}⭐"
+
+    def save(self, *args, **kwargs):
+        # The review and its product's ProductReviewStats (updated by the
+        # pre/post_save receivers) are written together or not at all.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class ProductReviewStats(models.Model):
+    """
+    Running review totals for a product, kept in step with Review by
+    `shop.reviews` so listings never aggregate the review table.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='review_stats')
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+    average_rating = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-average_rating', '-review_count'], name='shop_reviewstats_rating'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.average_rating:.1f} ({self.review_count})"
+
+    @classmethod
+    def for_product(cls, product):
+        """The product's stats, or an empty unsaved row if it has no reviews yet."""
+        try:
+            return product.review_stats
+        except cls.DoesNotExist:
+            return cls(product=product)
+
+    @property
+    def histogram(self):
+        """[(stars, count, percent)] from 5 stars down to 1."""
+        rows = []
+        for stars in range(5, 0, -1):
+            count = getattr(self, f'rating_{stars}')
+            percent = round(count * 100 / self.review_count) if self.review_count else 0
+            rows.append((stars, count, percent))
+        return rows
+
+
+class Job(models.Model):
+    """A unit of background work picked up by the `run_jobs` worker."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    key = models.CharField(max_length=255, blank=True)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='shop_job_status_run_after'),
+        ]
+        constraints = [
+            # At most one queued job per (kind, key): enqueueing twice is a no-op.
+            models.UniqueConstraint(
+                fields=['kind', 'key'],
+                condition=models.Q(status='pending'),
+                name='shop_job_unique_pending',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}({self.key}) - {self.status}"
+
+
+class ProductRecommendation(models.Model):
+    """
+    A precomputed related product, written by `shop.recommendations`.
+    Rows for one product are read together, in rank order.
+    """
+    KIND_CHOICES = [
+        ('similar', 'Similar'),
+        ('bought_together', 'Frequently bought together'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    rank = models.PositiveSmallIntegerField()
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'kind', 'rank'], name='shop_recommendation_unique_rank'),
+        ]
 
     def __str__(self):
-        return f"{self.user.username} - {self.rating}⭐"
\ No newline at end of file
+        return f"{self.product_id} -> {self.related_id} ({self.kind} #{self.rank})"
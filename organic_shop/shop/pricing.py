@@ -0,0 +1,180 @@
+"""
+Prices for carts, checkout and orders.
+
+A line's list price is the variant's (or product's) discount_price or
+price. Active PriceRules then take off the best of:
+
+* percent off the line, for a product, a category or the whole store,
+  once the line has `min_quantity` units (several rules make tiers);
+* buy X, get Y free: every X + Y units, Y of them are free;
+
+and a promo code finally takes its percentage off the subtotal.
+
+Rules are compiled once into a RuleSet: per-product, per-category and
+storewide lists of small rule objects with their factors precomputed, and
+a memo of the merged list per (product, category). Pricing a cart is then
+one pass over its lines with no queries. The RuleSet is rebuilt when the
+'pricing-rules' version moves on (`invalidate`, called from `shop.signals`
+when a rule is saved or deleted) and when a rule's start or end time
+passes.
+"""
+import threading
+from collections import defaultdict, namedtuple
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.utils import timezone
+
+from .invalidation import bump, version
+from .models import PriceRule
+
+SCOPE = 'pricing-rules'
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+Item = namedtuple('Item', 'product variant quantity')
+
+_lock = threading.Lock()
+_ruleset = None
+
+
+def money(amount):
+    return Decimal(amount).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+class CompiledRule:
+    __slots__ = ('id', 'name', 'kind', 'factor', 'min_quantity', 'group', 'free')
+
+    def __init__(self, rule):
+        self.id = rule.id
+        self.name = rule.name
+        self.kind = rule.kind
+        self.factor = Decimal(rule.percent_off) / 100
+        self.min_quantity = max(rule.min_quantity, 1)
+        self.group = rule.buy_quantity + rule.free_quantity
+        self.free = rule.free_quantity
+
+    def discount(self, unit_price, quantity):
+        if quantity < self.min_quantity:
+            return ZERO
+        if self.kind == PriceRule.BUY_X_GET_Y:
+            return unit_price * (quantity // self.group * self.free)
+        return money(unit_price * quantity * self.factor)
+
+
+class RuleSet:
+
+    def __init__(self, rules, now, version=None):
+        self.version = version
+        # Rebuilt once the next rule starts or ends.
+        self.expires_at = None
+        self.by_product = defaultdict(list)
+        self.by_category = defaultdict(list)
+        self.storewide = []
+        self._memo = {}
+        for rule in rules:
+            for boundary in (rule.starts_at, rule.ends_at):
+                if boundary and boundary > now and (self.expires_at is None or boundary < self.expires_at):
+                    self.expires_at = boundary
+            if rule.starts_at > now or (rule.ends_at and rule.ends_at <= now):
+                continue
+            compiled = CompiledRule(rule)
+            if rule.product_id:
+                self.by_product[rule.product_id].append(compiled)
+            elif rule.category_id:
+                self.by_category[rule.category_id].append(compiled)
+            else:
+                self.storewide.append(compiled)
+
+    def rules_for(self, product_id, category_id):
+        key = (product_id, category_id)
+        rules = self._memo.get(key)
+        if rules is None:
+            rules = self._memo[key] = (
+                *self.by_product.get(product_id, ()), *self.by_category.get(category_id, ()), *self.storewide
+            )
+        return rules
+
+    def best(self, product_id, category_id, unit_price, quantity):
+        """(discount, rule) of the best rule for one line; (0, None) if none applies."""
+        best, best_rule = ZERO, None
+        for rule in self.rules_for(product_id, category_id):
+            discount = rule.discount(unit_price, quantity)
+            if discount > best:
+                best, best_rule = discount, rule
+        return best, best_rule
+
+
+def invalidate():
+    bump(SCOPE)
+    global _ruleset
+    _ruleset = None
+
+
+def load(now=None):
+    """The current RuleSet, compiling it if rules changed or a window passed."""
+    global _ruleset
+    now = now or timezone.now()
+    current = version(SCOPE)
+    ruleset = _ruleset
+    if not _is_current(ruleset, current, now):
+        with _lock:
+            ruleset = _ruleset
+            if not _is_current(ruleset, current, now):
+                rules = PriceRule.objects.filter(active=True).exclude(ends_at__lte=now)
+                ruleset = _ruleset = RuleSet(rules, now, current)
+    return ruleset
+
+
+def _is_current(ruleset, version, now):
+    return (
+        ruleset is not None and ruleset.version == version
+        and (ruleset.expires_at is None or now < ruleset.expires_at)
+    )
+
+
+Line = namedtuple('Line', 'product variant quantity original_price unit_price discount total rule')
+
+
+Quote = namedtuple('Quote', 'lines subtotal promo_discount total savings item_count')
+
+
+def list_prices(product, variant=None):
+    """(original price, list price) of one unit before rules."""
+    if variant is not None:
+        return variant.price, variant.discount_price or variant.price
+    return product.price, product.discount_price or product.price
+
+
+def price_items(items, promo_code=None, now=None, ruleset=None):
+    """
+    Prices `items` (CartItems or Items: anything with product, variant and
+    quantity) in one pass and returns a Quote.
+    """
+    ruleset = ruleset or load(now)
+    lines = []
+    subtotal = savings = ZERO
+    count = 0
+    for item in items:
+        variant = item.variant
+        product = item.product if item.product is not None else variant.product
+        original, unit = list_prices(product, variant)
+        quantity = item.quantity
+        discount, rule = ruleset.best(product.id, product.category_id, unit, quantity)
+        total = unit * quantity - discount
+        lines.append(Line(product, variant, quantity, original, unit, discount, total, rule))
+        subtotal += total
+        savings += (original - unit) * quantity + discount
+        count += quantity
+    promo_discount = promo_discount_for(subtotal, promo_code)
+    return Quote(lines, subtotal, promo_discount, subtotal - promo_discount, savings + promo_discount, count)
+
+
+def promo_discount_for(subtotal, promo_code):
+    if not promo_code:
+        return ZERO
+    return money(subtotal * Decimal(promo_code.discount_percentage) / 100)
+
+
+def unit_price(product, variant=None):
+    """What one unit costs with the rules that apply to a single unit."""
+    return price_items([Item(product, variant, 1)]).lines[0].total
@@ -0,0 +1,115 @@
+"""
+The product page payload.
+
+Everything `product_detail` renders that is the same for every visitor (the
+product with its category, variants, images and review totals, the option
+map and variant JSON, the first reviews and the related products) is built
+by `build_payload` in a fixed number of queries and cached as one entry.
+
+The cache key carries the versions of the product, of its category and of
+the price rules (see `shop.invalidation`), so any change to them makes
+stale payloads unreachable. Cards of related products are only as fresh as the page they
+appear on, i.e. at most the cache timeout old. Per-visitor parts (recently
+viewed, the review form, the view counter) stay in the view.
+
+PRODUCT_PAGE_CACHE_TIMEOUT sets how long a payload may be kept (seconds).
+"""
+import json
+
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import Http404
+
+from . import caching
+from .invalidation import make_key
+from .models import Product, ProductReviewStats, ProductVariant
+from .recommendations import related_products
+from .reviews import DEFAULT_SORT, page_url, review_page
+
+DEFAULT_TIMEOUT = 60 * 60
+INITIAL_REVIEWS = 5
+
+
+def _timeout():
+    return getattr(settings, 'PRODUCT_PAGE_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def option_map(variants):
+    """{option name: sorted values} over all variants."""
+    options = {}
+    for variant in variants:
+        for value in variant.values.all():
+            options.setdefault(value.option.name, set()).add(value.value)
+    return {name: sorted(values) for name, values in options.items()}
+
+
+def variant_data(variants):
+    return [{
+        'id': variant.id,
+        'values': [v.value.lower() for v in variant.values.all()],
+        'stock': variant.stock,
+    } for variant in variants]
+
+
+def build_payload(product_id):
+    """Builds the shared part of a product page; raises Http404 if unavailable."""
+    product = (
+        Product.objects.select_related('category', 'review_stats')
+        .prefetch_related(
+            Prefetch(
+                'variants',
+                queryset=ProductVariant.objects.order_by('-stock').prefetch_related('values__option'),
+            ),
+            'images',
+        )
+        .filter(pk=product_id, available=True)
+        .first()
+    )
+    if product is None:
+        raise Http404('No Product matches the given query.')
+
+    variants = list(product.variants.all())
+    # Only the first few reviews ship with the page; the rest load on scroll.
+    reviews, next_cursor = review_page(product, limit=INITIAL_REVIEWS)
+    related = related_products(product)
+    return {
+        'product': product,
+        'default_variant': variants[0] if variants else None,
+        'reviews': reviews,
+        'review_stats': ProductReviewStats.for_product(product),
+        'next_reviews_url': page_url(product, DEFAULT_SORT, next_cursor),
+        'similar_products': related['similar'],
+        'bought_together': related['bought_together'],
+        'variant_options': option_map(variants),
+        'variant_data_json': json.dumps(variant_data(variants)),
+    }
+
+
+def _lookup(slug):
+    ids = Product.objects.filter(slug=slug, available=True).values_list('id', 'category_id').first()
+    if ids is None:
+        raise Http404('No Product matches the given query.')
+    return ids
+
+
+def get_payload(slug):
+    """The cached payload for the available product `slug`, building it on a miss."""
+    slug_key = f'page-slug:{slug}'
+    product_id, category_id = caching.get_or_build('product-slug', slug_key, lambda: _lookup(slug), _timeout())
+
+    # Versions are read before building, so a change made while building
+    # leaves this payload under an already outdated key.
+    key = make_key(
+        'product-page', product_id,
+        depends_on=[('product', product_id), ('category', category_id), 'pricing-rules'],
+    )
+    try:
+        payload = caching.get_or_build('product-page', key, lambda: build_payload(product_id), _timeout())
+    except Http404:
+        caching.delete(slug_key)
+        raise
+    if payload['product'].slug != slug or payload['product'].category_id != category_id:
+        # Renamed or moved since the slug was looked up.
+        caching.delete(slug_key)
+        return get_payload(slug)
+    return payload
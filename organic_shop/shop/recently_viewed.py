@@ -0,0 +1,107 @@
+"""
+Recently viewed products, per user or per session.
+
+Each shopper has a small most-recent-first list. Entries carry everything
+the "Recently Viewed" strip shows, so rendering it costs no queries; they
+are refreshed whenever the product is viewed again. Logged-in users keep
+their list in the cache, across devices. Anonymous visitors keep theirs in
+the session itself, so a visitor gets a session only once there is a view
+to record, and the list survives the key change at login, when it is
+merged into the user's list.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .images import rendition_url
+
+DEFAULT_SIZE = 5
+DEFAULT_TIMEOUT = 60 * 60 * 24 * 30
+SESSION_KEY = 'recently_viewed'
+
+RecentProduct = namedtuple('RecentProduct', 'id name slug price original_price image_url')
+
+
+def _size():
+    return getattr(settings, 'RECENTLY_VIEWED_SIZE', DEFAULT_SIZE)
+
+
+def _cache_key(user):
+    return f'recently-viewed:user:{user.pk}'
+
+
+def _from_session(request):
+    # Sessions are JSON, so prices are stored as strings.
+    return [
+        RecentProduct(id, name, slug, Decimal(price), original_price and Decimal(original_price), image_url)
+        for id, name, slug, price, original_price, image_url in request.session.get(SESSION_KEY, ())
+    ]
+
+
+def _to_session(entries):
+    return [
+        [e.id, e.name, e.slug, str(e.price), e.original_price and str(e.original_price), e.image_url]
+        for e in entries
+    ]
+
+
+def _merge(*lists):
+    seen = set()
+    merged = []
+    for entry in (entry for entries in lists for entry in entries):
+        if entry.id not in seen:
+            seen.add(entry.id)
+            merged.append(entry)
+    return merged[:_size()]
+
+
+def _load(request):
+    """(entries, entries carried over from before login) for the shopper."""
+    anonymous = _from_session(request)
+    if not request.user.is_authenticated:
+        return anonymous, []
+    entries = [RecentProduct(*entry) for entry in cache.get(_cache_key(request.user), ())]
+    return _merge(anonymous, entries), anonymous
+
+
+def entry_for(product, default_variant=None):
+    """Builds the display tuple for a product from objects already loaded."""
+    from .pricing import unit_price
+
+    original_price = (default_variant or product).price
+    price = unit_price(product, default_variant)
+    if price >= original_price:
+        original_price = None
+    image = default_variant.image if default_variant and default_variant.image else product.image
+    return RecentProduct(product.pk, product.name, product.slug, price, original_price,
+                         rendition_url(image, 'card'))
+
+
+def get_recent(request, exclude=None):
+    """The shopper's recently viewed products, newest first."""
+    entries, _ = _load(request)
+    return [entry for entry in entries if entry.id != exclude]
+
+
+def record_view(request, product, default_variant=None):
+    """
+    Moves `product` to the front of the shopper's list, evicting the oldest
+    entry once the list is full. Returns the updated list.
+    """
+    entries, carried_over = _load(request)
+    entry = entry_for(product, default_variant)
+    if entries and entries[0] == entry and not carried_over:
+        return entries
+
+    updated = _merge([entry], entries)
+    if request.user.is_authenticated:
+        # Stored as plain tuples, which pickle smaller than namedtuples.
+        cache.set(_cache_key(request.user), [tuple(e) for e in updated],
+                  getattr(settings, 'RECENTLY_VIEWED_TIMEOUT', DEFAULT_TIMEOUT))
+        if carried_over:
+            del request.session[SESSION_KEY]
+    else:
+        request.session[SESSION_KEY] = _to_session(updated)
+    return updated
@@ -0,0 +1,263 @@
+"""
+Precomputed "similar" and "frequently bought together" products.
+
+`refresh()` builds sparse product × feature matrices and scores every pair
+of products at once:
+
+* similar: same category, shared variant values (cosine) and being wished
+  for by the same users (cosine);
+* bought together: appearing in the same orders, normalised by how often
+  each product sells so best-sellers do not show up everywhere.
+
+The top RECOMMENDATIONS_TOP_K related products per kind are stored in
+ProductRecommendation, which `related_products()` reads with one query.
+
+New orders and wishlist entries queue a `recommendations.refresh` job,
+RECOMMENDATIONS_REFRESH_DELAY seconds out, and every change until it runs
+rides on the same job. That job rescores and rewrites only the products
+changed since the last run, but it still loads the whole catalog and
+every order line and wishlist entry to do so: its reads cost as much as a
+full rebuild, hence the delay. Run `compute_recommendations` periodically
+(e.g. nightly) for a full rebuild, which also picks up new products and
+normalisation drift in products that were not touched.
+
+NumPy and SciPy are only needed by the worker computing the table.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max, Prefetch
+from django.utils import timezone
+
+from .cards import prepare_cards
+from .invalidation import products_changed
+from .jobs import enqueue, handler
+from .models import Product, ProductRecommendation, ProductVariant
+
+DEFAULT_TOP_K = 8
+DISPLAY_LIMIT = 4
+BATCH_SIZE = 2000
+DEFAULT_REFRESH_DELAY = 10 * 60
+
+SIMILAR_WEIGHTS = {
+    'category': 1.0,
+    'values': 1.0,
+    'wishlist': 0.5,
+}
+
+
+def _top_k():
+    return getattr(settings, 'RECOMMENDATIONS_TOP_K', DEFAULT_TOP_K)
+
+
+def _incidence(pairs, row_index, shape_rows):
+    """Binary sparse matrix with a 1 at (row_index[product], column) for each pair."""
+    import numpy as np
+    from scipy import sparse
+
+    columns = {}
+    rows, cols = [], []
+    for product_id, key in pairs:
+        row = row_index.get(product_id)
+        if row is None:
+            continue
+        rows.append(row)
+        cols.append(columns.setdefault(key, len(columns)))
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+        shape=(shape_rows, max(len(columns), 1)),
+    )
+    matrix.data[:] = 1  # duplicates were summed
+    return matrix
+
+
+def _normalize_rows(matrix):
+    import numpy as np
+    from scipy import sparse
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+
+def build_matrices():
+    """Loads the catalog and interaction data as sparse matrices."""
+    import numpy as np
+    from accounts.models import OrderItem, Wishlist
+
+    products = list(Product.objects.values_list('id', 'category_id', 'available', 'sold_count').order_by('id'))
+    ids = np.array([p[0] for p in products], dtype=np.int64)
+    row_index = {product_id: row for row, product_id in enumerate(ids.tolist())}
+    n = len(ids)
+
+    category = _incidence(((p[0], p[1]) for p in products), row_index, n)
+    values = _incidence(
+        ProductVariant.values.through.objects.values_list('productvariant__product_id', 'variantvalue_id'),
+        row_index, n,
+    )
+    wishlist = _incidence(Wishlist.objects.values_list('product_id', 'user_id'), row_index, n)
+    orders = _incidence(
+        OrderItem.objects.filter(product__isnull=False).values_list('product_id', 'order_id'),
+        row_index, n,
+    )
+
+    available = np.array([p[2] for p in products], dtype=bool)
+    popularity = np.array([p[3] for p in products], dtype=np.float64)
+    return {
+        'ids': ids,
+        'row_index': row_index,
+        'available': available,
+        'popularity': popularity,
+        'category': category,
+        'values': _normalize_rows(values),
+        'wishlist': _normalize_rows(wishlist),
+        'orders': orders,
+    }
+
+
+def score_rows(data, rows):
+    """Similar and bought-together score matrices for the given row numbers."""
+    import numpy as np
+    from scipy import sparse
+
+    rows = np.asarray(rows)
+    similar = (
+        SIMILAR_WEIGHTS['category'] * (data['category'][rows] @ data['category'].T)
+        + SIMILAR_WEIGHTS['values'] * (data['values'][rows] @ data['values'].T)
+        + SIMILAR_WEIGHTS['wishlist'] * (data['wishlist'][rows] @ data['wishlist'].T)
+    )
+
+    orders = data['orders']
+    co_occurrence = orders[rows] @ orders.T
+    degree = np.asarray(orders.sum(axis=1)).ravel()
+    degree[degree == 0] = 1
+    inv_sqrt = 1 / np.sqrt(degree)
+    bought_together = sparse.diags(inv_sqrt[rows]) @ co_occurrence @ sparse.diags(inv_sqrt)
+
+    # Only available products are recommended, and never the product itself.
+    candidates = sparse.diags(data['available'].astype(np.float32))
+    itself = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (np.arange(len(rows)), rows)), shape=similar.shape
+    )
+    result = {}
+    for kind, matrix in (('similar', similar), ('bought_together', bought_together)):
+        matrix = (matrix @ candidates).tocsr()
+        matrix = (matrix - matrix.multiply(itself)).tocsr()
+        matrix.eliminate_zeros()
+        result[kind] = matrix
+    return result
+
+
+def top_related(matrix, popularity, k):
+    """Yields (row, columns, scores) with the k best columns of each row, best first."""
+    import numpy as np
+
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        if start == end:
+            continue
+        columns = matrix.indices[start:end]
+        scores = matrix.data[start:end]
+        # Ties (e.g. plain category matches) go to the better seller.
+        order = np.lexsort((-popularity[columns], -scores))[:k]
+        yield row, columns[order], scores[order]
+
+
+def refresh(product_ids=None):
+    """
+    Recomputes and stores recommendations for `product_ids`, or for every
+    product. Returns the number of rows written. The matrices are built
+    from everything either way; only the scoring and the writes are scoped.
+    """
+    import numpy as np
+
+    computed_at = timezone.now()
+    data = build_matrices()
+    ids, row_index = data['ids'], data['row_index']
+    if product_ids is None:
+        targets = np.arange(len(ids))
+    else:
+        targets = np.array(sorted(row_index[p] for p in product_ids if p in row_index), dtype=np.int64)
+
+    k = _top_k()
+    written = 0
+    for start in range(0, len(targets), BATCH_SIZE):
+        batch = targets[start:start + BATCH_SIZE]
+        recommendations = []
+        for kind, matrix in score_rows(data, batch).items():
+            for row, columns, scores in top_related(matrix, data['popularity'], k):
+                product_id = int(ids[batch[row]])
+                recommendations.extend(
+                    ProductRecommendation(
+                        product_id=product_id, kind=kind, rank=rank, related_id=int(ids[column]),
+                        score=float(score), computed_at=computed_at,
+                    )
+                    for rank, (column, score) in enumerate(zip(columns, scores))
+                )
+        with transaction.atomic():
+            ProductRecommendation.objects.filter(product_id__in=ids[batch].tolist()).delete()
+            ProductRecommendation.objects.bulk_create(recommendations, batch_size=1000)
+        written += len(recommendations)
+        products_changed(*ids[batch].tolist())
+    return written
+
+
+def changed_products(since):
+    """Products in orders placed, or wishlists changed, since `since`."""
+    from accounts.models import OrderItem, Wishlist
+
+    changed = set(
+        OrderItem.objects.filter(order__created_at__gte=since, product__isnull=False)
+        .values_list('product_id', flat=True)
+    )
+    changed.update(Wishlist.objects.filter(added_at__gte=since).values_list('product_id', flat=True))
+    return changed
+
+
+@handler('recommendations.refresh')
+def refresh_job(full=False):
+    since = ProductRecommendation.objects.aggregate(last=Max('computed_at'))['last']
+    if full or since is None:
+        refresh()
+        return
+    changed = changed_products(since)
+    if changed:
+        refresh(changed)
+
+
+def queue_refresh():
+    """Queues a refresh of the changed products, unless one is already waiting to run."""
+    delay = getattr(settings, 'RECOMMENDATIONS_REFRESH_DELAY', DEFAULT_REFRESH_DELAY)
+    # Checkout saves one OrderItem per line; the cache flag keeps that from
+    # turning into an INSERT attempt per line while the job waits.
+    if cache.add('recommendations-queued', 1, delay):
+        enqueue('recommendations.refresh', key='incremental', delay=delay)
+
+
+def related_products(product, limit=DISPLAY_LIMIT):
+    """
+    {'similar': [...], 'bought_together': [...]} for a product page, prepared
+    as cards (see `shop.cards`). Falls back to best sellers of the same
+    category while the product has no stored recommendations yet.
+    """
+    rows = list(
+        ProductRecommendation.objects.filter(product=product, rank__lt=limit, related__available=True)
+        .select_related('related')
+        .prefetch_related(Prefetch('related__variants', queryset=ProductVariant.objects.order_by('-stock')))
+        .order_by('kind', 'rank')
+    )
+    prepare_cards([row.related for row in rows])
+    related = defaultdict(list)
+    for row in rows:
+        related[row.kind].append(row.related)
+
+    if not related['similar']:
+        related['similar'] = prepare_cards(
+            Product.objects.filter(category_id=product.category_id, available=True)
+            .exclude(pk=product.pk)
+            .prefetch_related(Prefetch('variants', queryset=ProductVariant.objects.order_by('-stock')))
+            .order_by('-sold_count', '-id')[:limit]
+        )
+    return {'similar': related['similar'], 'bought_together': related['bought_together']}
@@ -0,0 +1,162 @@
+"""
+Review totals and review pages.
+
+Keeps ProductReviewStats in step with Review.
+
+Every create, edit and delete adjusts the counters with F() expression
+UPDATEs inside the review's own transaction (Review.save and deletion are
+atomic), so the totals move with the review table and concurrent reviews on
+the same product do not overwrite each other. The receivers live in
+`shop.signals`.
+
+Review lists are paged with keyset cursors (`review_page`): each page
+continues after the last review shown in the chosen order, so deep pages
+cost the same as the first and new reviews never shift or repeat rows.
+"""
+import base64
+import binascii
+import json
+from collections import defaultdict
+from datetime import datetime
+
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from .invalidation import products_changed
+from .models import ProductReviewStats, Review
+
+
+def _adjust(product_id, rating, sign):
+    if sign > 0:
+        # Removals never create a row: the product may be mid-deletion.
+        ProductReviewStats.objects.get_or_create(product_id=product_id)
+    rating = int(rating)
+    ProductReviewStats.objects.filter(product_id=product_id).update(**{
+        'review_count': F('review_count') + sign,
+        'rating_sum': F('rating_sum') + sign * rating,
+        f'rating_{rating}': F(f'rating_{rating}') + sign,
+    })
+
+
+def _refresh_average(product_id):
+    stats = ProductReviewStats.objects.filter(product_id=product_id)
+    stats.filter(review_count=0).update(average_rating=0)
+    stats.filter(review_count__gt=0).update(
+        average_rating=Cast('rating_sum', FloatField()) / Cast('review_count', FloatField())
+    )
+
+
+def apply_change(old=None, new=None):
+    """
+    Applies one review change to the stats. `old` and `new` are
+    (product_id, rating) before and after; None for a create or delete.
+    """
+    if old == new:
+        return
+    if old is not None:
+        _adjust(old[0], old[1], -1)
+    if new is not None:
+        _adjust(new[0], new[1], 1)
+    for product_id in {change[0] for change in (old, new) if change is not None}:
+        _refresh_average(product_id)
+
+
+def rebuild(product_ids=None):
+    """Recomputes stats from the review table (all products, or `product_ids`)."""
+    totals = defaultdict(lambda: [0] * 6)
+    reviews = Review.objects.all()
+    if product_ids is not None:
+        reviews = reviews.filter(product_id__in=product_ids)
+    for product_id, rating in reviews.values_list('product_id', 'rating').iterator():
+        totals[product_id][int(rating)] += 1
+
+    stale = ProductReviewStats.objects.all()
+    if product_ids is not None:
+        stale = stale.filter(product_id__in=product_ids)
+    stale = stale.exclude(product_id__in=list(totals))
+    emptied = list(stale.values_list('product_id', flat=True))
+    stale.delete()
+
+    for product_id, counts in totals.items():
+        count = sum(counts)
+        rating_sum = sum(stars * n for stars, n in enumerate(counts))
+        ProductReviewStats.objects.update_or_create(product_id=product_id, defaults={
+            'review_count': count,
+            'rating_sum': rating_sum,
+            **{f'rating_{stars}': counts[stars] for stars in range(1, 6)},
+            'average_rating': rating_sum / count,
+        })
+    products_changed(*totals, *emptied)
+
+
+# Sort name -> [(field, descending)]; the trailing id makes every key unique.
+SORTS = {
+    'newest': [('created_at', True), ('id', True)],
+    'helpful': [('helpful_count', True), ('created_at', True), ('id', True)],
+    'rating_high': [('rating', True), ('created_at', True), ('id', True)],
+    'rating_low': [('rating', False), ('created_at', True), ('id', True)],
+}
+DEFAULT_SORT = 'newest'
+PAGE_SIZE = 10
+
+
+def encode_cursor(review, sort):
+    values = []
+    for field, _ in SORTS[sort]:
+        value = getattr(review, field)
+        values.append(value.isoformat() if isinstance(value, datetime) else value)
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """The key values of a cursor, or None if it is malformed."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        fields = SORTS[sort]
+        if not isinstance(values, list) or len(values) != len(fields):
+            return None
+        return [
+            datetime.fromisoformat(value) if field == 'created_at' else int(value)
+            for (field, _), value in zip(fields, values)
+        ]
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        return None
+
+
+def _after(sort, values):
+    """Q matching rows that come after `values` in `sort` order."""
+    fields = SORTS[sort]
+    condition = Q()
+    for i, (field, descending) in enumerate(fields):
+        step = Q(**{f'{field}__lt' if descending else f'{field}__gt': values[i]})
+        for j in range(i):
+            step &= Q(**{fields[j][0]: values[j]})
+        condition |= step
+    return condition
+
+
+def review_page(product, sort=DEFAULT_SORT, cursor=None, limit=PAGE_SIZE):
+    """
+    One page of a product's reviews as (reviews, next_cursor); next_cursor
+    is None on the last page. An unknown sort or broken cursor starts over
+    from the first page of the default order.
+    """
+    if sort not in SORTS:
+        sort = DEFAULT_SORT
+    reviews = Review.objects.filter(product=product).select_related('user')
+    values = decode_cursor(cursor, sort) if cursor else None
+    if values is not None:
+        reviews = reviews.filter(_after(sort, values))
+    ordering = [f'-{field}' if descending else field for field, descending in SORTS[sort]]
+    page = list(reviews.order_by(*ordering)[:limit + 1])
+    next_cursor = encode_cursor(page[limit - 1], sort) if len(page) > limit else None
+    return page[:limit], next_cursor
+
+
+def page_url(product, sort, cursor):
+    """URL of the review page after `cursor`; '' when there is none."""
+    if cursor is None:
+        return ''
+    return f"{reverse('shop:product_reviews', args=[product.id])}?{urlencode({'sort': sort, 'after': cursor})}"
@@ -0,0 +1,93 @@
+"""
+Read-replica routing for catalog traffic.
+
+Reads of catalog models (categories, products, variants, images, reviews)
+go to one of settings.REPLICA_DATABASES; everything else, and every write,
+goes to 'default'. As soon as a request writes anything it is pinned to the
+primary, so a shopper who just changed their cart or placed an order reads
+their own writes. ReplicaPinningMiddleware carries the pin over to the
+redirect that follows a POST.
+"""
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import connections
+
+CATALOG_MODELS = {
+    ('shop', 'category'),
+    ('shop', 'product'),
+    ('shop', 'productimage'),
+    ('shop', 'variantoption'),
+    ('shop', 'variantvalue'),
+    ('shop', 'productvariant'),
+    ('shop', 'productvariant_values'),
+    ('shop', 'review'),
+    ('shop', 'productrecommendation'),
+}
+
+_pinned = contextvars.ContextVar('pinned_to_primary', default=False)
+
+
+def pin_to_primary():
+    _pinned.set(True)
+
+
+def unpin():
+    _pinned.set(False)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+def start_request(pinned=False):
+    """Sets the pin for a new request; returns a token for `end_request`."""
+    return _pinned.set(pinned)
+
+
+def end_request(token):
+    _pinned.reset(token)
+
+
+def read_only_view(view_func):
+    """
+    Marks a view that uses POST only as transport (e.g. JSON lookups) so it
+    can still read from replicas and does not pin the shopper to the primary.
+    """
+    view_func.replica_read_only = True
+    return view_func
+
+
+def replica_aliases():
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+
+class CatalogReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        replicas = replica_aliases()
+        if (
+            not replicas
+            or _pinned.get()
+            or (model._meta.app_label, model._meta.model_name) not in CATALOG_MODELS
+            or connections['default'].in_atomic_block
+        ):
+            return 'default'
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        _pinned.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary.
+        if db in replica_aliases():
+            return False
+        return None
@@ -0,0 +1,129 @@
+"""
+Session engine for a mostly-anonymous storefront.
+
+Sessions live in the cache (SESSION_CACHE_ALIAS) as the signed, compressed
+string Django would store in the database, not as a pickled dict. Only
+sessions worth keeping across a cache flush are also written to the
+django_session table: those that belong to a logged-in user or that own an
+anonymous cart (see `mark_persistent`). Browsing alone never touches the
+database.
+
+A save is skipped entirely when the session data is byte-for-byte what was
+loaded, e.g. when a shopper re-opens a product that is already first in
+their recently-viewed list. Expiry therefore counts from the last change.
+"""
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.contrib.sessions.backends.base import CreateError, UpdateError
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.db import DatabaseError, IntegrityError, router, transaction
+
+PERSIST_KEY = '_persist'
+AUTH_KEY = '_auth_user_id'
+
+
+def mark_persistent(session):
+    """Flags a session as worth keeping in the database (it owns a cart)."""
+    if not session.get(PERSIST_KEY):
+        session[PERSIST_KEY] = True
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = 'shop.sessions.'
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self._loaded_digest = None
+
+    def _digest(self, data):
+        return hashlib.blake2b(self.serializer().dumps(data), digest_size=16).digest()
+
+    @staticmethod
+    def needs_persistence(data):
+        return bool(data.get(PERSIST_KEY) or data.get(AUTH_KEY))
+
+    def load(self):
+        try:
+            encoded = self._cache.get(self.cache_key)
+        except Exception:
+            # Invalid keys raise on some backends; treat as a new session.
+            encoded = None
+
+        if encoded is not None:
+            data = self.decode(encoded)
+        else:
+            stored = self._get_session_from_db()
+            if not stored:
+                self._loaded_digest = None
+                return {}
+            data = self.decode(stored.session_data)
+            self._cache.set(self.cache_key, stored.session_data, self.get_expiry_age(expiry=stored.expire_date))
+
+        self._loaded_digest = self._digest(data)
+        return data
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+
+        data = self._get_session(no_load=must_create)
+        if not must_create and self._loaded_digest is not None and self._digest(data) == self._loaded_digest:
+            return
+
+        encoded = self.encode(data)
+        expiry = self.get_expiry_age()
+        if must_create:
+            if not self._cache.add(self.cache_key, encoded, expiry):
+                raise CreateError
+        else:
+            self._cache.set(self.cache_key, encoded, expiry)
+
+        if self.needs_persistence(data):
+            self._save_to_db(encoded, must_create)
+        self._loaded_digest = self._digest(data)
+
+    def _save_to_db(self, encoded, must_create):
+        obj = self.model(session_key=self._get_or_create_session_key(), session_data=encoded,
+                         expire_date=self.get_expiry_date())
+        using = router.db_for_write(self.model, instance=obj)
+        try:
+            with transaction.atomic(using=using):
+                # A plain save() inserts the row the first time a cache-only
+                # session becomes worth persisting and updates it afterwards.
+                obj.save(force_insert=must_create, using=using)
+        except IntegrityError:
+            if must_create:
+                raise CreateError
+            raise
+        except DatabaseError:
+            if not must_create:
+                raise UpdateError
+            raise
+
+    def exists(self, session_key):
+        return bool(session_key) and (
+            (self.cache_key_prefix + session_key) in self._cache
+            or self.model.objects.filter(session_key=session_key).exists()
+        )
+
+    # The inherited async variants store a pickled dict in the cache; route
+    # them through the sync implementations above to keep one format.
+
+    async def aload(self):
+        return await sync_to_async(self.load)()
+
+    async def asave(self, must_create=False):
+        return await sync_to_async(self.save)(must_create)
+
+    async def aexists(self, session_key):
+        return await sync_to_async(self.exists)(session_key)
+
+    async def adelete(self, session_key=None):
+        return await sync_to_async(self.delete)(session_key)
+
+    async def acreate(self):
+        return await sync_to_async(self.create)()
+
+    async def aflush(self):
+        return await sync_to_async(self.flush)()
@@ -0,0 +1,144 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from accounts.models import Order, OrderItem, PromoCode, Wishlist
+from accounts.promotions import invalidate as invalidate_promo_codes
+from accounts.stats import invalidate as invalidate_profile_counts
+
+from .events import publish_stock, subscriber_count
+from .images import queue_processing
+from .invalidation import categories_changed, products_changed
+from .models import Category, PriceRule, Product, ProductImage, ProductVariant, Review, VariantValue
+from .pricing import invalidate as invalidate_price_rules
+from .recommendations import queue_refresh
+from .reviews import apply_change
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_save, sender=Category)
+def queue_image_processing(sender, instance, update_fields=None, **kwargs):
+    """Hands new uploads to the job worker so the save itself stays fast."""
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    queue_processing(instance.image)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_save, sender=Wishlist)
+def queue_recommendations_refresh(sender, instance, created, **kwargs):
+    if created:
+        queue_refresh()
+
+
+@receiver(post_save, sender=ProductVariant)
+def publish_variant_stock(sender, instance, **kwargs):
+    if subscriber_count(instance.product_id):
+        transaction.on_commit(lambda: publish_stock(instance.product, instance))
+
+
+@receiver(post_save, sender=Product)
+def publish_product_stock(sender, instance, **kwargs):
+    if subscriber_count(instance.id):
+        transaction.on_commit(lambda: publish_stock(instance))
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, raw=False, **kwargs):
+    instance._previous_rating = None
+    if instance.pk and not raw:
+        instance._previous_rating = (
+            Review.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+        )
+
+
+@receiver(post_save, sender=Review)
+def update_stats_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    apply_change(getattr(instance, '_previous_rating', None), (instance.product_id, int(instance.rating)))
+
+
+@receiver(post_delete, sender=Review)
+def update_stats_on_delete(sender, instance, **kwargs):
+    apply_change((instance.product_id, int(instance.rating)), None)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    products_changed(instance.pk)
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_parent_product(sender, instance, **kwargs):
+    products_changed(instance.product_id)
+
+
+@receiver(m2m_changed, sender=ProductVariant.values.through)
+def invalidate_on_variant_values(sender, instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # Changed from the VariantValue side; every product using it may show it.
+        products_changed(*set(ProductVariant.objects.filter(values=instance).values_list('product_id', flat=True)))
+    else:
+        products_changed(instance.product_id)
+
+
+@receiver(post_save, sender=VariantValue)
+@receiver(pre_delete, sender=VariantValue)
+def invalidate_on_variant_value(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    products_changed(*set(ProductVariant.objects.filter(values=instance).values_list('product_id', flat=True)))
+
+
+@receiver(post_save, sender=Category)
+def propagate_category_visibility(sender, instance, raw=False, **kwargs):
+    """Shows or hides all of the category's products in one UPDATE."""
+    if raw:
+        return
+    Product.objects.filter(category=instance).exclude(category_active=instance.is_active).update(
+        category_active=instance.is_active
+    )
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category(sender, instance, **kwargs):
+    categories_changed(instance.pk)
+
+
+@receiver(post_save, sender=PromoCode)
+@receiver(post_delete, sender=PromoCode)
+def reload_promo_codes(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_promo_codes)
+
+
+@receiver(post_save, sender=PriceRule)
+@receiver(post_delete, sender=PriceRule)
+def recompile_price_rules(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_price_rules)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=Review)
+@receiver(post_save, sender=Wishlist)
+def count_for_profile(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        transaction.on_commit(lambda: invalidate_profile_counts(instance.user_id))
+
+
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=Review)
+@receiver(post_delete, sender=Wishlist)
+def uncount_for_profile(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_profile_counts(instance.user_id))
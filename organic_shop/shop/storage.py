@@ -0,0 +1,91 @@
+import gzip
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip siblings are written without it
+    brotli = None
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage that also writes `.gz` (and `.br` when the brotli
+    package is installed) next to every hashed text asset at collectstatic
+    time, so the server never compresses on the fly.
+
+    `url()` is memoised per name: after the first lookup a `{% static %}`
+    call is a single dict hit. Names missing from the manifest (assets added
+    since the last collectstatic, or a test run without one) fall back to
+    their plain URL instead of raising.
+    """
+    manifest_strict = False
+    compressible_extensions = {
+        '.css', '.js', '.map', '.json', '.svg', '.txt', '.xml', '.html',
+        '.ico', '.ttf', '.otf', '.eot',
+    }
+    min_compress_size = 256
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._url_cache = {}
+
+    def url(self, name, force=False):
+        if settings.DEBUG and not force:
+            return super().url(name, force)
+        key = (name, force)
+        try:
+            return self._url_cache[key]
+        except KeyError:
+            pass
+        url = super().url(name, force)
+        self._url_cache[key] = url
+        return url
+
+    def hashed_name(self, name, content=None, filename=None):
+        try:
+            return super().hashed_name(name, content, filename)
+        except ValueError:
+            # The file is not in STATIC_ROOT (e.g. vendor.css points at images
+            # that were never shipped): keep the plain name rather than
+            # aborting collectstatic or the page render.
+            if content is not None:
+                raise
+            return name
+
+    def load_manifest(self):
+        self._url_cache = {}
+        return super().load_manifest()
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed.add(hashed_name)
+            yield name, hashed_name, processed
+
+        if dry_run:
+            return
+        for hashed_name in sorted(hashed):
+            if os.path.splitext(hashed_name)[1].lower() in self.compressible_extensions:
+                self._write_compressed(hashed_name)
+
+    def _write_compressed(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as fh:
+            data = fh.read()
+        if len(data) < self.min_compress_size:
+            return
+
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(compressed) < len(data):
+            with open(path + '.gz', 'wb') as fh:
+                fh.write(compressed)
+
+        if brotli is not None:
+            compressed = brotli.compress(data, quality=11)
+            if len(compressed) < len(data):
+                with open(path + '.br', 'wb') as fh:
+                    fh.write(compressed)
@@ -1,20 +1,7 @@
 # shop/signals.py
-from django.db.models.signals import post_save
 from django.contrib.auth.signals import user_logged_in
 from django.dispatch import receiver
-from .models import Category, Cart
-
-@receiver(post_save, sender=Category)
-def update_products_on_category_change(sender, instance, **kwargs):
-    """
-    When a Category is activated/deactivated,
-    update all its products accordingly.
-    """
-    if instance.is_active:
-        instance.products.update(is_active=True)
-    else:
-        instance.products.update(is_active=False)
-
+from .models import Cart
 
 @receiver(user_logged_in)
 def merge_session_cart_on_login(sender, request, user, **kwargs):
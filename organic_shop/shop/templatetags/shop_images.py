@@ -0,0 +1,55 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from shop.images import RENDITION_SIZES, get_manifest, rendition_url, srcset
+
+register = template.Library()
+
+
+@register.simple_tag
+def image_url(image, rendition='card', fmt='jpeg'):
+    """
+    URL of a single rendition, for places that swap `src` from JavaScript.
+
+        <img src="{% image_url product.image 'detail' %}">
+    """
+    return rendition_url(image, rendition, fmt)
+
+
+@register.simple_tag
+def responsive_image(image, rendition='card', **attrs):
+    """
+    Renders a <picture> with WebP and JPEG srcsets for an image field.
+    Extra keyword arguments become attributes of the <img>.
+
+        {% responsive_image product.image 'card' class="card-img-top" alt=product.name loading="lazy" %}
+    """
+    if not image or not image.name:
+        return ''
+
+    manifest = get_manifest(image)
+    if manifest is None:
+        return format_html('<img src="{}" {}>', image.url, _attrs(attrs))
+
+    # The average colour shows while the file loads; the BlurHash is there
+    # for scripts that want to paint a proper placeholder.
+    attrs['style'] = f"background-color: {manifest.get('color', 'transparent')}; {attrs.get('style', '')}".strip()
+    attrs['data_blurhash'] = manifest.get('blurhash', '')
+
+    selected = manifest['renditions'][rendition]
+    sizes = RENDITION_SIZES[rendition]
+    # `display: contents` keeps <picture> out of layout so existing img
+    # classes (h-100, object-fit-cover, ...) size against the same parent.
+    return format_html(
+        '<picture style="display: contents">'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" {}>'
+        '</picture>',
+        srcset(manifest, 'webp', image.storage), sizes,
+        image.storage.url(selected['files']['jpeg']), srcset(manifest, 'jpeg', image.storage), sizes,
+        selected['width'], selected['height'], _attrs(attrs),
+    )
+
+
+def _attrs(attrs):
+    return format_html_join(' ', '{}="{}"', ((k.replace('_', '-'), v) for k, v in attrs.items()))
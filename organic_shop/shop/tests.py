@@ -1,3 +1,508 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore as DBSessionStore
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.template import TemplateSyntaxError
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from accounts.models import PromoCode
+
+from . import events
+from .management.commands.explain_queries import Command as ExplainQueries
+from .caching import acquire_lock, release_lock
+from .events import stock_event
+from .images import normalize_source, process_image, queue_processing, rendition_url
+from .invalidation import bump, version
+from .middleware import StaticAssetMiddleware
+from .models import Cart, Category, Job, PriceRule, Product, ProductReviewStats, Review
+from .pricing import Item, RuleSet, invalidate, price_items, unit_price
+from .recently_viewed import SESSION_KEY, get_recent
+from .recommendations import queue_refresh
+from .reviews import SORTS, decode_cursor, encode_cursor, rebuild, review_page
+from .sessions import AUTH_KEY, SessionStore, mark_persistent
+from .utils import allocate_identifier, save_with_identifier
+from .warmup import warm_on_startup
+
+class ProductDetailPriceTests(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name='Fruit', image='categories/fruit.jpg')
+        self.product = Product.objects.create(
+            category=category, name='Mango', description='Ripe.', price=Decimal('100.00'),
+            image='products/mango.jpg', stock=5,
+        )
+        PriceRule.objects.create(name='Storewide', percent_off=Decimal('10'))
+        invalidate()
+
+    def test_shows_rule_price(self):
+        response = self.client.get(reverse('shop:product_detail', args=[self.product.slug]))
+        self.assertContains(response, '₹90.00')
+        self.assertContains(response, 'Save 10%')
+        self.assertNotContains(response, '₹None')
+
+    def test_prices_the_product_once_per_render(self):
+        with mock.patch('shop.pricing.unit_price', wraps=unit_price) as priced:
+            self.client.get(reverse('shop:product_detail', args=[self.product.slug]))
+        # Once for the page, once for the recently viewed entry.
+        self.assertEqual(priced.call_count, 2)
+
+
+class BuildLockTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        file_cache = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory.name}
+        override = override_settings(CACHES={**settings.CACHES, 'default': file_cache})
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_file_cache_lock_is_exclusive(self):
+        self.assertTrue(acquire_lock('build:lock', 30))
+        self.assertFalse(acquire_lock('build:lock', 30))
+        release_lock('build:lock')
+        self.assertTrue(acquire_lock('build:lock', 30))
+        release_lock('build:lock')
+
+    def test_bump_moves_version_on(self):
+        before = version('catalog')
+        bump('catalog')
+        self.assertGreater(version('catalog'), before)
+
+
+class WarmOnStartupTests(TestCase):
+
+    @override_settings(WARM_CACHES_ON_STARTUP=True)
+    def test_errors_do_not_fail_startup(self):
+        with mock.patch('shop.warmup.warm', side_effect=TemplateSyntaxError('broken')), \
+                self.assertLogs('shop.warmup', 'ERROR'):
+            warm_on_startup()
+
+
+class StaticAssetMiddlewareTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        root = Path(directory.name)
+        (root / 'app.css').write_text('body { color: green; }' * 20)
+        (root / 'app.css.gz').write_bytes(gzip.compress((root / 'app.css').read_bytes()))
+        override = override_settings(STATIC_ROOT=directory.name, STATIC_URL='/static/', SERVE_STATIC=True)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.middleware = StaticAssetMiddleware(lambda request: None)
+
+    def get(self, **headers):
+        response = self.middleware(RequestFactory().get('/static/app.css', headers=headers))
+        self.addCleanup(response.close)
+        return response
+
+    def test_codings_have_their_own_etag(self):
+        plain = self.get()
+        gzipped = self.get(accept_encoding='gzip, br;q=0')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertNotEqual(plain['ETag'], gzipped['ETag'])
+        self.assertEqual(self.get(accept_encoding='gzip', if_none_match=gzipped['ETag']).status_code, 304)
+        self.assertEqual(self.get(if_none_match=gzipped['ETag']).status_code, 200)
+
+    def test_refused_coding_is_not_sent(self):
+        self.assertNotIn('Content-Encoding', self.get(accept_encoding='gzip;q=0'))
+        self.assertNotIn('Content-Encoding', self.get(accept_encoding='*, gzip;q=0'))
+        self.assertEqual(self.get(accept_encoding='*')['Content-Encoding'], 'gzip')
+
+
+class SessionPersistenceTests(TestCase):
+
+    def test_browsing_stays_in_the_cache(self):
+        session = SessionStore()
+        session['recently_viewed'] = [1, 2]
+        session.save()
+        self.assertFalse(Session.objects.filter(session_key=session.session_key).exists())
+        self.assertEqual(SessionStore(session.session_key)['recently_viewed'], [1, 2])
+
+    def test_cart_and_login_sessions_are_written_through(self):
+        cart_session = SessionStore()
+        mark_persistent(cart_session)
+        cart_session.save()
+        login_session = SessionStore()
+        login_session[AUTH_KEY] = '1'
+        login_session.save()
+        self.assertEqual(
+            Session.objects.filter(session_key__in=[cart_session.session_key, login_session.session_key]).count(), 2
+        )
+
+    def test_unchanged_session_is_not_saved_again(self):
+        session = SessionStore()
+        mark_persistent(session)
+        session.save()
+        reloaded = SessionStore(session.session_key)
+        reloaded.load()
+        with self.assertNumQueries(0):
+            reloaded.save()
+
+
+class SweepSessionsTests(TestCase):
+
+    def old_engine_session(self, **data):
+        # As django.contrib.sessions.backends.db wrote them: no persistence flag.
+        session = DBSessionStore()
+        session.update(data)
+        session.create()
+        return session.session_key
+
+    def test_keeps_logins_and_cart_owners(self):
+        self.old_engine_session(recently_viewed=[1])
+        cart_owner = self.old_engine_session(recently_viewed=[2])
+        login = self.old_engine_session(**{AUTH_KEY: '1'})
+        expired = self.old_engine_session()
+        Session.objects.filter(session_key=expired).update(expire_date=timezone.now() - timedelta(days=1))
+        Cart.objects.create(session_key=cart_owner)
+
+        call_command('sweep_sessions', batch_size=2, stdout=StringIO())
+
+        self.assertEqual(set(Session.objects.values_list('session_key', flat=True)), {cart_owner, login})
+
+
+class StockEventTests(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name='Dairy', image='categories/dairy.jpg')
+        self.product = Product.objects.create(
+            category=category, name='Curd', description='Set.', price=Decimal('40.00'),
+            image='products/curd.jpg', stock=3,
+        )
+
+    def test_saves_without_subscribers_publish_nothing(self):
+        with mock.patch('shop.events.unit_price') as unit_price, mock.patch('shop.events.publish') as publish, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.product.stock = 2
+            self.product.save()
+        unit_price.assert_not_called()
+        publish.assert_not_called()
+
+    @override_settings(EVENTS_RESYNC_SECONDS=0.01)
+    async def test_subscribers_share_one_resync(self):
+        state = {None: stock_event(None, 2, Decimal('40.00'), Decimal('40.00'))}
+        with mock.patch('shop.events.current_state', return_value=state) as current_state:
+            first, second = events.subscribe(self.product.id), events.subscribe(self.product.id)
+            self.assertEqual([(await first.get(1))[0]['stock'], (await second.get(1))[0]['stock']], [2, 2])
+            events.unsubscribe(first)
+            events.unsubscribe(second)
+            await asyncio.sleep(0.05)
+        self.assertLessEqual(current_state.await_count, 5)
+        self.assertNotIn(self.product.id, events._resyncs)
+
+
+class QueueRefreshTests(TestCase):
+
+    def tearDown(self):
+        caches['default'].clear()
+
+    @override_settings(RECOMMENDATIONS_REFRESH_DELAY=600)
+    def test_changes_collapse_into_one_delayed_job(self):
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(5):
+                queue_refresh()
+        self.assertEqual(sum('INSERT' in query['sql'] for query in queries), 1)
+        job = Job.objects.get(kind='recommendations.refresh')
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=590))
+
+
+class IdentifierTests(TestCase):
+
+    def test_collisions_get_the_first_free_suffix(self):
+        names = ['Fresh Fruit', 'Fresh Fruit', 'Fresh  fruit!', 'Fresh Fruit']
+        Category.objects.create(name='Fresh Fruit Juice', image='categories/juice.jpg')
+        slugs = [Category.objects.create(name=name, image='categories/x.jpg').slug for name in names]
+        self.assertEqual(slugs, ['fresh-fruit', 'fresh-fruit-1', 'fresh-fruit-2', 'fresh-fruit-3'])
+
+    def test_empty_slug_falls_back_to_the_model_name(self):
+        self.assertEqual(allocate_identifier(Category, 'slug', ''), 'category')
+        Category.objects.create(name='!!!', image='categories/x.jpg')
+        self.assertEqual(Category.objects.create(name='???', image='categories/x.jpg').slug, 'category-1')
+
+    def test_retries_when_a_concurrent_writer_takes_the_value(self):
+        Category.objects.create(name='Dairy', image='categories/x.jpg')
+        real = allocate_identifier
+        # The first allocation loses the race: it picks a value already taken.
+        answers = iter([lambda *args, **kwargs: 'dairy', real])
+        with mock.patch('shop.utils.allocate_identifier', side_effect=lambda *a, **k: next(answers)(*a, **k)):
+            category = Category.objects.create(name='Dairy', image='categories/x.jpg')
+        self.assertEqual(category.slug, 'dairy-1')
+
+    def test_other_integrity_errors_are_not_retried(self):
+        def save():
+            raise IntegrityError('NOT NULL constraint failed: shop_category.image')
+
+        with mock.patch('shop.utils.allocate_identifier', wraps=allocate_identifier) as allocate, \
+                self.assertRaises(IntegrityError):
+            save_with_identifier(Category(name='Eggs'), 'slug', 'eggs', save)
+        self.assertEqual(allocate.call_count, 1)
+
+
+class ReviewStatsTests(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name='Greens', image='categories/greens.jpg')
+        self.product = Product.objects.create(
+            category=category, name='Spinach', description='Leafy.', price=Decimal('30.00'),
+            image='products/spinach.jpg',
+        )
+        self.user = User.objects.create(username='reviewer')
+
+    def stats(self):
+        stats = ProductReviewStats.objects.get(product=self.product)
+        return (stats.review_count, stats.rating_sum, [getattr(stats, f'rating_{n}') for n in range(1, 6)],
+                stats.average_rating)
+
+    def test_counts_follow_create_edit_and_delete(self):
+        five, three, four = (
+            Review.objects.create(product=self.product, user=self.user, rating=rating) for rating in (5, 3, 4)
+        )
+        self.assertEqual(self.stats(), (3, 12, [0, 0, 1, 1, 1], 4.0))
+
+        three.rating = 1
+        three.save()
+        self.assertEqual(self.stats(), (3, 10, [1, 0, 0, 1, 1], 10 / 3))
+
+        five.delete()
+        self.assertEqual(self.stats(), (2, 5, [1, 0, 0, 1, 0], 2.5))
+
+        # The running totals match a rebuild from the review table.
+        expected = self.stats()
+        rebuild([self.product.id])
+        self.assertEqual(self.stats(), expected)
+
+        four.delete()
+        three.delete()
+        self.assertEqual(self.stats(), (0, 0, [0] * 5, 0))
+
+
+class ReviewCursorTests(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name='Grains', image='categories/grains.jpg')
+        self.product = Product.objects.create(
+            category=category, name='Oats', description='Rolled.', price=Decimal('80.00'),
+            image='products/oats.jpg',
+        )
+        user = User.objects.create(username='reviewer')
+        start = timezone.now()
+        for i in range(13):
+            review = Review.objects.create(product=self.product, user=user, rating=i % 5 + 1)
+            # Shared timestamps and helpful counts, so the id tie-break matters.
+            Review.objects.filter(pk=review.pk).update(
+                created_at=start - timedelta(hours=i // 3), helpful_count=i % 4
+            )
+
+    def test_pages_cover_every_sort_exactly_once(self):
+        for sort, fields in SORTS.items():
+            ordering = [f'-{field}' if descending else field for field, descending in fields]
+            expected = list(Review.objects.filter(product=self.product).order_by(*ordering).values_list('id', flat=True))
+            seen, cursor = [], None
+            while True:
+                page, cursor = review_page(self.product, sort, cursor, limit=4)
+                seen.extend(review.id for review in page)
+                if cursor is None:
+                    break
+                self.assertEqual(decode_cursor(cursor, sort), decode_cursor(encode_cursor(page[-1], sort), sort))
+            self.assertEqual(seen, expected, sort)
+
+    def test_broken_cursor_starts_over(self):
+        first, _ = review_page(self.product, 'newest', limit=4)
+        for cursor in ('not-base64!', encode_cursor(first[0], 'helpful')):
+            self.assertEqual(review_page(self.product, 'newest', cursor, limit=4)[0], first)
+
+
+class PricingRuleTests(SimpleTestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.product = Product(id=1, category_id=10, price=Decimal('100.00'))
+
+    def rule(self, id, **fields):
+        return PriceRule(id=id, name=f'rule {id}', starts_at=self.now - timedelta(days=1), **fields)
+
+    def quote(self, rules, quantity=1, product=None, promo_code=None):
+        ruleset = RuleSet(rules, self.now)
+        return price_items([Item(product or self.product, None, quantity)], promo_code, ruleset=ruleset)
+
+    def test_best_rule_wins_and_rules_do_not_stack(self):
+        rules = [
+            self.rule(1, percent_off=10),
+            self.rule(2, category_id=10, percent_off=15),
+            self.rule(3, product_id=1, percent_off=5),
+        ]
+        line = self.quote(rules).lines[0]
+        self.assertEqual((line.total, line.rule.id), (Decimal('85.00'), 2))
+
+    def test_rules_for_other_products_and_categories_do_not_apply(self):
+        rules = [self.rule(1, product_id=2, percent_off=50), self.rule(2, category_id=11, percent_off=50)]
+        self.assertEqual(self.quote(rules).total, Decimal('100.00'))
+
+    def test_quantity_tiers(self):
+        rules = [self.rule(1, percent_off=5, min_quantity=3), self.rule(2, percent_off=10, min_quantity=10)]
+        self.assertEqual([self.quote(rules, n).lines[0].discount for n in (2, 3, 10)],
+                         [Decimal('0'), Decimal('15.00'), Decimal('100.00')])
+
+    def test_buy_x_get_y(self):
+        rule = self.rule(1, kind=PriceRule.BUY_X_GET_Y, buy_quantity=2, free_quantity=1)
+        self.assertEqual([self.quote([rule], n).total for n in (2, 3, 7)],
+                         [Decimal('200.00'), Decimal('200.00'), Decimal('500.00')])
+
+    def test_rules_apply_to_the_discount_price(self):
+        product = Product(id=1, category_id=10, price=Decimal('100.00'), discount_price=Decimal('80.00'))
+        quote = self.quote([self.rule(1, percent_off=10)], product=product)
+        self.assertEqual((quote.total, quote.savings), (Decimal('72.00'), Decimal('28.00')))
+
+    def test_promo_code_comes_off_the_subtotal_after_the_rules(self):
+        quote = self.quote([self.rule(1, percent_off=10)], 2, promo_code=PromoCode(discount_percentage=50))
+        self.assertEqual((quote.subtotal, quote.promo_discount, quote.total),
+                         (Decimal('180.00'), Decimal('90.00'), Decimal('90.00')))
+
+    def test_rule_window(self):
+        later = self.rule(1, percent_off=50)
+        later.starts_at = self.now + timedelta(hours=1)
+        ended = self.rule(2, percent_off=40, ends_at=self.now - timedelta(hours=1))
+        ruleset = RuleSet([later, ended], self.now)
+        self.assertEqual(ruleset.best(1, 10, Decimal('100.00'), 1), (Decimal('0.00'), None))
+        self.assertEqual(ruleset.expires_at, later.starts_at)
+
+
+class ImageProcessingTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(MEDIA_ROOT=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        caches['default'].clear()
+
+    def upload(self, name, size=(40, 20), orientation=None):
+        image = Image.new('RGB', size, (200, 120, 40))
+        options = {}
+        if orientation:
+            exif = Image.Exif()
+            exif[0x0112] = orientation
+            options['exif'] = exif.tobytes()
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', **options)
+        return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    def test_normalises_a_copy_and_keeps_the_upload(self):
+        name = self.upload('products/rotated.jpg', orientation=6)
+        with default_storage.open(name, 'rb') as fh:
+            original = fh.read()
+
+        manifest = process_image(name)
+
+        with default_storage.open(name, 'rb') as fh:
+            self.assertEqual(fh.read(), original)
+        source_name = normalize_source(name)
+        self.assertNotEqual(source_name, name)
+        with default_storage.open(source_name, 'rb') as fh:
+            self.assertFalse(Image.open(fh).getexif())
+        self.assertEqual((manifest['width'], manifest['height']), (20, 40))
+        self.assertTrue(default_storage.exists(manifest['renditions']['card']['files']['webp']))
+
+    def test_clean_uploads_render_from_the_original(self):
+        name = self.upload('products/clean.jpg')
+        self.assertEqual(normalize_source(name), name)
+
+    def test_rendition_url_falls_back_until_processed(self):
+        name = self.upload('products/plain.jpg')
+        fieldfile = Product(image=name).image
+        self.assertEqual(rendition_url(fieldfile, 'card'), fieldfile.url)
+        self.assertTrue(Job.objects.filter(kind='images.process', key=name, status='pending').exists())
+
+        process_image(name)
+        self.assertIn('/derivatives/', rendition_url(fieldfile, 'card', 'webp'))
+
+    def test_failed_sources_are_not_queued_again(self):
+        fieldfile = Product(image='products/broken.jpg').image
+        Job.objects.create(kind='images.process', key=fieldfile.name, status='failed', attempts=5)
+        queue_processing(fieldfile)
+        self.assertFalse(Job.objects.filter(status='pending').exists())
+
+
+class RecentlyViewedTests(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name='Fruit', image='categories/fruit.jpg')
+        self.products = [
+            Product.objects.create(
+                category=category, name=name, description='Ripe.', price=Decimal('10.00'),
+                image='products/fruit.jpg', stock=5,
+            )
+            for name in ('Apple', 'Banana', 'Cherry')
+        ]
+        self.user = User.objects.create_user('shopper', password='secret')
+
+    def view(self, product):
+        return self.client.get(reverse('shop:product_detail', args=[product.slug]))
+
+    def recent_ids(self, response):
+        return [entry.id for entry in response.context['recently_viewed']]
+
+    def test_anonymous_list_lives_in_one_session(self):
+        self.view(self.products[0])
+        session_key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        response = self.view(self.products[1])
+        self.assertEqual(self.client.cookies[settings.SESSION_COOKIE_NAME].value, session_key)
+        self.assertEqual(self.recent_ids(response), [self.products[0].pk])
+
+    def test_reading_does_not_create_a_session(self):
+        request = RequestFactory().get('/')
+        request.user = mock.Mock(is_authenticated=False)
+        request.session = SessionStore()
+        self.assertEqual(get_recent(request), [])
+        self.assertIsNone(request.session.session_key)
+        self.assertFalse(request.session.modified)
+
+    def test_list_survives_login(self):
+        self.view(self.products[0])
+        self.view(self.products[1])
+        self.client.login(username='shopper', password='secret')
+        response = self.view(self.products[2])
+        self.assertEqual(self.recent_ids(response), [self.products[1].pk, self.products[0].pk])
+        self.assertNotIn(SESSION_KEY, self.client.session)
+
+        self.client.logout()
+        self.client.login(username='shopper', password='secret')
+        response = self.view(self.products[0])
+        self.assertEqual(self.recent_ids(response), [self.products[2].pk, self.products[1].pk])
+
+
+class ExplainQueriesTests(SimpleTestCase):
+
+    def test_only_search_passes(self):
+        plan = '\n'.join([
+            '2 0 0 SCAN accounts_wishlist',
+            '4 0 0 SCAN shop_product USING INDEX shop_product_newest',
+            '5 0 0 SCAN shop_review USING COVERING INDEX shop_review_newest',
+            '6 0 0 SEARCH shop_cart USING INDEX shop_cart_session (session_key=?)',
+        ])
+        self.assertEqual(
+            ExplainQueries().full_scans(plan, 'sqlite'),
+            ['accounts_wishlist', 'shop_product_newest', 'shop_review_newest'],
+        )
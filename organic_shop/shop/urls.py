@@ -1,10 +1,13 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 from django.conf import settings
 from django.conf.urls.static import static
 
 app_name = 'shop'
 
+# JSON endpoints have native async versions for ASGI deployments.
+json_views = async_views if getattr(settings, 'ASYNC_VIEWS', False) else views
+
 urlpatterns = [
     path('', views.index, name='index'),
     path('category/<slug:slug>/', views.category_detail, name='category_detail'),
@@ -12,12 +15,15 @@ urlpatterns = [
     path('cart/', views.cart_detail, name='cart_detail'),
     path('cart/add/<int:product_id>/', views.cart_add, name='cart_add'),
     path('cart/remove/<int:item_id>/', views.cart_remove, name='cart_remove'),
-    path('get-matching-variant/', views.get_matching_variant, name='get_matching_variant'),  
+    path('get-matching-variant/', json_views.get_matching_variant, name='get_matching_variant'),  
     path('cart/update/<int:item_id>/', views.update_cart_item, name='update_cart_item'),
-    path('ajax/search/', views.ajax_search, name='ajax_search'),
+    path('ajax/search/', json_views.ajax_search, name='ajax_search'),
     path('remove-from-cart/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
-    path('cart/update-ajax/', views.update_cart_item_ajax, name='update_cart_item_ajax'),
+    path('cart/update-ajax/', json_views.update_cart_item_ajax, name='update_cart_item_ajax'),
     path('buy-now/<int:product_id>/', views.buy_now, name='buy_now'),
+    path('product/<int:product_id>/reviews/', views.product_reviews, name='product_reviews'),
+    path('reviews/<int:review_id>/helpful/', views.review_helpful, name='review_helpful'),
+    path('product/<int:product_id>/events/', json_views.product_events, name='product_events'),
  
 ]
 if settings.DEBUG:
@@ -0,0 +1,63 @@
+import re
+
+from django.db import IntegrityError, transaction
+
+
+def allocate_identifier(model, field, base, exclude_pk=None, separator='-'):
+    """
+    Returns the first free value of `field` for `base`, trying
+    base, base-1, base-2, ...
+
+    All values sharing the prefix are fetched with a single query and the
+    free suffix is picked in memory, instead of probing one suffix per query.
+    An empty `base` (a name slugify() drops entirely) falls back to the
+    model name, so the prefix never matches the whole table.
+    """
+    base = base or model._meta.model_name
+    max_length = model._meta.get_field(field).max_length
+    if max_length:
+        base = base[:max_length]
+
+    taken = model._default_manager.filter(**{f'{field}__startswith': base})
+    if exclude_pk is not None:
+        taken = taken.exclude(pk=exclude_pk)
+    taken = set(taken.values_list(field, flat=True))
+
+    if base not in taken:
+        return base
+
+    pattern = re.compile(rf'^{re.escape(base)}{re.escape(separator)}(\d+)$')
+    used = {int(match.group(1)) for match in map(pattern.match, taken) if match}
+
+    counter = 1
+    while counter in used:
+        counter += 1
+
+    suffix = f'{separator}{counter}'
+    if max_length and len(base) + len(suffix) > max_length:
+        # Trimming the base changes the prefix, so look the range up again.
+        return allocate_identifier(model, field, base[:max_length - len(suffix)], exclude_pk, separator)
+    return base + suffix
+
+
+def save_with_identifier(instance, field, base, save, attempts=5):
+    """
+    Assigns a free identifier to `instance.<field>` and runs `save()`.
+
+    Rather than trusting the pre-check, the unique constraint is the arbiter:
+    if a concurrent writer grabs the same value first the INSERT/UPDATE fails
+    with IntegrityError inside a savepoint and a fresh value is allocated.
+    Any other IntegrityError (a foreign key, NOT NULL, another unique
+    field) is raised straight away.
+    """
+    model = type(instance)
+    for attempt in range(attempts):
+        value = allocate_identifier(model, field, base, exclude_pk=instance.pk)
+        setattr(instance, field, value)
+        try:
+            with transaction.atomic():
+                return save()
+        except IntegrityError:
+            taken = model._default_manager.filter(**{field: value}).exclude(pk=instance.pk).exists()
+            if not taken or attempt == attempts - 1:
+                raise
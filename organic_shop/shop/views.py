@@ -4,76 +4,63 @@ from django.views.decorators.http import require_POST
 from .forms import CartAddProductForm,ReviewForm
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
-from django.db.models import Avg,Subquery, OuterRef,F,Prefetch,Count
+from django.db.models import Subquery, OuterRef,F,Prefetch,Count
 from django.db.models.functions import Coalesce
 from accounts.models import Wishlist
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.contrib import messages
+from .images import rendition_url
+from .routers import read_only_view
+from .recently_viewed import record_view
+from .reviews import DEFAULT_SORT as DEFAULT_REVIEW_SORT, SORTS as REVIEW_SORTS, page_url as review_page_url, review_page
+from .caching import cached
+from .cards import prepare_cards
+from .invalidation import make_key, products_changed
+from .pricing import Item, price_items, unit_price
+from .product_page import get_payload
+from .sessions import mark_persistent
+from django.conf import settings
 import json
 
-def index(request):
-    categories = Category.objects.filter(is_active=True)
-    default_variant_prefetch = Prefetch(
-        'variants',
-        queryset=ProductVariant.objects.order_by('-stock'),
-        to_attr='default_variant_list' 
-    )    
-    featured_products = Product.objects.filter(
-        available=True, is_featured=True, category__is_active=True
-    ).prefetch_related(default_variant_prefetch)[:8]
-
-    best_selling = Product.objects.filter(
-        available=True, category__is_active=True
-    ).order_by('-sold_count').prefetch_related(default_variant_prefetch)[:10]
-
-    just_arrived = Product.objects.filter(
-        available=True, category__is_active=True
-    ).order_by('-created_at').prefetch_related(default_variant_prefetch)[:10]
-
-    most_popular = Product.objects.filter(
-        available=True, category__is_active=True
-    ).order_by('-views').prefetch_related(default_variant_prefetch)[:8]
+HOME_RAILS_TIMEOUT = 5 * 60
+
+
+@cached('home-rails', getattr(settings, 'HOME_RAILS_CACHE_TIMEOUT', HOME_RAILS_TIMEOUT),
+        key=lambda: make_key('home-rails', depends_on=['catalog', 'pricing-rules']))
+def home_rails():
+    """
+    The home page's categories and product shelves, the same for every
+    visitor. Rebuilt when the catalog or the price rules change, or the
+    timeout passes (a rule's start or end time, for one).
+    """
+    listed = Product.objects.filter(available=True, category_active=True).prefetch_related(
+        Prefetch('variants', queryset=ProductVariant.objects.order_by('-stock'))
+    )
+    return {
+        'categories': list(Category.objects.filter(is_active=True)),
+        'featured_products': prepare_cards(listed.filter(is_featured=True)[:8]),
+        'best_selling': prepare_cards(listed.order_by('-sold_count')[:10]),
+        'just_arrived': prepare_cards(listed.order_by('-created_at')[:10]),
+        'most_popular': prepare_cards(listed.order_by('-views')[:8]),
+    }
 
-   
-    product_lists = [featured_products, best_selling, just_arrived, most_popular]
-    for product_list in product_lists:
-        for product in product_list:
-            product.default_variant = product.default_variant_list[0] if product.default_variant_list else None
 
+def index(request):
     wishlist_items = []
     if request.user.is_authenticated:
         wishlist_items = Wishlist.objects.filter(user=request.user).values_list('product_id', flat=True)
 
     context = {
-        'categories': categories,
-        'featured_products': featured_products,
-        'best_selling': best_selling,
-        'just_arrived': just_arrived,
-        'most_popular': most_popular,
+        **home_rails(),
         'wishlist_items': wishlist_items,
     }
     return render(request, 'shop/index.html', context)
 
 
 def product_detail(request, slug):
-    product = get_object_or_404(
-        Product.objects.annotate(
-            average_rating=Avg('reviews__rating')
-        ).prefetch_related(
-           
-            Prefetch(
-                'variants',
-                queryset=ProductVariant.objects.order_by('-stock').prefetch_related('values__option')
-            ),
-            'images', 
-            Prefetch(
-                'reviews',
-                queryset=Review.objects.order_by('-created_at').select_related('user')
-            )
-        ),
-        slug=slug,
-        available=True
-    )
+    # Shared with every visitor and cached per product version.
+    page = get_payload(slug)
+    product = page['product']
     if request.method == 'POST' and request.user.is_authenticated:
         review_form = ReviewForm(request.POST)
         if review_form.is_valid():
@@ -86,80 +73,96 @@ def product_detail(request, slug):
     else:
         review_form = ReviewForm()
 
-    all_product_variants = list(product.variants.all())
-    default_variant = all_product_variants[0] if all_product_variants else None
-    reviews = list(product.reviews.all())
-    average_rating = product.average_rating or 0
-    product.views = F('views') + 1
-    product.save(update_fields=['views'])
-    product.refresh_from_db(fields=['views'])
-    cart_product_form = CartAddProductForm()
-
-    # SIMILAR PRODUCTS
-    default_variant_prefetch = Prefetch(
-        'variants',
-        queryset=ProductVariant.objects.order_by('-stock'),
-        to_attr='default_variant_list'
-    )
-    similar_products = Product.objects.filter(
-        category=product.category
-    ).exclude(id=product.id).prefetch_related(default_variant_prefetch)[:4]
-
-    similar_variants = []
-    for sp in similar_products:
-        if sp.default_variant_list:
-            similar_variants.append(sp.default_variant_list[0])
-
     # RECENTLY VIEWED
-    recently_viewed_variant_ids = request.session.get('recently_viewed_variants', [])
-    if default_variant and default_variant.id in recently_viewed_variant_ids:
-        recently_viewed_variant_ids.remove(default_variant.id)
-    if default_variant:
-        recently_viewed_variant_ids.insert(0, default_variant.id)
-    request.session['recently_viewed_variants'] = recently_viewed_variant_ids[:5]
-
-    recently_viewed_queryset = ProductVariant.objects.select_related('product').filter(
-        id__in=recently_viewed_variant_ids
-    ).exclude(id=default_variant.id if default_variant else None)
-
-    recently_viewed = sorted(
-        recently_viewed_queryset,
-        key=lambda x: recently_viewed_variant_ids.index(x.id)
-    )
+    recently_viewed = record_view(request, product, page['default_variant'])[1:]
 
-    # VARIANT MAP & JSON
-    option_map = {}
-    for variant in all_product_variants:
-        for value in variant.values.all():
-            option_name = value.option.name
-            if option_name not in option_map:
-                option_map[option_name] = set()
-            option_map[option_name].add(value.value)
-    for key in option_map:
-        option_map[key] = sorted(list(option_map[key]))
-
-    variant_data = [{
-        'values': [v.value.lower() for v in variant.values.all()],
-        'stock': variant.stock
-    } for variant in all_product_variants]
+    # Counted last: the write pins the rest of the request to the primary
+    # database, so every read above can still be served by a replica. Not
+    # reported to shop.invalidation: the most viewed shelf catches up when
+    # home_rails times out.
+    Product.objects.filter(pk=product.pk).update(views=F('views') + 1)
 
     context = {
-        'product': product,
-        'default_variant': default_variant,
-        'reviews': reviews,
-        'average_rating': average_rating,
-        'similar_variants': similar_variants,
-        'variant_options': option_map,
-        'variant_data_json': json.dumps(variant_data),
-        'cart_product_form': cart_product_form,
+        **page,
+        'average_rating': page['review_stats'].average_rating,
+        'review_sorts': REVIEW_SORT_LABELS,
+        'cart_product_form': CartAddProductForm(),
         'review_form': review_form,
-        'recently_viewed_variants': recently_viewed,
+        'recently_viewed': recently_viewed,
     }
     return render(request, 'shop/product_detail.html', context)
 
 
+REVIEW_SORT_LABELS = [
+    ('newest', 'Newest'),
+    ('helpful', 'Most helpful'),
+    ('rating_high', 'Highest rating'),
+    ('rating_low', 'Lowest rating'),
+]
+
+
+@read_only_view
+def product_reviews(request, product_id):
+    """
+    A page of reviews after the `after` cursor, as an HTML fragment for the
+    product page or, with ?format=json, as JSON.
+    """
+    product = get_object_or_404(Product, id=product_id, available=True)
+    sort = request.GET.get('sort', DEFAULT_REVIEW_SORT)
+    if sort not in REVIEW_SORTS:
+        sort = DEFAULT_REVIEW_SORT
+    reviews, cursor = review_page(product, sort, request.GET.get('after'))
+    next_url = review_page_url(product, sort, cursor)
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'reviews': [{
+                'id': review.id,
+                'user': review.user.username,
+                'rating': review.rating,
+                'comment': review.comment,
+                'helpful_count': review.helpful_count,
+                'created_at': review.created_at.isoformat(),
+            } for review in reviews],
+            'next': next_url or None,
+        })
+    return render(request, 'shop/partials/review_list.html', {
+        'reviews': reviews,
+        'next_reviews_url': next_url,
+    })
+
+
+@require_POST
+@login_required
+def review_helpful(request, review_id):
+    review = get_object_or_404(Review, id=review_id)
+    voted = request.session.get('helpful_reviews', [])
+    if review.id not in voted:
+        Review.objects.filter(id=review.id).update(helpful_count=F('helpful_count') + 1)
+        request.session['helpful_reviews'] = voted + [review.id]
+        review.helpful_count += 1
+        products_changed(review.product_id)
+    return JsonResponse({'helpful_count': review.helpful_count})
+
+
 def category_detail(request, slug):
     category = get_object_or_404(Category, slug=slug, is_active=True)
+    products = prepare_cards(category_products(category, request.GET.get('sort')))
+
+    wishlist_items = []
+    if request.user.is_authenticated:
+        wishlist_items = Wishlist.objects.filter(user=request.user).values_list('product_id', flat=True)
+
+    context = {
+        'category': category,
+        'products': products,
+        'wishlist_items': wishlist_items,
+    }
+    return render(request, 'shop/category_detail.html', context)
+
+
+def category_products(category, sort=None):
+    """A category's listing in the shopper's chosen order."""
     products = Product.objects.filter(category=category, available=True)
 
     
@@ -173,10 +176,8 @@ def category_detail(request, slug):
    
     products = products.annotate(
         sorting_price=Subquery(effective_price_subquery),
-        avg_rating=Avg('reviews__rating')
-    ).prefetch_related('variants')
+    ).prefetch_related(Prefetch('variants', queryset=ProductVariant.objects.order_by('-stock')))
 
-    sort = request.GET.get('sort')
    
     if sort == 'price_asc':
         products = products.order_by('sorting_price')
@@ -187,23 +188,11 @@ def category_detail(request, slug):
         products = products.order_by('-created_at')
     elif sort == 'rating':
     
-        products = products.order_by(F('avg_rating').desc(nulls_last=True))
-
-    for product in products:
-    
-        all_variants = sorted(product.variants.all(), key=lambda v: v.stock, reverse=True)
-        product.default_variant = all_variants[0] if all_variants else None
-
-    wishlist_items = []
-    if request.user.is_authenticated:
-        wishlist_items = Wishlist.objects.filter(user=request.user).values_list('product_id', flat=True)
-
-    context = {
-        'category': category,
-        'products': products,
-        'wishlist_items': wishlist_items,
-    }
-    return render(request, 'shop/category_detail.html', context)
+        products = products.order_by(
+            F('review_stats__average_rating').desc(nulls_last=True),
+            F('review_stats__review_count').desc(nulls_last=True),
+        )
+    return products
 
 
 @login_required(login_url='accounts:login')
@@ -251,11 +240,22 @@ def cart_remove(request, item_id):
     return redirect('shop:cart_detail')
 
 def cart_detail(request):
-    cart = get_or_create_cart(request)
-    
+    if request.user.is_authenticated:
+        cart = get_or_create_cart(request)
+    else:
+        # Looking at an empty cart should not create a session and a Cart row.
+        cart = get_session_cart(request)
+
     return render(request, 'shop/cart_detail.html', {'cart': cart})
 
 
+def get_session_cart(request):
+    session_key = request.session.session_key
+    if not session_key:
+        return None
+    return Cart.objects.filter(session_key=session_key, user=None).first()
+
+
 def get_or_create_cart(request):
     if request.user.is_authenticated:
         
@@ -266,26 +266,42 @@ def get_or_create_cart(request):
             request.session.create()
         session_key = request.session.session_key
         cart, _ = Cart.objects.get_or_create(session_key=session_key, user=None)
+        # The cart outlives a cache flush only if its session does.
+        mark_persistent(request.session)
     return cart
 
 def checkout(request):
     return render(request, 'accounts/checkout.html')
 
+
+NO_IMAGE_URL = '/static/images/no-image.jpg'
+
+
 def ajax_search(request):
     query = request.GET.get('q', '')
     results = []
     if query:
-        products = Product.objects.filter(name__icontains=query, available=True)
-        for product in products:
-            results.append({
-                'name': product.name,
-                'price': str(product.price),
-                'image_url': product.image.url if product.image else '/static/images/no-image.jpg',
-                'detail_url': product.get_absolute_url(),  
-            })
+        products = list(search_products(query))
+        quote = price_items([Item(product, None, 1) for product in products])
+        for product, line in zip(products, quote.lines):
+            image_url = rendition_url(product.image, 'card') if product.image else NO_IMAGE_URL
+            results.append(search_result(product, image_url, line.total))
     return JsonResponse({'results': results})
 
 
+def search_products(query):
+    return Product.objects.filter(name__icontains=query, available=True, category_active=True)
+
+
+def search_result(product, image_url, price):
+    return {
+        'name': product.name,
+        'price': str(price),
+        'image_url': image_url,
+        'detail_url': product.get_absolute_url(),
+    }
+
+
 @login_required
 def remove_from_cart(request, item_id):
     item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
@@ -375,6 +391,7 @@ def buy_now(request, product_id):
         return redirect('shop:product_detail', slug=product.slug)
 
 
+@read_only_view
 @require_POST
 def get_matching_variant(request):
     try:
@@ -383,59 +400,72 @@ def get_matching_variant(request):
         selected_values = data.get("selected_values", [])
         product = get_object_or_404(Product, id=product_id)
 
-       
         if not product.variants.exists():
-            
-            base_price = float(product.price)
-            discount_price = float(product.discount_price) if product.discount_price else None
-
-            return JsonResponse({
-                "success": True,
-                "sku": None, 
-                "price": f"{base_price:.2f}",
-                "discount_price": f"{discount_price:.2f}" if discount_price else None,
-                "stock": product.stock,
-                "image": product.image.url if product.image else "",
-                "variant_id": None, 
-                "is_variant_product": False,
-            })
-
-        
-        variant = None
-        if not selected_values:
-            
-            variant = product.variants.order_by('-stock').first()
-        else:
-        
-            num_selected = len(selected_values)
-            variant = ProductVariant.objects.filter(
-                product_id=product_id,
-                values__value__in=selected_values
-            ).annotate(
-                value_count=Count('values')
-            ).filter(
-                value_count=num_selected
-            ).first()
+            return JsonResponse(
+                product_payload(product, rendition_url(product.image, 'detail'), unit_price(product))
+            )
 
+        variant = matching_variants(product, selected_values).first()
         if not variant:
             return JsonResponse({"success": False, "message": "This combination is not available."})
 
-       
-        base_price = float(variant.price)
-        discount_price = float(variant.discount_price) if variant.discount_price else None
-        
-        image_url = variant.image.url if variant.image else (product.image.url if product.image else "")
-
-        return JsonResponse({
-            "success": True,
-            "sku": variant.sku,
-            "price": f"{base_price:.2f}",
-            "discount_price": f"{discount_price:.2f}" if discount_price else None,
-            "stock": variant.stock,
-            "image": image_url,
-            "variant_id": variant.id,
-            "is_variant_product": True,
-        })
+        image_url = rendition_url(variant.image, 'detail') or rendition_url(product.image, 'detail')
+        return JsonResponse(variant_payload(variant, image_url, unit_price(product, variant)))
 
     except Exception as e:
-        return JsonResponse({"success": False, "message": "An unexpected error occurred."})
\ No newline at end of file
+        return JsonResponse({"success": False, "message": "An unexpected error occurred."})
+
+
+def product_events(request, product_id):
+    """
+    Live stock updates need ASGI. 204 tells the browser's EventSource not to
+    reconnect; pages keep the stock they were rendered with.
+    """
+    return HttpResponse(status=204)
+
+
+def matching_variants(product, selected_values):
+    """Variants carrying exactly the selected values; the best stocked first when none are selected."""
+    if not selected_values:
+        return product.variants.order_by('-stock')
+    return ProductVariant.objects.filter(
+        product_id=product.id,
+        values__value__in=selected_values
+    ).annotate(
+        value_count=Count('values')
+    ).filter(
+        value_count=len(selected_values)
+    )
+
+
+def _discounted(original, price):
+    """The rule-aware unit `price` if it is below `original`, for the payloads' discount_price."""
+    return f"{price:.2f}" if price < original else None
+
+
+def product_payload(product, image_url, price):
+    """`price` is one unit as `shop.pricing.unit_price` charges it."""
+    return {
+        "success": True,
+        "sku": None,
+        "price": f"{product.price:.2f}",
+        "discount_price": _discounted(product.price, price),
+        "stock": product.stock,
+        "image": image_url,
+        "variant_id": None,
+        "is_variant_product": False,
+    }
+
+
+def variant_payload(variant, image_url, price):
+    """`price` is one unit as `shop.pricing.unit_price` charges it."""
+    return {
+        "success": True,
+        "sku": variant.sku,
+        "price": f"{variant.price:.2f}",
+        "discount_price": _discounted(variant.price, price),
+        "stock": variant.stock,
+        "image": image_url,
+        "variant_id": variant.id,
+        "is_variant_product": True,
+    }
@@ -0,0 +1,116 @@
+"""
+Cache warm-up for freshly started workers.
+
+`warm` fills what the first requests after a deploy would otherwise build
+one by one: the URLconf (and so every view module), the compiled
+templates, the price rules, the promo codes, the home page rails and the
+product pages (with their variant lookup tables) of the best sellers.
+
+Run it with `manage.py warm_caches` after a deploy, or set
+WARM_CACHES_ON_STARTUP to have each server process warm itself as soon as
+the WSGI/ASGI application is built (not in AppConfig.ready, where Django
+warns against queries). Under gunicorn's preload_app that happens once in
+the master and the forked workers inherit the result; the database
+connections are closed afterwards so no worker shares them.
+"""
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOP = 20
+
+
+def _count_patterns(patterns):
+    return sum(_count_patterns(p.url_patterns) if hasattr(p, 'url_patterns') else 1 for p in patterns)
+
+
+def _urls():
+    from django.urls import get_resolver
+
+    return f'{_count_patterns(get_resolver().url_patterns)} routes'
+
+
+def _templates():
+    from django.template.loader import get_template
+    from django.template.utils import get_app_template_dirs
+
+    count = 0
+    for directory in get_app_template_dirs('templates'):
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.endswith('.html'):
+                    get_template(os.path.relpath(os.path.join(root, name), directory))
+                    count += 1
+    return f'{count} templates'
+
+
+def _price_rules():
+    from .pricing import load
+
+    ruleset = load()
+    return f'{len(ruleset.storewide) + len(ruleset.by_product) + len(ruleset.by_category)} rule groups'
+
+
+def _promo_codes():
+    from accounts.promotions import active_promo_codes
+
+    return f'{len(active_promo_codes())} codes'
+
+
+def _home_rails():
+    from .views import home_rails
+
+    rails = home_rails()
+    return f"{sum(len(rails[name]) for name in rails if name != 'categories')} products"
+
+
+def _product_pages(top):
+    from .models import Product
+    from .product_page import get_payload
+
+    slugs = (
+        Product.objects.filter(available=True, category_active=True)
+        .order_by('-sold_count').values_list('slug', flat=True)[:top]
+    )
+    for slug in slugs:
+        get_payload(slug)
+    return f'{len(slugs)} pages'
+
+
+def warm(top=DEFAULT_TOP):
+    """Runs every step and returns [(step, seconds, detail)]."""
+    steps = [
+        ('urls', _urls),
+        ('templates', _templates),
+        ('price rules', _price_rules),
+        ('promo codes', _promo_codes),
+        ('home rails', _home_rails),
+        ('product pages', lambda: _product_pages(top)),
+    ]
+    report = []
+    for name, step in steps:
+        started = time.perf_counter()
+        detail = step()
+        report.append((name, time.perf_counter() - started, detail))
+    return report
+
+
+def warm_on_startup():
+    """`warm` for server startup, if enabled: never fails, leaves no open connections."""
+    if not getattr(settings, 'WARM_CACHES_ON_STARTUP', False):
+        return
+    try:
+        report = warm(getattr(settings, 'WARM_CACHES_TOP', DEFAULT_TOP))
+    except Exception:
+        # Not migrated yet, the database is down, a broken template...: the
+        # server starts anyway and requests fill the caches (or show the error).
+        logger.exception("Cache warm-up failed")
+    else:
+        logger.info("Caches warmed in %.0f ms", sum(seconds for _, seconds, _ in report) * 1000)
+    finally:
+        connections.close_all()